@@ -4,6 +4,7 @@ from urllib.parse import urlparse
 from app import db
 from app.models import User
 from app.forms import RegistrationForm, LoginForm, ChangePasswordForm, ChangeKeyForm
+from app.services.key_registry import key_registry
 from . import bp
 
 @bp.route('/register', methods=['GET', 'POST'])
@@ -95,10 +96,12 @@ def change_password():
 def change_key():
     form = ChangeKeyForm()
     if form.validate_on_submit():
+        old_public_key = current_user.public_key
         if not current_user.set_private_key(form.private_key.data):
             flash('Private key không hợp lệ!', 'danger')
         else:
             db.session.commit()
+            key_registry.invalidate(old_public_key)
             flash('Đổi khóa thành công!', 'success')
             return redirect(url_for('main.index'))
     return render_template('auth/change_key.html', title='Đổi khóa', form=form)
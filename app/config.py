@@ -1,3 +1,4 @@
+import os
 from datetime import timedelta
 
 class Config:
@@ -6,6 +7,59 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     PERMANENT_SESSION_LIFETIME = timedelta(minutes=60)
     SESSION_COOKIE_NAME = 'default_session'  # Default session cookie name
+    CRYPTO_WORKERS = os.cpu_count() or 1  # Number of workers for parallel chunk encryption
+    CRYPTO_EXECUTOR = 'thread'  # 'thread' or 'process'
+    COMPRESSION_CODEC = 'auto'  # 'auto', 'store', 'zlib', 'zlib-1', 'zlib-6', 'zlib-9', 'bz2', 'lzma'
+    COMPRESSION_TARGET = 'throughput'  # Goal of auto mode: 'throughput' or 'ratio'
+    RSA_KEY_POOL_SIZE = 8  # Number of pre-generated RSA keypairs kept ready
+    RSA_KEY_POOL_WORKERS = 1  # Background workers refilling the pool
+    RSA_KEY_POOL_EXECUTOR = 'process'  # 'process' or 'thread'
+    PUBLIC_KEY_CACHE_SIZE = 1024  # Parsed public keys kept in the LRU key registry
+    CRYPTO_BACKEND = 'auto'  # 'auto' (benchmark at first use), 'pycryptodome' or 'openssl'
+    DEDUP_ENABLED = True  # Offer a content digest so the server can skip files it already holds
+    DELTA_ENABLED = True  # Send only changed blocks when the server holds an older copy
+    DELTA_MIN_SIZE = 64 * 1024  # Smaller files are always sent whole
+    SERVER_OFFLOAD_EXECUTOR = 'thread'  # Where the server verifies/decrypts: 'thread', 'process' or 'inline'
+    SERVER_OFFLOAD_WORKERS = os.cpu_count() or 1  # Workers for server-side verify/decrypt
+    SERVER_OFFLOAD_MAX_PENDING = 32  # Jobs handed to the offload pool at once; further jobs wait
+    LOOP_LAG_INTERVAL = 0.1  # Seconds between event loop lag probes
+    LOOP_LAG_WARN = 0.25  # Log a warning when the event loop is blocked this long (seconds)
+    WS_MAX_MESSAGE_SIZE = 4 * 1024 * 1024  # Largest websocket message the server accepts (bytes)
+    TRANSFER_CREDIT_WINDOW = 8  # Chunks a sender may have in flight before the server grants more
+    RESUME_ENABLED = True  # Journal partial uploads so a dropped connection can resume them
+    RESUME_TTL = 24 * 3600  # Seconds an idle partial upload is kept before it is garbage-collected
+    RESUME_CHECKPOINT_INTERVAL = 4  # Chunks between journal checkpoints
+    RESUME_JOURNAL_KEY = os.environ.get('RESUME_JOURNAL_KEY')  # Secret that wraps session keys in the resume journal (falls back to SECRET_KEY)
+    RESUME_ATTEMPTS = 3  # Reconnect-and-resume attempts made by the client after a dropped connection
+    RESUME_RETRY_DELAY = 1.0  # Seconds before the first resume attempt (doubles each attempt)
+    SERVER_MAX_CONNECTIONS = 256  # Open websocket connections served at once; further connections queue
+    SERVER_MAX_TRANSFERS = 16  # Files being received at once; further transfers queue
+    SERVER_MAX_BUFFERED_BYTES = 64 * 1024 * 1024  # Ciphertext held in memory awaiting decrypt across all clients
+    ADMISSION_TIMEOUT = 30.0  # Seconds a queued connection/transfer/chunk waits before the client is told 'busy'
+    BUSY_RETRY_AFTER = 5.0  # retry_after (seconds) suggested to clients in a 'busy' reply
+    BUSY_RETRY_ATTEMPTS = 3  # Times the client retries after a 'busy' reply
+    SERVER_WORKERS = os.cpu_count() or 1  # Worker processes started by the server_cluster launcher
+    SERVER_SHUTDOWN_GRACE = 30.0  # Seconds a stopping server waits for in-flight transfers before closing connections
+    MUX_MAX_STREAMS = 8  # Transfers one multiplexed connection may have open at once (client pipelines up to this)
+    WS_SERVER_URI = 'ws://localhost:8765'  # Websocket server the Flask app sends files to
+    CLIENT_POOL_SIZE = 4  # Warm, already-keyed connections the Flask app keeps to the websocket server
+    CLIENT_POOL_IDLE_TIMEOUT = 300.0  # Seconds an unused pooled connection is kept before it is closed
+    CLIENT_POOL_PING_AFTER = 5.0  # Pooled connections idle longer than this are pinged before reuse (seconds)
+    CLIENT_POOL_PING_TIMEOUT = 2.0  # Seconds to wait for that pong before the connection is replaced
+    CLIENT_POOL_SEND_TIMEOUT = 600.0  # Seconds a queued send job may run before it is marked failed
+    SEND_JOB_WORKERS = 4  # Queued /send_file jobs processed at once
+    SEND_JOB_MAX_QUEUED = 256  # Jobs allowed to wait in the queue; further /send_file requests are refused
+    SEND_JOB_RETENTION = 3600.0  # Seconds a finished job stays queryable at /api/send_jobs/<id>
+    MAX_CONTENT_LENGTH = 1024 * 1024 * 1024  # Largest request body Flask accepts, and largest file /uploads accepts (bytes)
+    UPLOAD_DIR = 'uploads'  # Where /upload_file and resumable /uploads store files before they are sent
+    UPLOAD_TTL = 24 * 3600  # Seconds an unfinished resumable upload is kept without progress
+    RECEIVED_LIST_PAGE_SIZE = 100  # Files per page of /list_received_files when a cursor is given without a limit
+    RECEIVED_LIST_MAX_PAGE_SIZE = 1000  # Largest limit a /list_received_files request may ask for
+    BATCH_CONCURRENCY = 4  # Files the batch sender CLI sends at once (one pooled session each)
+    BATCH_RETRY_ATTEMPTS = 4  # Attempts per file in a batch before it is reported as failed
+    BATCH_RETRY_BASE_DELAY = 0.5  # Seconds of backoff before the first batch retry (doubles each attempt, with jitter)
+    BATCH_RETRY_MAX_DELAY = 30.0  # Upper bound on the backoff between batch retries (seconds)
+    WS_METRICS_PORT = 9108  # HTTP port for /metrics when the websocket server runs standalone (None disables)
 
 class SenderConfig(Config):
     SESSION_COOKIE_NAME = 'sender_session'
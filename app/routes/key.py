@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from app.models import User, db
 from flask_login import login_required, current_user
+from app.services.key_registry import key_registry
 
 key_bp = Blueprint('key', __name__)
 
@@ -24,6 +25,8 @@ def update_public_key():
     new_public_key = data.get('public_key')
     if not new_public_key:
         return jsonify({'status': 'error', 'message': 'Thiếu public_key'}), 400
+    old_public_key = current_user.public_key
     current_user.public_key = new_public_key
     db.session.commit()
+    key_registry.invalidate(old_public_key)
     return jsonify({'status': 'success', 'message': 'Cập nhật public key thành công'})
@@ -1,11 +1,19 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, redirect, url_for, flash
+from flask import Blueprint, Response, render_template, request, jsonify, send_file, redirect, url_for, flash
 import os
+import json
 import asyncio
+import hashlib
 import threading
 from pathlib import Path
 from flask_login import login_required, current_user
-from app.services.websocket_server import start_secure_server
-from app.services.websocket_client import SecureFileClient
+from app.services.websocket_server import start_secure_server, get_active_server
+from app.services.send_jobs import get_send_job_queue, JobQueueFull
+from app.services.upload_store import (get_upload_store, parse_metadata, UploadError, UploadNotFound,
+                                       UploadConflict, UploadTooLarge)
+from app.services.key_registry import key_registry
+from app.services.received_index import get_received_files_index
+from app.config import Config
+from app.services.metrics import CONTENT_TYPE, registry as metrics_registry
 from app.models import db, User, FileHistory, UserSession
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
@@ -48,8 +56,10 @@ def register_key():
             )
             # Lưu public key vào user
             user = User.query.get(current_user.id)
+            old_public_key = user.public_key
             user.public_key = public_pem.decode()
             db.session.commit()
+            key_registry.invalidate(old_public_key)
             flash('Đăng ký khóa thành công!', 'success')
             return redirect(url_for('main.index'))
         except Exception as e:
@@ -89,6 +99,22 @@ def start_server():
             'message': f'Lỗi khởi chạy server: {str(e)}'
         })
 
+@main.route('/api/server_stats')
+def server_stats():
+    """Thống kê WebSocket server: độ trễ event loop, executor xác minh/giải mã, dedup"""
+    server = get_active_server()
+    if server is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'WebSocket server chưa chạy'
+        })
+    return jsonify({'status': 'success', 'stats': server.stats()})
+
+@main.route('/metrics')
+def metrics():
+    """Metric của process (transfer, các bước mã hóa, kết nối) theo định dạng text của Prometheus"""
+    return Response(metrics_registry.render(), content_type=CONTENT_TYPE)
+
 @main.route('/upload_file', methods=['POST'])
 def upload_file():
     """Upload file tài chính lên server"""
@@ -106,26 +132,133 @@ def upload_file():
                 'message': 'Tên file không hợp lệ'
             })
         
-        # Tạo thư mục upload nếu chưa có
-        upload_dir = Path('uploads')
-        upload_dir.mkdir(exist_ok=True)
-        
-        # Lưu file upload
-        file_path = upload_dir / file.filename
-        file.save(str(file_path))
+        # Lưu qua kho upload: thư mục riêng cho mỗi upload (không ghi đè file trùng tên), hash SHA-512 khi ghi
+        store = get_upload_store()
+        file.stream.seek(0, os.SEEK_END)
+        length = file.stream.tell()
+        file.stream.seek(0)
+        upload = store.create(length, file.filename)
+        if upload['path'] is None:
+            upload = store.write(upload['id'], 0, file.stream)
         
         return jsonify({
             'status': 'success',
             'message': f'File {file.filename} đã được upload thành công',
-            'file_path': str(file_path)
+            'file_path': upload['path'],
+            'sha512': upload['sha512']
         })
         
+    except UploadError as e:
+        return upload_error(e)
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': f'Lỗi upload file: {str(e)}'
         })
 
+# Upload nhiều lần theo giao thức tus 1.0 (core, creation, termination)
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,termination'
+
+def upload_error(e):
+    """Chuyển lỗi upload thành response JSON với mã HTTP tương ứng"""
+    if isinstance(e, UploadNotFound):
+        code = 404
+    elif isinstance(e, UploadConflict):
+        code = 409
+    elif isinstance(e, UploadTooLarge):
+        code = 413
+    else:
+        code = 400
+    response = jsonify({'status': 'error', 'message': str(e)})
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    return response, code
+
+def upload_headers(upload):
+    """Header tus mô tả trạng thái upload (kèm digest khi đã hoàn tất)"""
+    headers = {
+        'Tus-Resumable': TUS_VERSION,
+        'Upload-Offset': str(upload['offset']),
+        'Upload-Length': str(upload['length']),
+        'Cache-Control': 'no-store'
+    }
+    if upload['sha512']:
+        headers['Upload-Sha512'] = upload['sha512']
+    return headers
+
+@main.route('/uploads', methods=['OPTIONS'])
+def upload_options():
+    """Khả năng của server upload (tus)"""
+    return Response(status=204, headers={
+        'Tus-Resumable': TUS_VERSION,
+        'Tus-Version': TUS_VERSION,
+        'Tus-Extension': TUS_EXTENSIONS,
+        'Tus-Max-Size': str(get_upload_store().max_size)
+    })
+
+@main.route('/uploads', methods=['POST'])
+def create_upload():
+    """Tạo upload: Upload-Length là kích thước file, Upload-Metadata chứa filename (base64)"""
+    try:
+        length = request.headers.get('Upload-Length', '')
+        if not length.isdigit():
+            raise UploadError('Thiếu hoặc sai Upload-Length')
+        metadata = parse_metadata(request.headers.get('Upload-Metadata'))
+        upload = get_upload_store().create(int(length), metadata.get('filename'))
+    except UploadError as e:
+        return upload_error(e)
+    headers = upload_headers(upload)
+    headers['Location'] = url_for('main.upload_status', upload_id=upload['id'])
+    return Response(status=201, headers=headers)
+
+@main.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def upload_status(upload_id):
+    """Offset hiện tại của upload (HEAD, để gửi tiếp) và trạng thái dạng JSON (GET)"""
+    try:
+        upload = get_upload_store().get(upload_id)
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify({
+        'status': 'success',
+        'upload': {
+            'id': upload['id'],
+            'filename': upload['filename'],
+            'length': upload['length'],
+            'offset': upload['offset'],
+            'complete': upload['path'] is not None,
+            'file_path': upload['path'],
+            'sha512': upload['sha512']
+        }
+    }), 200, upload_headers(upload)
+
+@main.route('/uploads/<upload_id>', methods=['PATCH'])
+def write_upload(upload_id):
+    """Ghi tiếp dữ liệu từ Upload-Offset; body được đọc dạng stream, không đệm cả request"""
+    try:
+        if request.mimetype != 'application/offset+octet-stream':
+            return jsonify({
+                'status': 'error',
+                'message': 'Content-Type phải là application/offset+octet-stream'
+            }), 415
+        offset = request.headers.get('Upload-Offset', '')
+        if not offset.isdigit():
+            raise UploadError('Thiếu hoặc sai Upload-Offset')
+        upload = get_upload_store().write(upload_id, int(offset), request.stream)
+    except UploadError as e:
+        return upload_error(e)
+    return Response(status=204, headers=upload_headers(upload))
+
+@main.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    """Hủy upload và xóa dữ liệu đã nhận"""
+    try:
+        store = get_upload_store()
+        store.get(upload_id)
+        store.delete(upload_id)
+    except UploadError as e:
+        return upload_error(e)
+    return Response(status=204, headers={'Tus-Resumable': TUS_VERSION})
+
 @main.route('/send_file', methods=['POST'])
 def send_file_secure():
     """Gửi file qua WebSocket một cách an toàn"""
@@ -145,27 +278,27 @@ def send_file_secure():
                 'message': 'File không tồn tại'
             })
         
-        # Gửi file qua WebSocket client
-        async def send_file_async():
-            client = SecureFileClient()
-            return await client.send_file_secure(file_path)
-        
-        # Chạy async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        success = loop.run_until_complete(send_file_async())
-        loop.close()
-        
-        if success:
-            return jsonify({
-                'status': 'success',
-                'message': 'File đã được gửi an toàn thành công'
-            })
-        else:
+        # Xếp job vào hàng đợi rồi trả về ngay, worker nền gửi qua pool kết nối đã trao khóa
+        notify_room = data.get('sid')
+        if not notify_room and current_user.is_authenticated:
+            from app.ws import user_sid_map
+            notify_room = user_sid_map.get(current_user.username)
+        try:
+            # File upload qua /uploads hoặc /upload_file đã có digest, khỏi đọc lại để hash
+            content_digest = get_upload_store().digest_of(file_path)
+            job = get_send_job_queue(on_finish=notify_send_job).submit(file_path, notify_room, content_digest)
+        except JobQueueFull as e:
             return jsonify({
                 'status': 'error',
-                'message': 'Gửi file thất bại'
-            })
+                'message': str(e)
+            }), 503
+        
+        return jsonify({
+            'status': 'queued',
+            'message': 'File đã được xếp vào hàng đợi gửi',
+            'job_id': job.id,
+            'status_url': url_for('main.send_job_status', job_id=job.id)
+        }), 202
             
     except Exception as e:
         return jsonify({
@@ -173,31 +306,76 @@ def send_file_secure():
             'message': f'Lỗi gửi file: {str(e)}'
         })
 
+@main.route('/api/send_jobs/<job_id>')
+def send_job_status(job_id):
+    """Trạng thái và tiến độ của một job gửi file"""
+    job = get_send_job_queue(on_finish=notify_send_job).get(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Không tìm thấy job'
+        }), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+def notify_send_job(job):
+    """Báo kết quả job qua Socket.IO tới client đã gửi yêu cầu (nếu biết sid)"""
+    if job.notify_room:
+        from app import socketio
+        socketio.emit('send_job_finished', job.to_dict(), room=job.notify_room)
+
 @main.route('/list_received_files')
 def list_received_files():
-    """Liệt kê các file đã nhận"""
+    """
+    Liệt kê các file đã nhận theo trang (keyset) từ chỉ mục trong bộ nhớ.
+    Tham số: sort=time|size|name, order=desc|asc, prefix, limit, cursor (next_cursor của trang trước).
+    Không có cả limit lẫn cursor thì trả toàn bộ danh sách như trước (trang receiver dùng cách này).
+    Có ETag: request lặp lại với If-None-Match khi thư mục không đổi nhận 304
+    """
     try:
-        received_dir = Path('received_files')
-        if not received_dir.exists():
+        sort = request.args.get('sort', 'time')
+        order = request.args.get('order', 'desc')
+        prefix = request.args.get('prefix', '')
+        cursor = request.args.get('cursor') or None
+        if 'limit' not in request.args and cursor is None:
+            limit = None
+        else:
+            limit = request.args.get('limit', str(Config.RECEIVED_LIST_PAGE_SIZE))
+            limit = int(limit) if limit.isdigit() else 0
+            if limit < 1:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Tham số limit không hợp lệ'
+                }), 400
+            limit = min(limit, Config.RECEIVED_LIST_MAX_PAGE_SIZE)
+        if order not in ('asc', 'desc'):
             return jsonify({
-                'status': 'success',
-                'files': []
-            })
+                'status': 'error',
+                'message': 'Tham số order không hợp lệ'
+            }), 400
         
-        files = []
-        for file_path in received_dir.iterdir():
-            if file_path.is_file():
-                files.append({
-                    'name': file_path.name,
-                    'size': file_path.stat().st_size,
-                    'path': str(file_path)
-                })
+        index = get_received_files_index('received_files')
+        query = json.dumps([sort, order, prefix, limit, cursor])
+        etag = hashlib.sha256(f'{index.refresh()}:{query}'.encode('utf-8')).hexdigest()[:32]
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
         
-        return jsonify({
+        files, next_cursor = index.page(sort, order == 'desc', prefix, limit, cursor)
+        for file in files:
+            file['path'] = str(Path('received_files') / file['name'])
+        response = jsonify({
             'status': 'success',
-            'files': files
+            'files': files,
+            'next_cursor': next_cursor
         })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'status': 'error',
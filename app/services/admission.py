@@ -0,0 +1,153 @@
+"""
+Kiểm soát tải của server: giới hạn số kết nối, số transfer đang nhận và số byte ciphertext
+đang giữ trong bộ nhớ. Yêu cầu vượt giới hạn chờ trong hàng đợi theo thứ tự đến (FIFO);
+quá thời gian chờ thì server trả 'busy' kèm retry_after để client thử lại sau.
+"""
+
+import time
+import asyncio
+import weakref
+from collections import deque
+from app.services.metrics import registry
+
+# Mốc histogram thời gian chờ (giây): thời gian chờ tối đa thường tính bằng chục giây
+WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    'securefile_admission_wait_seconds',
+    'Thời gian chờ trong hàng đợi trước khi được nhận (kể cả lần chờ quá hạn)',
+    ['resource'],
+    buckets=WAIT_BUCKETS
+)
+ADMISSION_REJECTED = registry.counter(
+    'securefile_admission_rejected_total',
+    'Số yêu cầu bị trả busy vì chờ quá hạn',
+    ['resource']
+)
+
+# Các limiter đang tồn tại, để gauge đọc độ sâu hàng đợi lúc xuất
+_limiters = weakref.WeakSet()
+
+
+def _collect(attribute):
+    values = {}
+    for limiter in list(_limiters):
+        values[(limiter.name,)] = values.get((limiter.name,), 0) + getattr(limiter, attribute)
+    return values
+
+
+registry.gauge(
+    'securefile_admission_queue_depth', 'Số yêu cầu đang chờ trong hàng đợi', ['resource']
+).set_function(lambda: _collect('waiting'))
+registry.gauge(
+    'securefile_admission_in_use', 'Phần giới hạn đang được dùng (kết nối, transfer hoặc byte)', ['resource']
+).set_function(lambda: _collect('in_use'))
+
+
+class AdmissionLimiter:
+    """
+    Semaphore có trọng số cho asyncio, cấp theo đúng thứ tự đến: yêu cầu đứng đầu hàng
+    chưa đủ chỗ thì các yêu cầu sau cũng phải chờ, nên yêu cầu lớn không bị bỏ đói
+    """
+
+    def __init__(self, name, limit):
+        """
+        Args:
+            name (str): Tên tài nguyên (nhãn 'resource' trong metric, vd: 'connections')
+            limit (int): Tổng trọng số được dùng cùng lúc
+        """
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.in_use = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters = deque()
+        _limiters.add(self)
+
+    @property
+    def waiting(self):
+        """Số yêu cầu đang chờ"""
+        return sum(1 for _, waiter in self._waiters if not waiter.done())
+
+    def _weight(self, weight):
+        # Yêu cầu lớn hơn cả giới hạn vẫn được nhận khi không còn ai dùng
+        return min(max(1, int(weight)), self.limit)
+
+    async def acquire(self, weight=1, timeout=None):
+        """
+        Chờ tới lượt và giữ weight đơn vị của giới hạn
+        Args:
+            weight (int): Số đơn vị cần giữ (1 cho kết nối/transfer, số byte cho bộ nhớ đệm)
+            timeout (float): Thời gian chờ tối đa (giây), None để chờ mãi
+        Returns:
+            bool: True nếu được nhận (phải gọi release cùng weight), False nếu chờ quá hạn
+        """
+        weight = self._weight(weight)
+        if not self._waiters and self.in_use + weight <= self.limit:
+            self.in_use += weight
+            self.admitted += 1
+            ADMISSION_WAIT_SECONDS.observe(0.0, resource=self.name)
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (weight, waiter)
+        self._waiters.append(entry)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if waiter.done() and not waiter.cancelled():
+                # Được cấp chỗ đúng lúc hết hạn/bị hủy: trả lại để người sau dùng
+                self.release(weight)
+            else:
+                try:
+                    self._waiters.remove(entry)
+                except ValueError:
+                    pass
+                # Yêu cầu đứng đầu rời hàng có thể mở đường cho các yêu cầu nhỏ phía sau
+                self._wake()
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, resource=self.name)
+            if asyncio.current_task().cancelling():
+                raise
+            self.rejected += 1
+            ADMISSION_REJECTED.inc(resource=self.name)
+            return False
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, resource=self.name)
+        self.admitted += 1
+        return True
+
+    def release(self, weight=1):
+        """
+        Trả lại phần đã giữ bằng acquire
+        Args:
+            weight (int): Đúng weight đã truyền cho acquire
+        """
+        self.in_use = max(0, self.in_use - self._weight(weight))
+        self._wake()
+
+    def _wake(self):
+        """Cấp chỗ cho các yêu cầu đầu hàng đợi còn vừa giới hạn"""
+        while self._waiters:
+            weight, waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if self.in_use + weight > self.limit:
+                return
+            self._waiters.popleft()
+            self.in_use += weight
+            waiter.set_result(True)
+
+    def stats(self):
+        """
+        Thống kê
+        Returns:
+            dict: limit, in_use, waiting, admitted, rejected
+        """
+        return {
+            'limit': self.limit,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,184 @@
+"""
+Gửi cả thư mục (hoặc các file khớp một glob) cho batch chạy định kỳ.
+Các file được gửi song song qua pool kết nối đã trao khóa (xem client_pool), file lỗi được gửi lại
+với backoff lũy thừa có jitter; cuối lượt in bản tóm tắt JSON: thời gian từng file và MB/s tổng.
+
+    python -m app.services.batch_sender exports/ --concurrency 8 --output summary.json
+    python -m app.services.batch_sender 'exports/*.csv' --server ws://localhost:8765
+"""
+
+import sys
+import glob
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from app.config import Config
+from app.services.client_pool import SecureClientPool
+
+logger = logging.getLogger(__name__)
+
+
+def collect_files(source, recursive=False):
+    """
+    Liệt kê các file cần gửi
+    Args:
+        source (str): Thư mục, hoặc glob (vd: 'exports/*.csv')
+        recursive (bool): Với thư mục, lấy cả file trong thư mục con; với glob, cho phép '**'
+    Returns:
+        list: Đường dẫn file (str) theo thứ tự tên, bỏ file ẩn (vd: file tạm .part)
+    """
+    path = Path(source)
+    if path.is_dir():
+        candidates = path.rglob('*') if recursive else path.iterdir()
+    else:
+        candidates = (Path(match) for match in glob.glob(source, recursive=recursive))
+    return sorted(str(candidate) for candidate in candidates
+                  if candidate.is_file() and not candidate.name.startswith('.'))
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Thời gian chờ trước lần gửi lại thứ attempt (1, 2, ...): backoff lũy thừa với full jitter,
+    để các file cùng lỗi một lúc không gửi lại dồn cùng một thời điểm
+    Returns:
+        float: Số giây chờ, trong [0, min(max_delay, base_delay * 2^(attempt-1))]
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class BatchSender:
+    """Gửi một lô file với số file song song giới hạn, dùng chung các phiên của một pool client"""
+
+    def __init__(self, server_uri=None, concurrency=None, attempts=None, base_delay=None, max_delay=None,
+                 pool=None):
+        """
+        Args:
+            server_uri (str): URI của WebSocket server (mặc định Config.WS_SERVER_URI)
+            concurrency (int): Số file gửi cùng lúc, cũng là số phiên của pool
+            attempts (int): Số lần thử tối đa cho mỗi file
+            base_delay (float): Backoff trước lần thử lại đầu tiên (giây)
+            max_delay (float): Backoff tối đa giữa hai lần thử (giây)
+            pool (SecureClientPool): Pool có sẵn (mặc định tạo pool riêng, đóng khi send xong)
+        """
+        self.concurrency = max(1, concurrency or Config.BATCH_CONCURRENCY)
+        self.attempts = max(1, attempts or Config.BATCH_RETRY_ATTEMPTS)
+        self.base_delay = base_delay if base_delay is not None else Config.BATCH_RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else Config.BATCH_RETRY_MAX_DELAY
+        self._owns_pool = pool is None
+        self.pool = pool or SecureClientPool(server_uri, size=self.concurrency)
+
+    def send(self, file_paths):
+        """
+        Gửi các file, chặn tới khi xong cả lô
+        Args:
+            file_paths (list): Đường dẫn file cần gửi
+        Returns:
+            dict: Bản tóm tắt (xem summarize)
+        """
+        try:
+            return self.pool.submit(self.send_async(file_paths)).result()
+        finally:
+            if self._owns_pool:
+                self.pool.close()
+
+    async def send_async(self, file_paths):
+        """Gửi các file trên event loop của pool (xem send)"""
+        started = time.monotonic()
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def send_one(file_path):
+            async with slots:
+                return await self._send_with_retry(file_path)
+
+        results = await asyncio.gather(*(send_one(str(file_path)) for file_path in file_paths))
+        return self.summarize(results, time.monotonic() - started)
+
+    async def _send_with_retry(self, file_path):
+        """
+        Gửi một file, thử lại khi lỗi
+        Returns:
+            dict: Kết quả của file (path, bytes, ok, attempts, seconds, error)
+        """
+        result = {'path': file_path, 'bytes': 0, 'ok': False, 'attempts': 0, 'seconds': 0.0, 'error': None}
+        try:
+            result['bytes'] = Path(file_path).stat().st_size
+        except OSError as e:
+            result['error'] = f"Không đọc được file: {e}"
+            return result
+        started = time.monotonic()
+        for attempt in range(1, self.attempts + 1):
+            result['attempts'] = attempt
+            try:
+                result['ok'] = await self.pool.send_file_async(file_path)
+                result['error'] = None if result['ok'] else 'Gửi file thất bại'
+            except Exception as e:
+                result['error'] = str(e)
+            if result['ok'] or attempt == self.attempts:
+                break
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+            logger.warning(f"Gửi {file_path} lỗi lần {attempt} ({result['error']}), thử lại sau {delay:.2f}s")
+            await asyncio.sleep(delay)
+        result['seconds'] = round(time.monotonic() - started, 6)
+        return result
+
+    @staticmethod
+    def summarize(results, elapsed):
+        """
+        Tổng hợp kết quả của lô
+        Args:
+            results (list): Kết quả từng file của _send_with_retry
+            elapsed (float): Thời gian chạy cả lô (giây)
+        Returns:
+            dict: files, succeeded, failed, bytes (đã gửi thành công), seconds, mb_per_s,
+                latency (p50/p95/max giây của các file thành công) và danh sách từng file
+        """
+        sent = [result for result in results if result['ok']]
+        latencies = sorted(result['seconds'] for result in sent)
+        sent_bytes = sum(result['bytes'] for result in sent)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+        return {
+            'files': len(results),
+            'succeeded': len(sent),
+            'failed': len(results) - len(sent),
+            'bytes': sent_bytes,
+            'seconds': round(elapsed, 6),
+            'mb_per_s': round(sent_bytes / 1e6 / elapsed, 3) if elapsed > 0 else 0.0,
+            'latency': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1.0)},
+            'results': list(results)
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gửi mọi file trong một thư mục hoặc khớp một glob tới server')
+    parser.add_argument('source', help="Thư mục hoặc glob, vd: 'exports/*.csv'")
+    parser.add_argument('--server', default=Config.WS_SERVER_URI)
+    parser.add_argument('--recursive', action='store_true', help='Lấy cả thư mục con / cho phép ** trong glob')
+    parser.add_argument('--concurrency', type=int, default=Config.BATCH_CONCURRENCY)
+    parser.add_argument('--attempts', type=int, default=Config.BATCH_RETRY_ATTEMPTS)
+    parser.add_argument('--output', help='Ghi bản tóm tắt JSON ra file (mặc định in ra stdout)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    file_paths = collect_files(args.source, args.recursive)
+    if not file_paths:
+        parser.error(f"Không có file nào khớp {args.source}")
+    summary = BatchSender(args.server, args.concurrency, args.attempts).send(file_paths)
+    report = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(report, encoding='utf-8')
+    else:
+        print(report)
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
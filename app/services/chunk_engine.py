@@ -0,0 +1,103 @@
+"""
+Engine xử lý song song các chunk (nén, mã hóa, hash) trên nhiều core
+Kết quả luôn được trả về đúng thứ tự chunk đầu vào
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from app.config import Config
+
+
+class ChunkEngine:
+    """Engine chạy các tác vụ chunk song song bằng thread pool hoặc process pool"""
+
+    def __init__(self, workers=None, executor='thread'):
+        """
+        Khởi tạo engine
+        Args:
+            workers (int): Số worker (mặc định bằng số core)
+            executor (str): 'thread' hoặc 'process'
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Loại executor không hỗ trợ: {executor}")
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.executor_type = executor
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """Khởi tạo executor khi dùng lần đầu"""
+        with self._lock:
+            if self._executor is None:
+                if self.executor_type == 'process':
+                    # Dùng spawn để tránh fork khi process cha đang chạy nhiều thread
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix='chunk-worker'
+                    )
+            return self._executor
+
+    def map(self, fn, jobs):
+        """
+        Chạy fn(*job) cho từng job song song, trả kết quả theo đúng thứ tự job.
+        Số job đang xử lý bị giới hạn (2 x số worker) nên bộ nhớ không tăng theo kích thước file.
+        Args:
+            fn: Hàm xử lý (phải pickle được nếu dùng process pool)
+            jobs (iterable): Các tuple tham số
+        Yields:
+            Kết quả của fn theo thứ tự
+        """
+        if self.workers == 1:
+            for job in jobs:
+                yield fn(*job)
+            return
+
+        executor = self._get_executor()
+        window = deque()
+        max_in_flight = self.workers * 2
+        try:
+            for job in jobs:
+                window.append(executor.submit(fn, *job))
+                if len(window) >= max_in_flight:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+        finally:
+            # Hủy các job còn lại nếu bên gọi dừng sớm hoặc có lỗi
+            for future in window:
+                future.cancel()
+
+    def shutdown(self):
+        """Dừng executor"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def get_chunk_engine():
+    """
+    Lấy engine dùng chung của process (cấu hình theo Config)
+    Returns:
+        ChunkEngine: Engine dùng chung
+    """
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = ChunkEngine(
+                workers=Config.CRYPTO_WORKERS,
+                executor=Config.CRYPTO_EXECUTOR
+            )
+        return _default_engine
@@ -0,0 +1,259 @@
+"""
+Pool kết nối SecureFileClient dùng lâu dài cho ứng dụng Flask.
+Các kết nối đã handshake, trao khóa và mở phiên nhiều file được giữ lại trên một event loop nền,
+nên mỗi lần gửi file chỉ tốn phần mã hóa và truyền dữ liệu thay vì kết nối và trao khóa RSA lại từ đầu.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+import weakref
+from collections import deque
+from app.config import Config
+from app.services.metrics import registry
+from app.services.websocket_client import SecureFileClient
+
+logger = logging.getLogger(__name__)
+
+POOL_CHECKOUTS = registry.counter(
+    'securefile_client_pool_checkouts_total',
+    'Số lần lấy kết nối từ pool client (reused: dùng lại, new: mở mới, stale: bỏ kết nối đã hỏng)',
+    ['result']
+)
+
+# Các pool đang tồn tại, để gauge đọc số kết nối lúc xuất
+_pools = weakref.WeakSet()
+
+registry.gauge(
+    'securefile_client_pool_connections', 'Kết nối của pool client đang rảnh (idle) hoặc đang gửi (busy)',
+    ['state']
+).set_function(lambda: {
+    (state,): sum(pool.stats()[state] for pool in list(_pools)) for state in ('idle', 'busy')
+})
+
+
+class SecureClientPool:
+    """Giữ các kết nối SecureFileClient đã trao khóa trên một event loop nền riêng"""
+
+    def __init__(self, server_uri=None, size=None, idle_timeout=None, ping_after=None, key_pool=None):
+        """
+        Args:
+            server_uri (str): URI của WebSocket server (mặc định Config.WS_SERVER_URI)
+            size (int): Số kết nối tối đa, cũng là số file được gửi cùng lúc
+            idle_timeout (float): Kết nối không dùng quá số giây này bị đóng
+            ping_after (float): Kết nối rảnh quá số giây này được ping trước khi dùng lại
+            key_pool (RSAKeyPool): Pool khóa RSA sinh sẵn (mặc định dùng pool chung)
+        """
+        self.server_uri = server_uri or Config.WS_SERVER_URI
+        self.size = max(1, size or Config.CLIENT_POOL_SIZE)
+        self.idle_timeout = idle_timeout if idle_timeout is not None else Config.CLIENT_POOL_IDLE_TIMEOUT
+        self.ping_after = ping_after if ping_after is not None else Config.CLIENT_POOL_PING_AFTER
+        self.key_pool = key_pool
+        self._idle = deque()  # (client, thời điểm trả về pool), phần tử cuối là kết nối vừa dùng
+        self._busy = 0
+        self._slots = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.opened = 0
+        self.reused = 0
+        self.stale = 0
+        _pools.add(self)
+
+    def start(self):
+        """
+        Khởi chạy event loop nền (nếu chưa chạy)
+        Returns:
+            asyncio.AbstractEventLoop: Event loop của pool
+        Raises:
+            RuntimeError: Nếu pool đã đóng
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pool client đã đóng")
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='client-pool', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro):
+        """
+        Chạy coroutine trên event loop của pool (gọi được từ thread bất kỳ)
+        Returns:
+            concurrent.futures.Future: Kết quả của coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def send_file(self, file_path, timeout=None):
+        """
+        Gửi file qua một kết nối của pool, chặn tới khi xong (dùng từ route Flask)
+        Args:
+            file_path (str): Đường dẫn file cần gửi
+            timeout (float): Thời gian chờ tối đa (giây), None để chờ mãi
+        Returns:
+            bool: True nếu server đã lưu file
+        Raises:
+            ConnectionError: Nếu không mở được kết nối tới server
+            TimeoutError: Nếu quá thời gian chờ (lần gửi bị hủy)
+        """
+        future = self.submit(self.send_file_async(file_path))
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def send_file_async(self, file_path, progress=None, content_digest=None):
+        """
+        Gửi file trên event loop của pool. Kết nối hỏng giữa chừng thì gửi lại một lần trên kết nối mới;
+        server báo bận thì chờ retry_after rồi thử lại (tối đa Config.BUSY_RETRY_ATTEMPTS lần)
+        Args:
+            file_path (str): Đường dẫn file cần gửi
+            progress (callable): Xem SecureFileClient.send_file
+            content_digest (str): Xem SecureFileClient.send_file
+        Returns:
+            bool: True nếu server đã lưu file
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            reconnected = False
+            busy_attempts = 0
+            while True:
+                client = await self._acquire()
+                client.retry_after = None
+                try:
+                    success = await client.send_file(file_path, progress, content_digest)
+                finally:
+                    await self._release(client)
+                if success:
+                    return True
+                if not client.connected and not reconnected:
+                    reconnected = True
+                    logger.warning(f"Kết nối tới server bị đóng khi gửi {file_path}, gửi lại trên kết nối mới")
+                elif client.retry_after is not None and busy_attempts < Config.BUSY_RETRY_ATTEMPTS:
+                    busy_attempts += 1
+                    await asyncio.sleep(client.retry_after)
+                else:
+                    return False
+
+    async def _acquire(self):
+        """
+        Lấy kết nối vừa dùng gần nhất còn tốt, hoặc mở kết nối mới
+        Returns:
+            SecureFileClient: Client đã mở phiên
+        Raises:
+            ConnectionError: Nếu không mở được kết nối tới server
+        """
+        await self._expire_idle()
+        while self._idle:
+            client, returned = self._idle.pop()
+            if await self._usable(client, time.monotonic() - returned):
+                self.reused += 1
+                POOL_CHECKOUTS.inc(result='reused')
+                self._busy += 1
+                return client
+            self.stale += 1
+            POOL_CHECKOUTS.inc(result='stale')
+            logger.info("Bỏ kết nối đã hỏng trong pool client")
+            await client.disconnect()
+
+        client = SecureFileClient(self.server_uri, key_pool=self.key_pool)
+        if not await client.connect_session():
+            await client.disconnect()
+            raise ConnectionError(f"Không mở được kết nối tới {self.server_uri}")
+        self.opened += 1
+        POOL_CHECKOUTS.inc(result='new')
+        self._busy += 1
+        return client
+
+    async def _usable(self, client, idle):
+        """
+        Kiểm tra kết nối trước khi dùng lại: còn mở, chưa rảnh quá lâu, và trả lời ping
+        nếu đã rảnh quá ping_after giây (server có thể đã đóng mà client chưa biết)
+        """
+        if not client.connected or idle > self.idle_timeout:
+            return False
+        if idle <= self.ping_after:
+            return True
+        try:
+            pong = await client.websocket.ping()
+            await asyncio.wait_for(pong, Config.CLIENT_POOL_PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def _release(self, client):
+        """Trả kết nối về pool nếu còn dùng được, ngược lại đóng"""
+        self._busy -= 1
+        if client.connected and not self._closed:
+            self._idle.append((client, time.monotonic()))
+        else:
+            await client.disconnect()
+
+    async def _expire_idle(self):
+        """Đóng các kết nối rảnh quá idle_timeout (nằm ở đầu hàng)"""
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            client, _ = self._idle.popleft()
+            await client.disconnect()
+
+    async def _close_idle(self):
+        while self._idle:
+            client, _ = self._idle.popleft()
+            await client.disconnect()
+
+    def stats(self):
+        """
+        Thống kê pool
+        Returns:
+            dict: size, idle, busy, opened (kết nối đã mở), reused (lần dùng lại), stale (kết nối hỏng bị bỏ)
+        """
+        return {
+            'size': self.size,
+            'idle': len(self._idle),
+            'busy': self._busy,
+            'opened': self.opened,
+            'reused': self.reused,
+            'stale': self.stale
+        }
+
+    def close(self, timeout=5.0):
+        """
+        Đóng các kết nối rảnh và dừng event loop nền
+        Args:
+            timeout (float): Thời gian chờ tối đa (giây)
+        """
+        with self._lock:
+            self._closed = True
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_idle(), loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Không đóng êm được các kết nối của pool client: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout)
+        if not loop.is_running():
+            loop.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_client_pool():
+    """
+    Lấy pool client dùng chung của process (cấu hình theo Config)
+    Returns:
+        SecureClientPool: Pool dùng chung
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SecureClientPool()
+        return _default_pool
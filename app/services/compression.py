@@ -0,0 +1,228 @@
+"""
+Registry các codec nén dữ liệu (store, zlib nhiều mức, bz2, lzma)
+và chế độ tự động chọn codec theo entropy / nén thử phần đầu dữ liệu
+"""
+
+import bz2
+import lzma
+import math
+import time
+import zlib
+from collections import Counter
+
+# Kích thước mẫu dùng để ước lượng entropy và nén thử
+SAMPLE_SIZE = 64 * 1024
+# Entropy (bit/byte) trên ngưỡng này coi như dữ liệu đã nén/mã hóa, bỏ qua nén
+ENTROPY_THRESHOLD = 7.5
+# Tỷ lệ nén tối thiểu để việc nén đáng giá (kích thước sau nén / trước nén)
+MIN_USEFUL_RATIO = 0.95
+
+# Kích thước mỗi phần dữ liệu khi giải nén tăng dần ra file
+DECOMPRESS_PIECE_SIZE = 64 * 1024
+
+# Các codec được thử ở chế độ auto theo mục tiêu
+AUTO_CANDIDATES = {
+    'throughput': ('zlib-1', 'zlib-6'),
+    'ratio': ('zlib-9', 'bz2', 'lzma'),
+}
+
+
+class CompressionError(ValueError):
+    """Lỗi nén/giải nén hoặc dữ liệu giải nén vượt giới hạn"""
+
+
+class Codec:
+    """Một codec nén, có ID số để ghi vào gói tin"""
+
+    def __init__(self, codec_id, name, compress, decompressor=None, unlimited=-1):
+        """
+        Args:
+            codec_id (int): ID số của codec (0-255)
+            name (str): Tên codec
+            compress: Hàm nén bytes -> bytes
+            decompressor: Hàm tạo đối tượng giải nén tăng dần (None với store)
+            unlimited (int): Giá trị max_length nghĩa là không giới hạn của decompressor
+        """
+        self.id = codec_id
+        self.name = name
+        self._compress = compress
+        self._decompressor = decompressor
+        self._unlimited = unlimited
+
+    def compress(self, data):
+        """Nén dữ liệu"""
+        return self._compress(data)
+
+    def decompress(self, data, max_length=None):
+        """
+        Giải nén dữ liệu, giới hạn kích thước đầu ra để chống decompression bomb
+        Args:
+            data (bytes): Dữ liệu đã nén
+            max_length (int): Kích thước tối đa của dữ liệu gốc (None: không giới hạn)
+        Returns:
+            bytes: Dữ liệu gốc
+        Raises:
+            CompressionError: Nếu dữ liệu lỗi, bị cắt cụt hoặc vượt giới hạn
+        """
+        if self._decompressor is None:
+            if max_length is not None and len(data) > max_length:
+                raise CompressionError("Dữ liệu vượt quá kích thước cho phép")
+            return bytes(data)
+
+        decompressor = self._decompressor()
+        limit = self._unlimited if max_length is None else max_length + 1
+        try:
+            result = decompressor.decompress(data, limit)
+        except (zlib.error, lzma.LZMAError, OSError, EOFError) as e:
+            raise CompressionError(f"Dữ liệu nén không hợp lệ: {e}")
+
+        if max_length is not None and len(result) > max_length:
+            raise CompressionError("Dữ liệu giải nén vượt quá kích thước cho phép")
+        if not decompressor.eof:
+            raise CompressionError("Dữ liệu nén bị cắt cụt")
+        return result
+
+    def decompress_to(self, data, write, max_length, piece_size=DECOMPRESS_PIECE_SIZE):
+        """
+        Giải nén tăng dần, ghi từng phần tối đa piece_size byte qua write()
+        nên không cần giữ toàn bộ dữ liệu gốc trong bộ nhớ
+        Args:
+            data (bytes | memoryview): Dữ liệu đã nén
+            write: Hàm nhận từng phần dữ liệu gốc (vd: file.write)
+            max_length (int): Kích thước tối đa của dữ liệu gốc
+            piece_size (int): Kích thước tối đa mỗi phần
+        Returns:
+            int: Tổng số byte dữ liệu gốc đã ghi
+        Raises:
+            CompressionError: Nếu dữ liệu lỗi, bị cắt cụt hoặc vượt giới hạn
+        """
+        if self._decompressor is None:
+            if len(data) > max_length:
+                raise CompressionError("Dữ liệu vượt quá kích thước cho phép")
+            write(data)
+            return len(data)
+
+        decompressor = self._decompressor()
+        is_zlib = hasattr(decompressor, 'unconsumed_tail')
+        total = 0
+        try:
+            while True:
+                piece = decompressor.decompress(data, piece_size)
+                total += len(piece)
+                if total > max_length:
+                    raise CompressionError("Dữ liệu giải nén vượt quá kích thước cho phép")
+                if piece:
+                    write(piece)
+                if is_zlib:
+                    # Phần input chưa xử lý nằm ở unconsumed_tail; piece đầy nghĩa là còn output chờ
+                    data = decompressor.unconsumed_tail
+                    if decompressor.eof or (not data and len(piece) < piece_size):
+                        break
+                else:
+                    data = b''
+                    if decompressor.eof or decompressor.needs_input:
+                        break
+        except (zlib.error, lzma.LZMAError, OSError, EOFError) as e:
+            raise CompressionError(f"Dữ liệu nén không hợp lệ: {e}")
+
+        if not decompressor.eof:
+            raise CompressionError("Dữ liệu nén bị cắt cụt")
+        return total
+
+
+def _zlib_codec(codec_id, name, level):
+    return Codec(codec_id, name, lambda data: zlib.compress(data, level), zlib.decompressobj, unlimited=0)
+
+
+CODECS = {}
+CODEC_IDS = {}
+
+
+def register_codec(codec):
+    """
+    Đăng ký codec vào registry
+    Args:
+        codec (Codec): Codec cần đăng ký
+    """
+    if codec.id in CODEC_IDS:
+        raise ValueError(f"ID codec đã tồn tại: {codec.id}")
+    CODECS[codec.name] = codec
+    CODEC_IDS[codec.id] = codec
+
+
+register_codec(Codec(0, 'store', bytes))
+register_codec(_zlib_codec(1, 'zlib', zlib.Z_DEFAULT_COMPRESSION))
+register_codec(_zlib_codec(2, 'zlib-1', 1))
+register_codec(_zlib_codec(3, 'zlib-6', 6))
+register_codec(_zlib_codec(4, 'zlib-9', 9))
+register_codec(Codec(5, 'bz2', lambda data: bz2.compress(data, 9), bz2.BZ2Decompressor))
+register_codec(Codec(6, 'lzma', lambda data: lzma.compress(data, preset=6), lzma.LZMADecompressor))
+
+
+def get_codec(name):
+    """
+    Lấy codec theo tên
+    Args:
+        name (str): Tên codec
+    Returns:
+        Codec: Codec tương ứng
+    Raises:
+        CompressionError: Nếu codec không tồn tại
+    """
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise CompressionError(f"Codec không được hỗ trợ: {name}")
+
+
+def shannon_entropy(sample):
+    """
+    Tính entropy Shannon (bit/byte) của mẫu dữ liệu
+    Args:
+        sample (bytes): Mẫu dữ liệu
+    Returns:
+        float: Entropy trong khoảng 0..8
+    """
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(
+        count / total * math.log2(count / total)
+        for count in Counter(sample).values()
+    )
+
+
+def choose_codec(sample, target='throughput'):
+    """
+    Chọn codec phù hợp cho dữ liệu dựa trên mẫu phần đầu.
+    Dữ liệu entropy cao (PDF, XLSX, ZIP...) dùng 'store'; còn lại nén thử mẫu
+    bằng các codec ứng viên của mục tiêu và chọn codec tốt nhất.
+    Args:
+        sample (bytes): Mẫu dữ liệu (phần đầu file)
+        target (str): 'throughput' (ưu tiên tốc độ) hoặc 'ratio' (ưu tiên tỷ lệ nén)
+    Returns:
+        str: Tên codec
+    """
+    if target not in AUTO_CANDIDATES:
+        raise CompressionError(f"Mục tiêu nén không hỗ trợ: {target}")
+
+    sample = sample[:SAMPLE_SIZE]
+    if not sample or shannon_entropy(sample) > ENTROPY_THRESHOLD:
+        return 'store'
+
+    trials = []
+    for name in AUTO_CANDIDATES[target]:
+        started = time.perf_counter()
+        size = len(CODECS[name].compress(sample))
+        trials.append((name, size / len(sample), time.perf_counter() - started))
+
+    best_ratio = min(ratio for _, ratio, _ in trials)
+    if best_ratio > MIN_USEFUL_RATIO:
+        return 'store'
+
+    if target == 'ratio':
+        return min(trials, key=lambda trial: trial[1])[0]
+
+    # Ưu tiên tốc độ: chọn codec nhanh nhất có tỷ lệ nén không kém quá 10% so với tốt nhất
+    acceptable = [trial for trial in trials if trial[1] <= best_ratio * 1.1]
+    return min(acceptable, key=lambda trial: trial[2])[0]
@@ -0,0 +1,174 @@
+"""
+Chỉ mục nội dung các file đã nhận (SHA-512 -> file trong received_files)
+Dùng để dedup: file có nội dung đã nhận trước đó chỉ được liên kết (hard link hoặc
+sao chép) sang tên mới thay vì nhận lại toàn bộ dữ liệu.
+Nhiều process server (server_cluster) dùng chung một chỉ mục: mỗi process đọc lại file khi
+process khác đã ghi, và ghi dưới khóa file để không làm mất mục của nhau.
+"""
+
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: không chạy được nhiều process trên một port nên chỉ cần khóa trong process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = '.content_index.json'
+LOCK_FILENAME = '.content_index.lock'
+
+
+class ContentIndex:
+    """Chỉ mục digest -> file, lưu kèm trong thư mục nhận dưới dạng file JSON"""
+
+    def __init__(self, received_dir):
+        """
+        Args:
+            received_dir (str | Path): Thư mục lưu file nhận được
+        """
+        self.received_dir = Path(received_dir)
+        self.index_path = self.received_dir / INDEX_FILENAME
+        self.lock_path = self.received_dir / LOCK_FILENAME
+        self._entries = None
+        self._loaded_from = None  # Nhận diện file chỉ mục lúc đọc, đổi nghĩa là process khác đã ghi
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _index_signature(self):
+        try:
+            stat = self.index_path.stat()
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def _load(self):
+        """Đọc chỉ mục từ đĩa khi dùng lần đầu hoặc khi file đã được ghi lại (gọi khi đang giữ lock)"""
+        signature = self._index_signature()
+        if self._entries is None or signature != self._loaded_from:
+            try:
+                self._entries = json.loads(self.index_path.read_text(encoding='utf-8'))
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Chỉ mục nội dung lỗi, tạo lại từ đầu: {e}")
+                self._entries = {}
+            self._loaded_from = signature
+        return self._entries
+
+    @contextmanager
+    def _file_lock(self):
+        """Khóa độc quyền giữa các process khi đọc-sửa-ghi chỉ mục"""
+        if fcntl is None:
+            yield
+            return
+        self.received_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        """Ghi chỉ mục ra đĩa (ghi file tạm rồi đổi tên để không hỏng khi bị ngắt giữa chừng)"""
+        self.received_dir.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.received_dir, prefix='.content_index.', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f)
+        os.replace(temp_path, self.index_path)
+        self._loaded_from = self._index_signature()
+
+    @staticmethod
+    def _signature(stat):
+        """Thông tin nhận diện file trên đĩa; đổi nghĩa là nội dung có thể đã đổi"""
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+    def lookup(self, digest):
+        """
+        Tìm file đang giữ nội dung có digest cho trước
+        Args:
+            digest (str): SHA-512 hex của nội dung
+        Returns:
+            Path: File có nội dung đó, hoặc None (miss)
+        """
+        with self._lock:
+            entries = self._load()
+            for name in list(entries.get(digest, {})):
+                path = self.received_dir / name
+                try:
+                    unchanged = self._signature(path.stat()) == entries[digest][name]
+                except OSError:
+                    unchanged = False
+                if unchanged:
+                    self.hits += 1
+                    return path
+                # File đã bị xóa hoặc ghi đè bằng nội dung khác
+                del entries[digest][name]
+            if digest in entries and not entries[digest]:
+                del entries[digest]
+            self.misses += 1
+            return None
+
+    def add(self, digest, path):
+        """
+        Ghi nhận file vừa lưu có nội dung với digest cho trước
+        Args:
+            digest (str): SHA-512 hex của nội dung
+            path (Path): File trong thư mục nhận
+        """
+        path = Path(path)
+        with self._lock, self._file_lock():
+            entries = self._load()
+            # Tên file này trước đó có thể giữ nội dung khác
+            for names in entries.values():
+                names.pop(path.name, None)
+            entries.setdefault(digest, {})[path.name] = self._signature(path.stat())
+            for key in [key for key, names in entries.items() if not names]:
+                del entries[key]
+            self._save()
+
+    def link(self, digest, source, target):
+        """
+        Tạo file target có cùng nội dung với source (hard link, không được thì sao chép)
+        và ghi nhận vào chỉ mục
+        Args:
+            digest (str): SHA-512 hex của nội dung
+            source (Path): File đã có nội dung
+            target (Path): File cần tạo (thay file cũ cùng tên nếu có)
+        Returns:
+            Path: File target
+        """
+        source, target = Path(source), Path(target)
+        if source.resolve() != target.resolve():
+            fd, temp_path = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.part')
+            os.close(fd)
+            os.unlink(temp_path)
+            try:
+                os.link(source, temp_path)
+            except OSError:
+                shutil.copyfile(source, temp_path)
+            os.replace(temp_path, target)
+        self.add(digest, target)
+        return target
+
+    def stats(self):
+        """
+        Thống kê dedup
+        Returns:
+            dict: entries (số nội dung khác nhau), hits, misses
+        """
+        with self._lock:
+            return {
+                'entries': len(self._load()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,386 @@
+"""
+Backend thực thi các primitive mã hóa: AES-GCM, RSA PKCS#1 v1.5 và SHA-512
+- pycryptodome: cài đặt của PyCryptodome
+- openssl: thư viện cryptography và hashlib (OpenSSL, dùng AES-NI/CLMUL nếu CPU hỗ trợ)
+Ở chế độ auto, lần đầu dùng mỗi primitive sẽ chạy một microbenchmark ngắn
+và chọn backend nhanh nhất trên máy hiện tại
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+import weakref
+from Crypto.PublicKey import RSA
+from Crypto.Cipher import AES, PKCS1_v1_5
+from Crypto.Hash import SHA512
+from Crypto.Signature import pkcs1_15
+from cryptography.exceptions import InvalidSignature, InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+PRIMITIVES = ('aes_gcm', 'rsa', 'sha512')
+
+# Tham số microbenchmark: kích thước dữ liệu, block (bằng FUSED_BLOCK_SIZE) và số lần đo
+BENCHMARK_DATA_SIZE = 256 * 1024
+BENCHMARK_BLOCK_SIZE = 64 * 1024
+BENCHMARK_RSA_KEY_SIZE = 1024
+BENCHMARK_ROUNDS = 3
+
+
+class CryptoBackend:
+    """Giao diện chung của các backend; khóa RSA luôn là đối tượng RsaKey của PyCryptodome"""
+
+    name = None
+
+    def gcm_encrypt(self, key, nonce, data, aad=b''):
+        """
+        Mã hóa AES-GCM một lượt
+        Returns:
+            tuple: (ciphertext, tag)
+        """
+        raise NotImplementedError
+
+    def gcm_decrypt(self, key, nonce, ciphertext, tag, aad=b''):
+        """
+        Giải mã AES-GCM một lượt và kiểm tra tag
+        Returns:
+            bytes: Dữ liệu gốc
+        Raises:
+            ValueError: Nếu tag không hợp lệ
+        """
+        raise NotImplementedError
+
+    def gcm_encryptor(self, key, nonce, aad=b''):
+        """
+        Tạo bộ mã hóa AES-GCM tăng dần: update_into(src, dst) rồi finalize() -> tag
+        """
+        raise NotImplementedError
+
+    def gcm_decryptor(self, key, nonce, aad=b''):
+        """
+        Tạo bộ giải mã AES-GCM tăng dần: update_into(src, dst) rồi verify(tag)
+        (verify ném ValueError nếu tag không hợp lệ)
+        """
+        raise NotImplementedError
+
+    def rsa_encrypt(self, public_key, data):
+        """Mã hóa RSA PKCS#1 v1.5"""
+        raise NotImplementedError
+
+    def rsa_decrypt(self, private_key, data):
+        """Giải mã RSA PKCS#1 v1.5, trả về dữ liệu ngẫu nhiên nếu giải mã lỗi"""
+        raise NotImplementedError
+
+    def rsa_sign(self, private_key, data):
+        """Ký RSA/SHA-512 PKCS#1 v1.5"""
+        raise NotImplementedError
+
+    def rsa_verify(self, public_key, data, signature):
+        """Xác minh chữ ký RSA/SHA-512, trả về True nếu hợp lệ"""
+        raise NotImplementedError
+
+    def sha512(self, data=b''):
+        """Tạo đối tượng hash SHA-512 (update, digest, hexdigest)"""
+        raise NotImplementedError
+
+
+class _PyCryptodomeGcmStream:
+    """AES-GCM tăng dần của PyCryptodome, ghi thẳng vào buffer đích"""
+
+    def __init__(self, cipher, encrypt):
+        self._cipher = cipher
+        self._process = cipher.encrypt if encrypt else cipher.decrypt
+
+    def update_into(self, src, dst):
+        self._process(src, output=dst)
+
+    def finalize(self):
+        return self._cipher.digest()
+
+    def verify(self, tag):
+        self._cipher.verify(tag)
+
+
+class PyCryptodomeBackend(CryptoBackend):
+    """Backend dùng PyCryptodome"""
+
+    name = 'pycryptodome'
+
+    def _gcm(self, key, nonce, aad):
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        if aad:
+            cipher.update(aad)
+        return cipher
+
+    def gcm_encrypt(self, key, nonce, data, aad=b''):
+        return self._gcm(key, nonce, aad).encrypt_and_digest(data)
+
+    def gcm_decrypt(self, key, nonce, ciphertext, tag, aad=b''):
+        return self._gcm(key, nonce, aad).decrypt_and_verify(ciphertext, tag)
+
+    def gcm_encryptor(self, key, nonce, aad=b''):
+        return _PyCryptodomeGcmStream(self._gcm(key, nonce, aad), encrypt=True)
+
+    def gcm_decryptor(self, key, nonce, aad=b''):
+        return _PyCryptodomeGcmStream(self._gcm(key, nonce, aad), encrypt=False)
+
+    def rsa_encrypt(self, public_key, data):
+        return PKCS1_v1_5.new(public_key).encrypt(data)
+
+    def rsa_decrypt(self, private_key, data):
+        # Sentinel ngẫu nhiên: giải mã lỗi cho ra khóa sai thay vì lộ thông tin padding
+        return PKCS1_v1_5.new(private_key).decrypt(data, os.urandom(32))
+
+    def rsa_sign(self, private_key, data):
+        return pkcs1_15.new(private_key).sign(SHA512.new(data))
+
+    def rsa_verify(self, public_key, data, signature):
+        try:
+            pkcs1_15.new(public_key).verify(SHA512.new(data), signature)
+            return True
+        except (ValueError, TypeError):
+            return False
+
+    def sha512(self, data=b''):
+        return SHA512.new(data)
+
+
+class _OpenSSLGcmStream:
+    """AES-GCM tăng dần của OpenSSL (cryptography)"""
+
+    def __init__(self, context):
+        self._context = context
+
+    def update_into(self, src, dst):
+        # GCM không đệm dữ liệu nên đầu ra luôn dài đúng bằng đầu vào
+        dst[:] = self._context.update(src)
+
+    def finalize(self):
+        self._context.finalize()
+        return self._context.tag
+
+    def verify(self, tag):
+        try:
+            self._context.finalize_with_tag(tag)
+        except InvalidTag:
+            raise ValueError("MAC check failed")
+
+
+class _ConvertedKeyCache:
+    """Khóa RsaKey đã chuyển sang đối tượng của cryptography, tự xóa khi RsaKey bị thu hồi"""
+
+    def __init__(self):
+        self._keys = {}
+
+    def get(self, key, convert):
+        key_id = id(key)
+        entry = self._keys.get(key_id)
+        if entry is None or entry[0]() is not key:
+            # RsaKey không hash được nên đánh chỉ mục theo id và dọn bằng weakref callback
+            ref = weakref.ref(key, lambda _, key_id=key_id: self._keys.pop(key_id, None))
+            entry = (ref, convert(key))
+            self._keys[key_id] = entry
+        return entry[1]
+
+
+class OpenSSLBackend(CryptoBackend):
+    """Backend dùng OpenSSL qua thư viện cryptography và hashlib"""
+
+    name = 'openssl'
+
+    def __init__(self):
+        self._private_keys = _ConvertedKeyCache()
+        self._public_keys = _ConvertedKeyCache()
+
+    def _private_key(self, key):
+        return self._private_keys.get(
+            key, lambda k: serialization.load_der_private_key(k.export_key(format='DER'), None)
+        )
+
+    def _public_key(self, key):
+        return self._public_keys.get(
+            key, lambda k: serialization.load_der_public_key(k.export_key(format='DER'))
+        )
+
+    def gcm_encrypt(self, key, nonce, data, aad=b''):
+        sealed = AESGCM(key).encrypt(nonce, bytes(data), aad or None)
+        return sealed[:-16], sealed[-16:]
+
+    def gcm_decrypt(self, key, nonce, ciphertext, tag, aad=b''):
+        try:
+            return AESGCM(key).decrypt(nonce, bytes(ciphertext) + bytes(tag), aad or None)
+        except InvalidTag:
+            raise ValueError("MAC check failed")
+
+    def _gcm_context(self, key, nonce, aad, encrypt):
+        cipher = Cipher(algorithms.AES(key), modes.GCM(nonce))
+        context = cipher.encryptor() if encrypt else cipher.decryptor()
+        if aad:
+            context.authenticate_additional_data(aad)
+        return _OpenSSLGcmStream(context)
+
+    def gcm_encryptor(self, key, nonce, aad=b''):
+        return self._gcm_context(key, nonce, aad, encrypt=True)
+
+    def gcm_decryptor(self, key, nonce, aad=b''):
+        return self._gcm_context(key, nonce, aad, encrypt=False)
+
+    def rsa_encrypt(self, public_key, data):
+        return self._public_key(public_key).encrypt(bytes(data), padding.PKCS1v15())
+
+    def rsa_decrypt(self, private_key, data):
+        try:
+            return self._private_key(private_key).decrypt(bytes(data), padding.PKCS1v15())
+        except ValueError:
+            return os.urandom(32)
+
+    def rsa_sign(self, private_key, data):
+        return self._private_key(private_key).sign(bytes(data), padding.PKCS1v15(), hashes.SHA512())
+
+    def rsa_verify(self, public_key, data, signature):
+        try:
+            self._public_key(public_key).verify(
+                bytes(signature), bytes(data), padding.PKCS1v15(), hashes.SHA512()
+            )
+            return True
+        except (InvalidSignature, ValueError, TypeError):
+            return False
+
+    def sha512(self, data=b''):
+        return hashlib.sha512(data)
+
+
+BACKENDS = {backend.name: backend for backend in (PyCryptodomeBackend(), OpenSSLBackend())}
+
+
+def _time_best(func):
+    """Thời gian tốt nhất (giây) sau BENCHMARK_ROUNDS lần chạy, đã bỏ lần khởi động"""
+    func()
+    best = float('inf')
+    for _ in range(BENCHMARK_ROUNDS):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _aes_gcm_workload(backend):
+    key, nonce, aad = os.urandom(32), os.urandom(16), os.urandom(10)
+    source = memoryview(os.urandom(BENCHMARK_DATA_SIZE))
+    target = memoryview(bytearray(BENCHMARK_DATA_SIZE))
+
+    def run():
+        # Giống luồng mã hóa chunk thật: mã hóa từng block vào buffer đích
+        stream = backend.gcm_encryptor(key, nonce, aad)
+        for start in range(0, BENCHMARK_DATA_SIZE, BENCHMARK_BLOCK_SIZE):
+            end = start + BENCHMARK_BLOCK_SIZE
+            stream.update_into(source[start:end], target[start:end])
+        stream.finalize()
+    return run
+
+
+def _rsa_workload(backend):
+    generated = rsa.generate_private_key(public_exponent=65537, key_size=BENCHMARK_RSA_KEY_SIZE)
+    private_key = RSA.import_key(generated.private_bytes(
+        serialization.Encoding.DER,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ))
+    public_key = private_key.publickey()
+    data = os.urandom(32)
+
+    def run():
+        # Thao tác khóa bí mật (ký, giải mã session key) chiếm phần lớn thời gian RSA
+        signature = backend.rsa_sign(private_key, data)
+        backend.rsa_verify(public_key, data, signature)
+        backend.rsa_decrypt(private_key, backend.rsa_encrypt(public_key, data))
+    return run
+
+
+def _sha512_workload(backend):
+    data = memoryview(os.urandom(BENCHMARK_DATA_SIZE))
+
+    def run():
+        hasher = backend.sha512()
+        for start in range(0, BENCHMARK_DATA_SIZE, BENCHMARK_BLOCK_SIZE):
+            hasher.update(data[start:start + BENCHMARK_BLOCK_SIZE])
+        hasher.digest()
+    return run
+
+
+WORKLOADS = {
+    'aes_gcm': _aes_gcm_workload,
+    'rsa': _rsa_workload,
+    'sha512': _sha512_workload,
+}
+
+
+def benchmark_primitive(primitive):
+    """
+    Đo thời gian của primitive trên từng backend
+    Args:
+        primitive (str): 'aes_gcm', 'rsa' hoặc 'sha512'
+    Returns:
+        dict: Tên backend -> thời gian tốt nhất (giây)
+    """
+    return {name: _time_best(WORKLOADS[primitive](backend)) for name, backend in BACKENDS.items()}
+
+
+_selected = {}
+_selected_lock = threading.Lock()
+
+
+def get_backend(primitive):
+    """
+    Lấy backend dùng cho primitive theo Config.CRYPTO_BACKEND
+    ('auto' chạy benchmark lần đầu và ghi nhớ kết quả cho cả process)
+    Args:
+        primitive (str): 'aes_gcm', 'rsa' hoặc 'sha512'
+    Returns:
+        CryptoBackend: Backend được chọn
+    Raises:
+        ValueError: Nếu primitive hoặc backend cấu hình không hợp lệ
+    """
+    backend = _selected.get(primitive)
+    if backend is not None:
+        return backend
+    if primitive not in PRIMITIVES:
+        raise ValueError(f"Primitive không hỗ trợ: {primitive}")
+
+    with _selected_lock:
+        backend = _selected.get(primitive)
+        if backend is None:
+            choice = Config.CRYPTO_BACKEND
+            if choice == 'auto':
+                timings = benchmark_primitive(primitive)
+                choice = min(timings, key=timings.get)
+                logger.info(
+                    f"Chọn backend {choice} cho {primitive} "
+                    f"({', '.join(f'{name}: {t * 1000:.2f} ms' for name, t in timings.items())})"
+                )
+            if choice not in BACKENDS:
+                raise ValueError(f"Backend mã hóa không hỗ trợ: {choice}")
+            backend = _selected[primitive] = BACKENDS[choice]
+    return backend
+
+
+def selected_backends():
+    """
+    Backend đang dùng cho các primitive đã được chọn
+    Returns:
+        dict: primitive -> tên backend
+    """
+    return {primitive: backend.name for primitive, backend in _selected.items()}
+
+
+def reset_backends():
+    """Xóa lựa chọn đã ghi nhớ (chọn lại ở lần dùng kế tiếp, vd sau khi đổi Config)"""
+    with _selected_lock:
+        _selected.clear()
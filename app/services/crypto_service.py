@@ -1,18 +1,48 @@
 """
 Dịch vụ mã hóa cho hệ thống gửi báo cáo tài chính
-Bao gồm: AES-GCM, RSA, SHA-512, nén zlib
+Bao gồm: AES-GCM, RSA, SHA-512, nén (zlib, bz2, lzma hoặc không nén)
 """
 
 import os
-import zlib
 import json
 import base64
+import hmac
+import time
+import struct
 import hashlib
+import threading
 from datetime import datetime
 from Crypto.PublicKey import RSA
-from Crypto.Cipher import AES, PKCS1_v1_5
 from Crypto.Hash import SHA512
-from Crypto.Signature import pkcs1_15
+from Crypto.Protocol.KDF import HKDF
+from app.config import Config
+from app.services.chunk_engine import get_chunk_engine
+from app.services.crypto_backends import get_backend
+from app.services.key_registry import key_registry
+from app.services.metrics import CRYPTO_STAGE_SECONDS
+from app.services.compression import (
+    SAMPLE_SIZE, CompressionError, choose_codec, get_codec
+)
+
+# Phiên bản định dạng gói tin dạng stream (chia chunk)
+PACKAGE_VERSION = 2
+# Kích thước chunk mặc định (dữ liệu gốc) và giới hạn tối đa chấp nhận từ người gửi
+DEFAULT_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# Kích thước block khi mã hóa/giải mã kết hợp hash (vừa bộ đệm L2 của CPU)
+FUSED_BLOCK_SIZE = 64 * 1024
+# Chế độ khóa của gói tin: envelope (session key RSA riêng mỗi file)
+# hoặc session (khóa file suy ra bằng HKDF từ bí mật phiên của kết nối)
+KEY_MODE_ENVELOPE = 'envelope'
+KEY_MODE_SESSION = 'session'
+SESSION_INIT_LABEL = b'session-init:'
+# Số thứ tự file trong phiên được đến lệch thứ tự tối đa bao nhiêu so với số lớn nhất đã nhận
+# (các file trên một kết nối mux được xử lý song song); mỗi số vẫn chỉ được dùng một lần
+FILE_COUNTER_WINDOW = 64
+
+
+class PackageVerificationError(Exception):
+    """Lỗi xác minh gói tin: chữ ký, hash, tag hoặc thứ tự chunk không hợp lệ"""
 
 
 class CryptoService:
@@ -23,6 +53,12 @@ class CryptoService:
         self.rsa_key_size = 1024  # Kích thước khóa RSA 1024-bit
         self.aes_key_size = 32    # AES-256 (32 bytes)
         self.nonce_size = 16      # Nonce 16 bytes cho AES-GCM
+        self.chunk_size = DEFAULT_CHUNK_SIZE  # Kích thước chunk khi mã hóa dạng stream
+        
+        # Backend (PyCryptodome hoặc OpenSSL) cho từng primitive, chọn theo Config.CRYPTO_BACKEND
+        self.aes_backend = get_backend('aes_gcm')
+        self.rsa_backend = get_backend('rsa')
+        self.hash_backend = get_backend('sha512')
         
     def generate_rsa_keypair(self):
         """
@@ -43,25 +79,44 @@ class CryptoService:
         """
         return os.urandom(self.aes_key_size)
     
-    def compress_data(self, data):
+    def compress_data(self, data, codec='zlib'):
         """
-        Nén dữ liệu sử dụng zlib
+        Nén dữ liệu bằng codec trong registry (mặc định zlib)
         Args:
             data (bytes): Dữ liệu cần nén
+            codec (str): Tên codec (store, zlib, zlib-1, zlib-6, zlib-9, bz2, lzma)
         Returns:
             bytes: Dữ liệu đã nén
         """
-        return zlib.compress(data)
+        return get_codec(codec).compress(data)
     
-    def decompress_data(self, compressed_data):
+    def decompress_data(self, compressed_data, codec='zlib', max_length=None):
         """
-        Giải nén dữ liệu từ zlib
+        Giải nén dữ liệu
         Args:
             compressed_data (bytes): Dữ liệu đã nén
+            codec (str): Tên codec đã dùng khi nén
+            max_length (int): Kích thước tối đa của dữ liệu gốc (None: không giới hạn)
         Returns:
             bytes: Dữ liệu gốc
+        Raises:
+            CompressionError: Nếu dữ liệu lỗi hoặc vượt giới hạn
+        """
+        return get_codec(codec).decompress(compressed_data, max_length)
+    
+    def select_codec(self, sample, codec='auto', target='throughput'):
+        """
+        Xác định codec sẽ dùng cho file
+        Args:
+            sample (bytes): Phần đầu dữ liệu file
+            codec (str): Tên codec hoặc 'auto' để tự chọn theo mẫu dữ liệu
+            target (str): Mục tiêu của chế độ auto: 'throughput' hoặc 'ratio'
+        Returns:
+            str: Tên codec
         """
-        return zlib.decompress(compressed_data)
+        if codec == 'auto':
+            return choose_codec(sample, target)
+        return get_codec(codec).name
     
     def encrypt_aes_gcm(self, data, session_key):
         """
@@ -75,11 +130,8 @@ class CryptoService:
         # Tạo nonce ngẫu nhiên
         nonce = os.urandom(self.nonce_size)
         
-        # Khởi tạo cipher AES-GCM
-        cipher = AES.new(session_key, AES.MODE_GCM, nonce=nonce)
-        
         # Mã hóa và lấy tag xác thực
-        ciphertext, tag = cipher.encrypt_and_digest(data)
+        ciphertext, tag = self.aes_backend.gcm_encrypt(session_key, nonce, data)
         
         return nonce, ciphertext, tag
     
@@ -96,14 +148,186 @@ class CryptoService:
         Raises:
             ValueError: Nếu tag không hợp lệ
         """
-        # Khởi tạo cipher với nonce
-        cipher = AES.new(session_key, AES.MODE_GCM, nonce=nonce)
-        
         # Giải mã và xác minh tag
-        plaintext = cipher.decrypt_and_verify(ciphertext, tag)
+        plaintext = self.aes_backend.gcm_decrypt(session_key, nonce, ciphertext, tag)
         
         return plaintext
     
+    def derive_chunk_nonce(self, base_nonce, index):
+        """
+        Suy ra nonce riêng cho từng chunk từ nonce gốc của gói tin
+        Args:
+            base_nonce (bytes): Nonce gốc ngẫu nhiên của gói tin
+            index (int): Số thứ tự chunk
+        Returns:
+            bytes: Nonce duy nhất cho chunk (8 byte cuối XOR với index)
+        """
+        counter = int.from_bytes(base_nonce[-8:], 'big') ^ index
+        return base_nonce[:-8] + counter.to_bytes(8, 'big')
+    
+    def chunk_aad(self, index, final, codec='zlib'):
+        """
+        Dữ liệu xác thực bổ sung (AAD) của chunk: gắn số thứ tự, cờ chunk cuối
+        và ID codec vào tag để chống đổi thứ tự, lặp lại, cắt cụt stream
+        hoặc sửa codec
+        Args:
+            index (int): Số thứ tự chunk
+            final (bool): True nếu là chunk cuối
+            codec (str): Tên codec nén của chunk
+        Returns:
+            bytes: AAD
+        """
+        return struct.pack('>Q?B', index, final, get_codec(codec).id)
+    
+    def encrypt_chunk(self, data, session_key, base_nonce, index, final, codec='zlib'):
+        """
+        Mã hóa một chunk bằng AES-GCM với nonce suy ra và AAD riêng
+        Args:
+            data (bytes): Dữ liệu chunk (đã nén)
+            session_key (bytes): Khóa phiên AES
+            base_nonce (bytes): Nonce gốc của gói tin
+            index (int): Số thứ tự chunk
+            final (bool): True nếu là chunk cuối
+            codec (str): Tên codec nén của chunk
+        Returns:
+            tuple: (nonce, ciphertext, tag)
+        """
+        nonce = self.derive_chunk_nonce(base_nonce, index)
+        ciphertext, tag = self.aes_backend.gcm_encrypt(
+            session_key, nonce, data, self.chunk_aad(index, final, codec)
+        )
+        return nonce, ciphertext, tag
+    
+    def decrypt_chunk(self, ciphertext, tag, session_key, base_nonce, index, final, codec='zlib'):
+        """
+        Giải mã một chunk AES-GCM và kiểm tra tag
+        Args:
+            ciphertext (bytes): Dữ liệu chunk đã mã hóa
+            tag (bytes): Tag xác thực của chunk
+            session_key (bytes): Khóa phiên AES
+            base_nonce (bytes): Nonce gốc của gói tin
+            index (int): Số thứ tự chunk
+            final (bool): True nếu là chunk cuối
+            codec (str): Tên codec nén của chunk
+        Returns:
+            bytes: Dữ liệu chunk đã giải mã
+        Raises:
+            ValueError: Nếu tag không hợp lệ
+        """
+        nonce = self.derive_chunk_nonce(base_nonce, index)
+        return self.aes_backend.gcm_decrypt(
+            session_key, nonce, ciphertext, tag, self.chunk_aad(index, final, codec)
+        )
+    
+    def encrypt_and_hash_chunk(self, data, session_key, base_nonce, index, final, codec='zlib'):
+        """
+        Mã hóa chunk AES-GCM và tính SHA-512(nonce || ciphertext || tag) trong một lượt:
+        mỗi block ciphertext được đưa vào hasher ngay khi vừa mã hóa (còn nằm trong cache)
+        Args:
+            data (bytes): Dữ liệu chunk (đã nén)
+            session_key (bytes): Khóa phiên AES
+            base_nonce (bytes): Nonce gốc của gói tin
+            index (int): Số thứ tự chunk
+            final (bool): True nếu là chunk cuối
+            codec (str): Tên codec nén của chunk
+        Returns:
+            tuple: (nonce, ciphertext, tag, hash hex)
+        """
+        nonce = self.derive_chunk_nonce(base_nonce, index)
+        cipher = self.aes_backend.gcm_encryptor(session_key, nonce, self.chunk_aad(index, final, codec))
+        hasher = self.hash_backend.sha512(nonce)
+        
+        source = memoryview(data)
+        ciphertext = bytearray(len(source))
+        target = memoryview(ciphertext)
+        for start in range(0, len(source), FUSED_BLOCK_SIZE):
+            block = target[start:start + FUSED_BLOCK_SIZE]
+            cipher.update_into(source[start:start + FUSED_BLOCK_SIZE], block)
+            hasher.update(block)
+        
+        tag = cipher.finalize()
+        hasher.update(tag)
+        return nonce, ciphertext, tag, hasher.hexdigest()
+    
+    def decrypt_and_hash_chunk(self, ciphertext, tag, expected_hash, session_key,
+                               base_nonce, index, final, codec='zlib', output=None):
+        """
+        Kiểm tra hash SHA-512 và giải mã chunk AES-GCM trong một lượt qua dữ liệu.
+        Dữ liệu giải mã chỉ được trả về khi cả hash và tag đều hợp lệ.
+        Args:
+            ciphertext (bytes): Dữ liệu chunk đã mã hóa
+            tag (bytes): Tag xác thực của chunk
+            expected_hash (str): Hash SHA-512 hex người gửi đã tính
+            session_key (bytes): Khóa phiên AES
+            base_nonce (bytes): Nonce gốc của gói tin
+            index (int): Số thứ tự chunk
+            final (bool): True nếu là chunk cuối
+            codec (str): Tên codec nén của chunk
+            output (bytearray): Buffer dùng lại để ghi dữ liệu giải mã (None: cấp phát mới)
+        Returns:
+            bytearray | memoryview: Dữ liệu chunk đã giải mã (memoryview trên output nếu có)
+        Raises:
+            PackageVerificationError: Nếu hash không khớp
+            ValueError: Nếu tag không hợp lệ hoặc output không đủ chỗ
+        """
+        nonce = self.derive_chunk_nonce(base_nonce, index)
+        cipher = self.aes_backend.gcm_decryptor(session_key, nonce, self.chunk_aad(index, final, codec))
+        hasher = self.hash_backend.sha512(nonce)
+        
+        source = memoryview(ciphertext)
+        if output is None:
+            plaintext = bytearray(len(source))
+            target = memoryview(plaintext)
+        else:
+            if len(output) < len(source):
+                raise ValueError("Buffer giải mã không đủ chỗ")
+            plaintext = target = memoryview(output)[:len(source)]
+        for start in range(0, len(source), FUSED_BLOCK_SIZE):
+            block = source[start:start + FUSED_BLOCK_SIZE]
+            hasher.update(block)
+            cipher.update_into(block, target[start:start + FUSED_BLOCK_SIZE])
+        
+        hasher.update(tag)
+        if not hmac.compare_digest(hasher.hexdigest(), str(expected_hash)):
+            raise PackageVerificationError(f"Hash toàn vẹn không khớp (chunk {index})")
+        cipher.verify(tag)
+        return plaintext
+    
+    def derive_file_key(self, session_secret, file_counter, metadata):
+        """
+        Suy ra khóa AES riêng cho từng file từ bí mật phiên bằng HKDF-SHA512.
+        Metadata được đưa vào context nên metadata bị sửa sẽ cho ra khóa khác
+        và chunk đầu tiên bị từ chối.
+        Args:
+            session_secret (bytes): Bí mật phiên (trao một lần mỗi kết nối)
+            file_counter (int): Số thứ tự file trong phiên
+            metadata (str): Metadata JSON của file
+        Returns:
+            bytes: Khóa AES của file
+        """
+        context = (
+            b'file-key' + file_counter.to_bytes(8, 'big')
+            + hashlib.sha512(metadata.encode('utf-8')).digest()
+        )
+        return HKDF(session_secret, self.aes_key_size, b'', SHA512, context=context)
+    
+    def metadata_mac(self, session_secret, file_counter, metadata):
+        """
+        HMAC-SHA512 xác thực metadata của file trong chế độ phiên, thay cho chữ ký RSA,
+        để người nhận tin được metadata (vd: content_digest) trước khi nhận chunk nào
+        Args:
+            session_secret (bytes): Bí mật phiên
+            file_counter (int): Số thứ tự file trong phiên
+            metadata (str): Metadata JSON của file
+        Returns:
+            str: HMAC hex
+        """
+        mac_key = HKDF(
+            session_secret, self.aes_key_size, b'', SHA512,
+            context=b'metadata-mac' + file_counter.to_bytes(8, 'big')
+        )
+        return hmac.new(mac_key, metadata.encode('utf-8'), hashlib.sha512).hexdigest()
+    
     def rsa_encrypt(self, data, public_key):
         """
         Mã hóa dữ liệu bằng RSA PKCS#1 v1.5
@@ -113,8 +337,7 @@ class CryptoService:
         Returns:
             bytes: Dữ liệu đã mã hóa
         """
-        cipher = PKCS1_v1_5.new(public_key)
-        return cipher.encrypt(data)
+        return self.rsa_backend.rsa_encrypt(public_key, data)
     
     def rsa_decrypt(self, encrypted_data, private_key):
         """
@@ -125,10 +348,8 @@ class CryptoService:
         Returns:
             bytes: Dữ liệu gốc
         """
-        cipher = PKCS1_v1_5.new(private_key)
-        # Sử dụng sentinel để xử lý lỗi giải mã
-        sentinel = os.urandom(32)
-        return cipher.decrypt(encrypted_data, sentinel)
+        # Giải mã lỗi trả về dữ liệu ngẫu nhiên (sentinel) thay vì ném lỗi padding
+        return self.rsa_backend.rsa_decrypt(private_key, encrypted_data)
     
     def sign_data(self, data, private_key):
         """
@@ -139,12 +360,7 @@ class CryptoService:
         Returns:
             bytes: Chữ ký số
         """
-        # Tạo hash SHA-512
-        h = SHA512.new(data)
-        
-        # Ký bằng RSA
-        signature = pkcs1_15.new(private_key).sign(h)
-        return signature
+        return self.rsa_backend.rsa_sign(private_key, data)
     
     def verify_signature(self, data, signature, public_key):
         """
@@ -156,15 +372,7 @@ class CryptoService:
         Returns:
             bool: True nếu chữ ký hợp lệ
         """
-        try:
-            # Tạo hash SHA-512
-            h = SHA512.new(data)
-            
-            # Xác minh chữ ký
-            pkcs1_15.new(public_key).verify(h, signature)
-            return True
-        except (ValueError, TypeError):
-            return False
+        return self.rsa_backend.rsa_verify(public_key, data, signature)
     
     def calculate_sha512_hash(self, *data_parts):
         """
@@ -174,19 +382,21 @@ class CryptoService:
         Returns:
             str: Hash hex string
         """
-        hasher = hashlib.sha512()
+        hasher = self.hash_backend.sha512()
         for part in data_parts:
             if isinstance(part, str):
                 part = part.encode('utf-8')
             hasher.update(part)
         return hasher.hexdigest()
     
-    def create_metadata(self, filename, file_type="text/plain"):
+    def create_metadata(self, filename, file_type="text/plain", content_digest=None, delta=None):
         """
         Tạo metadata cho file (tên + timestamp + loại)
         Args:
             filename (str): Tên file
             file_type (str): Loại file
+            content_digest (str): SHA-512 hex của nội dung file (đề nghị dedup), có thể bỏ qua
+            delta (dict): Thông tin bản cũ khi gửi dạng delta (DeltaPlan.metadata()), có thể bỏ qua
         Returns:
             str: Metadata JSON string
         """
@@ -195,6 +405,10 @@ class CryptoService:
             "timestamp": datetime.now().isoformat(),
             "file_type": file_type
         }
+        if content_digest:
+            metadata["content_digest"] = content_digest
+        if delta:
+            metadata["delta"] = delta
         return json.dumps(metadata, separators=(',', ':'))
     
     def encode_base64(self, data):
@@ -221,31 +435,47 @@ class CryptoService:
 class SecureFileTransfer:
     """Lớp xử lý truyền file an toàn theo đề tài 4"""
     
-    def __init__(self):
-        """Khởi tạo dịch vụ truyền file an toàn"""
+    def __init__(self, engine=None):
+        """
+        Khởi tạo dịch vụ truyền file an toàn
+        Args:
+            engine (ChunkEngine): Engine xử lý chunk song song (mặc định dùng engine chung)
+        """
         self.crypto = CryptoService()
+        self.engine = engine or get_chunk_engine()
         self.sender_private_key = None
         self.sender_public_key = None
         self.receiver_private_key = None
         self.receiver_public_key = None
         self.session_key = None
+        self.package_params = None
+        # Trạng thái phiên nhiều file (HKDF)
+        self.session_secret = None
+        self.file_counter = 0
+        self.last_file_counter = -1
+        self.used_file_counters = set()  # Số thứ tự đã dùng trong cửa sổ chống replay
+        self._counter_lock = threading.Lock()
         
-    def initialize_sender(self):
+    def initialize_sender(self, keypair=None):
         """
         Khởi tạo người gửi với cặp khóa RSA
+        Args:
+            keypair (tuple): Cặp khóa (private_key, public_key) lấy từ pool, None để sinh mới
         Returns:
             str: Public key PEM để chia sẻ với người nhận
         """
-        self.sender_private_key, self.sender_public_key = self.crypto.generate_rsa_keypair()
+        self.sender_private_key, self.sender_public_key = keypair or self.crypto.generate_rsa_keypair()
         return self.sender_public_key.export_key().decode('utf-8')
     
-    def initialize_receiver(self):
+    def initialize_receiver(self, keypair=None):
         """
         Khởi tạo người nhận với cặp khóa RSA
+        Args:
+            keypair (tuple): Cặp khóa (private_key, public_key) lấy từ pool, None để sinh mới
         Returns:
             str: Public key PEM để chia sẻ với người gửi
         """
-        self.receiver_private_key, self.receiver_public_key = self.crypto.generate_rsa_keypair()
+        self.receiver_private_key, self.receiver_public_key = keypair or self.crypto.generate_rsa_keypair()
         return self.receiver_public_key.export_key().decode('utf-8')
     
     def set_receiver_keys(self, receiver_private_key, receiver_public_key):
@@ -264,114 +494,537 @@ class SecureFileTransfer:
         Args:
             public_key_pem (str): Khóa công khai dạng PEM
         """
-        self.receiver_public_key = RSA.import_key(public_key_pem.encode('utf-8'))
+        self.receiver_public_key = key_registry.get(public_key_pem).rsa_key
+    
+    def create_session(self):
+        """
+        Tạo bí mật phiên cho nhiều file trên một kết nối (phía người gửi).
+        Chỉ tốn một lần mã hóa RSA và một lần ký cho cả phiên.
+        Returns:
+            tuple: (encrypted_secret, signature) dạng Base64
+        """
+        self.session_secret = self.crypto.generate_aes_key()
+        self.file_counter = 0
+        with CRYPTO_STAGE_SECONDS.time(stage='session_create'):
+            encrypted_secret = self.crypto.rsa_encrypt(self.session_secret, self.receiver_public_key)
+            signature = self.crypto.sign_data(SESSION_INIT_LABEL + encrypted_secret, self.sender_private_key)
+        return self.crypto.encode_base64(encrypted_secret), self.crypto.encode_base64(signature)
+    
+    def accept_session(self, encrypted_secret, signature, sender_public_key_pem):
+        """
+        Xác minh và nhận bí mật phiên từ người gửi (phía người nhận)
+        Args:
+            encrypted_secret (str): Bí mật phiên đã mã hóa RSA (Base64)
+            signature (str): Chữ ký của người gửi trên bí mật đã mã hóa (Base64)
+            sender_public_key_pem (str): Khóa công khai người gửi
+        Raises:
+            PackageVerificationError: Nếu chữ ký không hợp lệ
+        """
+        try:
+            encrypted_bytes = self.crypto.decode_base64(encrypted_secret)
+            signature_bytes = self.crypto.decode_base64(signature)
+            sender_key = key_registry.get(sender_public_key_pem)
+        except Exception as e:
+            raise PackageVerificationError(f"Lỗi xử lý: {str(e)}")
+        
+        with CRYPTO_STAGE_SECONDS.time(stage='session_accept'):
+            if not sender_key.verify(SESSION_INIT_LABEL + encrypted_bytes, signature_bytes):
+                raise PackageVerificationError("Chữ ký bí mật phiên không hợp lệ")
+            
+            self.session_secret = self.crypto.rsa_decrypt(encrypted_bytes, self.receiver_private_key)
+        with self._counter_lock:
+            self.last_file_counter = -1
+            self.used_file_counters.clear()
     
-    def prepare_file_package(self, file_path):
+    def prepare_file_package(self, file_path, chunk_size=None, codec=None, content_digest=None, delta=None):
         """
-        Chuẩn bị gói tin file theo luồng xử lý đề tài 4
+        Chuẩn bị gói tin file dạng stream theo luồng xử lý đề tài 4.
+        File được đọc, nén và mã hóa lần lượt từng chunk nên bộ nhớ sử dụng
+        không phụ thuộc kích thước file.
         Args:
             file_path (str): Đường dẫn file cần gửi
-        Returns:
-            tuple: (metadata_signature, encrypted_session_key, file_package)
+            chunk_size (int): Kích thước chunk dữ liệu gốc (mặc định theo CryptoService)
+            codec (str): Codec nén hoặc 'auto' (mặc định theo Config.COMPRESSION_CODEC)
+            content_digest (str): SHA-512 hex của nội dung file, ghi vào metadata để
+                người nhận bỏ qua việc nhận lại nội dung đã có (dedup)
+            delta (DeltaPlan): Nếu có, dữ liệu gửi đi là chuỗi lệnh delta so với bản cũ
+                của người nhận thay vì toàn bộ file (bắt buộc kèm content_digest)
+        Yields:
+            dict: Phần tử đầu tiên là header (metadata, chữ ký, session key đã mã hóa,
+                nonce gốc...), các phần tử tiếp theo là từng chunk đã mã hóa.
+                Nếu đã có phiên (create_session), header chỉ chứa số thứ tự file
+                và khóa file được suy ra bằng HKDF, không tốn thao tác RSA nào.
         """
-        # Đọc nội dung file
+        chunk_size = chunk_size or self.crypto.chunk_size
+        started = time.perf_counter()
+        
+        # Chọn codec nén (chế độ auto dựa trên phần đầu file)
         with open(file_path, 'rb') as f:
-            file_content = f.read()
+            codec = self.crypto.select_codec(
+                f.read(SAMPLE_SIZE),
+                codec or Config.COMPRESSION_CODEC,
+                Config.COMPRESSION_TARGET
+            )
         
-        # Tạo metadata và ký
         filename = os.path.basename(file_path)
-        metadata = self.crypto.create_metadata(filename)
-        metadata_signature = self.crypto.sign_data(
-            metadata.encode('utf-8'), 
-            self.sender_private_key
-        )
-        
-        # Tạo session key và mã hóa bằng RSA
-        self.session_key = self.crypto.generate_aes_key()
-        encrypted_session_key = self.crypto.rsa_encrypt(
-            self.session_key, 
-            self.receiver_public_key
+        metadata = self.crypto.create_metadata(
+            filename,
+            content_digest=content_digest,
+            delta=delta.metadata() if delta is not None else None
         )
         
-        # Nén file
-        compressed_data = self.crypto.compress_data(file_content)
-        
-        # Mã hóa file nén bằng AES-GCM
-        nonce, ciphertext, tag = self.crypto.encrypt_aes_gcm(
-            compressed_data, 
-            self.session_key
-        )
+        # Nonce gốc, nonce của từng chunk được suy ra từ nonce này
+        base_nonce = os.urandom(self.crypto.nonce_size)
         
-        # Tính hash SHA-512(nonce || ciphertext || tag)
-        file_hash = self.crypto.calculate_sha512_hash(nonce, ciphertext, tag)
+        header = {
+            "version": PACKAGE_VERSION,
+            "metadata": metadata,
+            "nonce": self.crypto.encode_base64(base_nonce),
+            "chunk_size": chunk_size,
+            "codec": codec,
+            "file_size": os.path.getsize(file_path)
+        }
         
-        # Tạo gói tin file
-        file_package = {
-            "nonce": self.crypto.encode_base64(nonce),
-            "cipher": self.crypto.encode_base64(ciphertext),
-            "tag": self.crypto.encode_base64(tag),
-            "hash": file_hash,
-            "sig": self.crypto.encode_base64(metadata_signature)
+        if self.session_secret is not None:
+            # Chế độ phiên: khóa file suy ra từ bí mật phiên và số thứ tự file
+            file_counter = self.file_counter
+            self.file_counter += 1
+            session_key = self.crypto.derive_file_key(self.session_secret, file_counter, metadata)
+            header.update({
+                "key_mode": KEY_MODE_SESSION,
+                "file_counter": file_counter,
+                "metadata_mac": self.crypto.metadata_mac(self.session_secret, file_counter, metadata)
+            })
+        else:
+            # Chế độ envelope: ký metadata và mã hóa session key riêng bằng RSA
+            metadata_signature = self.crypto.sign_data(
+                metadata.encode('utf-8'), 
+                self.sender_private_key
+            )
+            session_key = self.crypto.generate_aes_key()
+            encrypted_session_key = self.crypto.rsa_encrypt(
+                session_key, 
+                self.receiver_public_key
+            )
+            header.update({
+                "key_mode": KEY_MODE_ENVELOPE,
+                "metadata_signature": self.crypto.encode_base64(metadata_signature),
+                "encrypted_session_key": self.crypto.encode_base64(encrypted_session_key)
+            })
+        self.session_key = session_key
+        # Tham số mã hóa chunk, đủ để sinh lại các chunk khi nhận tiếp (resume_file_package)
+        self.package_params = {
+            "session_key": session_key,
+            "base_nonce": base_nonce,
+            "chunk_size": chunk_size,
+            "codec": codec
         }
+        CRYPTO_STAGE_SECONDS.observe(time.perf_counter() - started, stage='seal_header')
         
-        return (
-            self.crypto.encode_base64(metadata_signature),
-            self.crypto.encode_base64(encrypted_session_key),
-            file_package
-        )
+        yield header
+        
+        with open(file_path, 'rb') as f:
+            # Dữ liệu gốc là nội dung file, hoặc chuỗi lệnh delta nếu gửi dạng delta
+            source = delta.open_reader(f) if delta is not None else f
+            # Nén, mã hóa và tính hash các chunk song song, kết quả giữ đúng thứ tự
+            jobs = (
+                (session_key, base_nonce, index, data, final, codec)
+                for index, data, final in iter_file_chunks(source, chunk_size)
+            )
+            yield from self.engine.map(seal_chunk, jobs)
     
-    def verify_and_decrypt_package(self, metadata, metadata_signature, encrypted_session_key, file_package, sender_public_key_pem):
+    def resume_file_package(self, file_path, package_params, start_index):
         """
-        Xác minh và giải mã gói tin file (phía người nhận)
+        Sinh lại các chunk từ start_index của gói tin đã chuẩn bị trước đó (gửi tiếp sau khi mất kết nối).
+        Cùng khóa và nonce gốc nên bên gọi phải bảo đảm nội dung file không đổi,
+        nếu không AES-GCM sẽ dùng lại nonce cho dữ liệu khác.
         Args:
-            metadata (str): Metadata JSON
-            metadata_signature (str): Chữ ký metadata (Base64)
-            encrypted_session_key (str): Session key đã mã hóa (Base64)
-            file_package (dict): Gói tin file
+            file_path (str): Đường dẫn file (không hỗ trợ gói tin delta)
+            package_params (dict): self.package_params của lần prepare_file_package
+            start_index (int): Chunk đầu tiên cần gửi
+        Yields:
+            dict: Từng chunk đã mã hóa
+        """
+        session_key = package_params["session_key"]
+        base_nonce = package_params["base_nonce"]
+        chunk_size = package_params["chunk_size"]
+        codec = package_params["codec"]
+        # Người nhận đã có cả chunk cuối (chỉ thiếu file_end) thì không còn chunk nào để gửi
+        chunk_count = max(1, -(-os.path.getsize(file_path) // chunk_size))
+        if start_index >= chunk_count:
+            return
+        with open(file_path, 'rb') as f:
+            f.seek(start_index * chunk_size)
+            jobs = (
+                (session_key, base_nonce, index, data, final, codec)
+                for index, data, final in iter_file_chunks(f, chunk_size, start_index)
+            )
+            yield from self.engine.map(seal_chunk, jobs)
+    
+    def open_package(self, header, sender_public_key_pem):
+        """
+        Xác minh header của gói tin và khởi tạo bộ giải mã chunk (phía người nhận)
+        Args:
+            header (dict): Header gói tin (phần tử đầu tiên của prepare_file_package)
             sender_public_key_pem (str): Khóa công khai người gửi
         Returns:
-            tuple: (success, result) - success: bool, result: bytes hoặc error message
+            PackageDecryptor: Bộ giải mã từng chunk
+        Raises:
+            PackageVerificationError: Nếu header, chữ ký metadata hoặc số thứ tự file không hợp lệ
         """
+        started = time.perf_counter()
         try:
-            # Import khóa công khai người gửi
-            sender_public_key = RSA.import_key(sender_public_key_pem.encode('utf-8'))
+            if header.get("version") != PACKAGE_VERSION:
+                raise PackageVerificationError("Phiên bản gói tin không được hỗ trợ")
             
-            # Xác minh chữ ký metadata
-            metadata_sig_bytes = self.crypto.decode_base64(metadata_signature)
-            if not self.crypto.verify_signature(
-                metadata.encode('utf-8'), 
-                metadata_sig_bytes, 
-                sender_public_key
-            ):
-                return False, "Chữ ký metadata không hợp lệ"
+            chunk_size = int(header["chunk_size"])
+            if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+                raise PackageVerificationError("Kích thước chunk không hợp lệ")
+            get_codec(header["codec"])
             
-            # Giải mã session key (sử dụng private key của receiver)
-            encrypted_key_bytes = self.crypto.decode_base64(encrypted_session_key)
-            session_key = self.crypto.rsa_decrypt(encrypted_key_bytes, self.receiver_private_key)
+            metadata = header["metadata"]
+            key_mode = header.get("key_mode", KEY_MODE_ENVELOPE)
             
-            # Giải mã các thành phần từ Base64
-            nonce = self.crypto.decode_base64(file_package["nonce"])
-            ciphertext = self.crypto.decode_base64(file_package["cipher"])
-            tag = self.crypto.decode_base64(file_package["tag"])
-            received_hash = file_package["hash"]
-            
-            # Kiểm tra hash toàn vẹn
-            calculated_hash = self.crypto.calculate_sha512_hash(nonce, ciphertext, tag)
-            if received_hash != calculated_hash:
-                return False, "Hash toàn vẹn không khớp"
-            
-            # Giải mã AES-GCM
-            try:
-                decrypted_compressed = self.crypto.decrypt_aes_gcm(
-                    nonce, ciphertext, tag, session_key
-                )
-            except ValueError:
-                return False, "Tag AES-GCM không hợp lệ"
-            
-            # Giải nén dữ liệu
-            original_data = self.crypto.decompress_data(decrypted_compressed)
-            
-            return True, original_data
+            if key_mode == KEY_MODE_SESSION:
+                # Chế độ phiên: suy ra khóa file, mỗi số thứ tự file chỉ dùng một lần (chống replay)
+                if self.session_secret is None:
+                    raise PackageVerificationError("Chưa khởi tạo phiên")
+                file_counter = int(header["file_counter"])
+                if file_counter < 0:
+                    raise PackageVerificationError("Số thứ tự file không hợp lệ")
+                expected_mac = self.crypto.metadata_mac(self.session_secret, file_counter, metadata)
+                if not hmac.compare_digest(expected_mac, str(header["metadata_mac"])):
+                    raise PackageVerificationError("MAC metadata không hợp lệ")
+                self._use_file_counter(file_counter)
+                session_key = self.crypto.derive_file_key(self.session_secret, file_counter, metadata)
+            elif key_mode == KEY_MODE_ENVELOPE:
+                # Lấy khóa công khai người gửi đã parse sẵn từ registry
+                sender_key = key_registry.get(sender_public_key_pem)
+                
+                # Xác minh chữ ký metadata
+                metadata_sig_bytes = self.crypto.decode_base64(header["metadata_signature"])
+                if not sender_key.verify(metadata.encode('utf-8'), metadata_sig_bytes):
+                    raise PackageVerificationError("Chữ ký metadata không hợp lệ")
+                
+                # Giải mã session key (sử dụng private key của receiver)
+                encrypted_key_bytes = self.crypto.decode_base64(header["encrypted_session_key"])
+                session_key = self.crypto.rsa_decrypt(encrypted_key_bytes, self.receiver_private_key)
+            else:
+                raise PackageVerificationError(f"Chế độ khóa không hỗ trợ: {key_mode}")
             
+            base_nonce = self.crypto.decode_base64(header["nonce"])
+        except PackageVerificationError:
+            raise
         except Exception as e:
-            return False, f"Lỗi xử lý: {str(e)}"
+            raise PackageVerificationError(f"Lỗi xử lý: {str(e)}")
+        
+        CRYPTO_STAGE_SECONDS.observe(time.perf_counter() - started, stage='open_header')
+        return PackageDecryptor(session_key, base_nonce, chunk_size)
+    
+    def _use_file_counter(self, file_counter):
+        """
+        Đánh dấu số thứ tự file đã dùng (có thể được gọi song song từ nhiều thread)
+        Args:
+            file_counter (int): Số thứ tự file trong header
+        Raises:
+            PackageVerificationError: Nếu số đã dùng hoặc cũ hơn cửa sổ FILE_COUNTER_WINDOW
+        """
+        with self._counter_lock:
+            floor = self.last_file_counter - FILE_COUNTER_WINDOW
+            if file_counter <= floor or file_counter in self.used_file_counters:
+                raise PackageVerificationError("Số thứ tự file trong phiên đã được sử dụng")
+            self.used_file_counters.add(file_counter)
+            if file_counter > self.last_file_counter:
+                self.last_file_counter = file_counter
+                floor = file_counter - FILE_COUNTER_WINDOW
+                self.used_file_counters = {used for used in self.used_file_counters if used > floor}
+    
+    def verify_and_decrypt_package(self, package_parts, sender_public_key_pem):
+        """
+        Xác minh và giải mã gói tin file dạng stream (phía người nhận).
+        Mỗi chunk được kiểm tra ngay khi tới, chunk lỗi bị từ chối lập tức.
+        Args:
+            package_parts (iterable): Header rồi tới các chunk (như prepare_file_package)
+            sender_public_key_pem (str): Khóa công khai người gửi
+        Yields:
+            bytes: Dữ liệu gốc của từng chunk
+        Raises:
+            PackageVerificationError: Nếu chữ ký, hash, tag hoặc thứ tự chunk không hợp lệ
+        """
+        parts = iter(package_parts)
+        header = next(parts, None)
+        if header is None:
+            raise PackageVerificationError("Gói tin rỗng")
+        
+        decryptor = self.open_package(header, sender_public_key_pem)
+        
+        def jobs():
+            # Thứ tự chunk được kiểm tra tuần tự trước khi giao cho worker
+            for chunk in parts:
+                decryptor.check_sequence(chunk)
+                yield decryptor.session_key, decryptor.base_nonce, decryptor.chunk_size, chunk
+        
+        yield from self.engine.map(open_chunk, jobs())
+        decryptor.finish()
+
+
+class PackageDecryptor:
+    """Giải mã tuần tự từng chunk của một gói tin dạng stream"""
+    
+    def __init__(self, session_key, base_nonce, chunk_size):
+        """
+        Khởi tạo bộ giải mã
+        Args:
+            session_key (bytes): Khóa phiên AES đã giải mã
+            base_nonce (bytes): Nonce gốc của gói tin
+            chunk_size (int): Kích thước tối đa của một chunk dữ liệu gốc
+        """
+        self.session_key = session_key
+        self.base_nonce = base_nonce
+        self.chunk_size = chunk_size
+        self.next_index = 0
+        self.complete = False
+    
+    def check_sequence(self, chunk):
+        """
+        Kiểm tra số thứ tự của chunk và cập nhật trạng thái stream
+        Args:
+            chunk (dict): Chunk đã mã hóa
+        Raises:
+            PackageVerificationError: Nếu chunk sai thứ tự hoặc tới sau chunk cuối
+        """
+        if self.complete:
+            raise PackageVerificationError("Nhận chunk sau chunk cuối")
+        
+        index = chunk.get("index") if isinstance(chunk, dict) else None
+        if index != self.next_index:
+            raise PackageVerificationError(f"Sai thứ tự chunk: nhận {index}, cần {self.next_index}")
+        
+        self.next_index += 1
+        self.complete = bool(chunk.get("final"))
+    
+    def decrypt_chunk(self, chunk):
+        """
+        Kiểm tra thứ tự, hash, tag và giải mã một chunk
+        Args:
+            chunk (dict): Chunk đã mã hóa
+        Returns:
+            bytes: Dữ liệu gốc của chunk
+        Raises:
+            PackageVerificationError: Nếu chunk không hợp lệ
+        """
+        self.check_sequence(chunk)
+        return open_chunk(self.session_key, self.base_nonce, self.chunk_size, chunk)
+    
+    def decrypt_chunk_to(self, chunk, buffer, write):
+        """
+        Kiểm tra thứ tự, hash, tag rồi giải mã chunk vào buffer và ghi dữ liệu gốc qua write()
+        Args:
+            chunk (dict): Chunk đã mã hóa
+            buffer (bytearray): Buffer giải mã dùng lại giữa các chunk
+            write: Hàm nhận từng phần dữ liệu gốc
+        Returns:
+            int: Số byte dữ liệu gốc đã ghi
+        Raises:
+            PackageVerificationError: Nếu chunk không hợp lệ
+        """
+        self.check_sequence(chunk)
+        return open_chunk_to(self.session_key, self.base_nonce, self.chunk_size, chunk, buffer, write)
+    
+    def finish(self):
+        """
+        Kiểm tra gói tin đã nhận đủ tới chunk cuối
+        Raises:
+            PackageVerificationError: Nếu stream bị cắt cụt
+        """
+        if not self.complete:
+            raise PackageVerificationError("Gói tin bị cắt cụt (thiếu chunk cuối)")
+
+
+def file_content_digest(file_path, block_size=DEFAULT_CHUNK_SIZE):
+    """
+    Tính SHA-512 của nội dung file (đọc từng block, không nạp cả file vào bộ nhớ)
+    Args:
+        file_path (str): Đường dẫn file
+        block_size (int): Kích thước mỗi lần đọc
+    Returns:
+        str: Hash hex
+    """
+    hasher = get_backend('sha512').sha512()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def iter_file_chunks(file_obj, chunk_size, start_index=0):
+    """
+    Đọc file theo từng chunk, biết trước chunk nào là chunk cuối
+    Args:
+        file_obj: File mở ở chế độ nhị phân
+        chunk_size (int): Kích thước chunk
+        start_index (int): Số thứ tự của chunk đọc đầu tiên
+    Yields:
+        tuple: (index, data, final)
+    """
+    index = start_index
+    current = file_obj.read(chunk_size)
+    while True:
+        following = file_obj.read(chunk_size)
+        final = not following
+        yield index, current, final
+        if final:
+            return
+        current = following
+        index += 1
+
+
+_chunk_crypto = None
+_chunk_crypto_lock = threading.Lock()
+
+
+def chunk_crypto():
+    """
+    CryptoService dùng chung cho các hàm xử lý chunk (mỗi process một instance, thay vì tạo mới mỗi chunk).
+    Tạo lại nếu backend đã được chọn lại (reset_backends)
+    Returns:
+        CryptoService: Instance dùng chung
+    """
+    global _chunk_crypto
+    crypto = _chunk_crypto
+    if crypto is not None and _uses_selected_backends(crypto):
+        return crypto
+    with _chunk_crypto_lock:
+        if _chunk_crypto is None or not _uses_selected_backends(_chunk_crypto):
+            _chunk_crypto = CryptoService()
+        return _chunk_crypto
+
+
+def _uses_selected_backends(crypto):
+    return crypto.aes_backend is get_backend('aes_gcm') and crypto.hash_backend is get_backend('sha512')
+
+
+def seal_chunk(session_key, base_nonce, index, data, final, codec='zlib'):
+    """
+    Nén, mã hóa AES-GCM và tính hash một chunk.
+    Hàm độc lập (không giữ trạng thái) để có thể chạy song song trên thread/process worker.
+    Args:
+        session_key (bytes): Khóa phiên AES
+        base_nonce (bytes): Nonce gốc của gói tin
+        index (int): Số thứ tự chunk
+        data (bytes): Dữ liệu gốc của chunk
+        final (bool): True nếu là chunk cuối
+        codec (str): Codec nén của gói tin
+    Returns:
+        dict: Chunk đã mã hóa ('cipher', 'tag' dạng bytes, lớp truyền tải tự mã hóa khi cần)
+    """
+    crypto = chunk_crypto()
+    
+    # Nén chunk, chunk nén không nhỏ hơn thì lưu nguyên (store)
+    with CRYPTO_STAGE_SECONDS.time(stage='compress'):
+        compressed_data = crypto.compress_data(data, codec)
+    if codec != 'store' and len(compressed_data) >= len(data):
+        codec, compressed_data = 'store', data
+    
+    # Mã hóa chunk bằng AES-GCM, đồng thời tính hash SHA-512(nonce || ciphertext || tag)
+    with CRYPTO_STAGE_SECONDS.time(stage='encrypt'):
+        nonce, ciphertext, tag, chunk_hash = crypto.encrypt_and_hash_chunk(
+            compressed_data, session_key, base_nonce, index, final, codec
+        )
+    
+    return {
+        "index": index,
+        "cipher": ciphertext,
+        "tag": tag,
+        "hash": chunk_hash,
+        "codec": codec,
+        "final": final
+    }
+
+
+def _unseal_chunk(session_key, base_nonce, chunk_size, chunk, output=None):
+    """
+    Kiểm tra định dạng, hash, tag và giải mã một chunk (chưa giải nén)
+    Returns:
+        tuple: (index, codec, dữ liệu đã giải mã còn nén)
+    Raises:
+        PackageVerificationError: Nếu chunk không hợp lệ
+    """
+    crypto = chunk_crypto()
+    
+    try:
+        index = chunk["index"]
+        final = bool(chunk["final"])
+        ciphertext = chunk["cipher"]
+        tag = chunk["tag"]
+        received_hash = chunk["hash"]
+        codec = get_codec(chunk["codec"]).name
+        if not isinstance(ciphertext, (bytes, bytearray, memoryview)) or not isinstance(tag, bytes):
+            raise TypeError("cipher/tag phải là bytes")
+    except Exception as e:
+        raise PackageVerificationError(f"Chunk không đúng định dạng: {str(e)}")
+    
+    # Người gửi lưu nguyên (store) khi nén không nhỏ hơn nên ciphertext không vượt chunk_size
+    if len(ciphertext) > chunk_size:
+        raise PackageVerificationError(f"Chunk {index} vượt quá kích thước cho phép")
+    
+    # Kiểm tra hash toàn vẹn và giải mã AES-GCM trong một lượt qua dữ liệu
+    try:
+        with CRYPTO_STAGE_SECONDS.time(stage='decrypt'):
+            decrypted_compressed = crypto.decrypt_and_hash_chunk(
+                ciphertext, tag, received_hash, session_key, base_nonce, index, final, codec,
+                output=output
+            )
+    except ValueError:
+        raise PackageVerificationError(f"Tag AES-GCM không hợp lệ (chunk {index})")
+    return index, codec, decrypted_compressed
+
+
+def open_chunk(session_key, base_nonce, chunk_size, chunk):
+    """
+    Kiểm tra hash, tag, giải mã và giải nén một chunk (không kiểm tra thứ tự).
+    Hàm độc lập để có thể chạy song song trên thread/process worker.
+    Args:
+        session_key (bytes): Khóa phiên AES
+        base_nonce (bytes): Nonce gốc của gói tin
+        chunk_size (int): Kích thước tối đa của một chunk dữ liệu gốc
+        chunk (dict): Chunk đã mã hóa ('cipher' bytes hoặc memoryview, 'tag' bytes)
+    Returns:
+        bytes: Dữ liệu gốc của chunk
+    Raises:
+        PackageVerificationError: Nếu chunk không hợp lệ
+    """
+    index, codec, decrypted_compressed = _unseal_chunk(session_key, base_nonce, chunk_size, chunk)
+    
+    # Giải nén dữ liệu, giới hạn theo kích thước chunk để chống decompression bomb
+    try:
+        with CRYPTO_STAGE_SECONDS.time(stage='decompress'):
+            return chunk_crypto().decompress_data(decrypted_compressed, codec, max_length=chunk_size)
+    except CompressionError as e:
+        raise PackageVerificationError(f"Lỗi giải nén chunk {index}: {str(e)}")
+
+
+def open_chunk_to(session_key, base_nonce, chunk_size, chunk, buffer, write):
+    """
+    Như open_chunk nhưng giải mã vào buffer dùng lại và giải nén tăng dần ra write(),
+    không cấp phát bộ nhớ theo kích thước chunk cho mỗi lần gọi
+    Args:
+        session_key (bytes): Khóa phiên AES
+        base_nonce (bytes): Nonce gốc của gói tin
+        chunk_size (int): Kích thước tối đa của một chunk dữ liệu gốc
+        chunk (dict): Chunk đã mã hóa
+        buffer (bytearray): Buffer giải mã, dài ít nhất chunk_size
+        write: Hàm nhận từng phần dữ liệu gốc (vd: file.write)
+    Returns:
+        int: Số byte dữ liệu gốc đã ghi
+    Raises:
+        PackageVerificationError: Nếu chunk không hợp lệ
+    """
+    index, codec, decrypted_compressed = _unseal_chunk(
+        session_key, base_nonce, chunk_size, chunk, output=buffer
+    )
+    try:
+        with CRYPTO_STAGE_SECONDS.time(stage='decompress'):
+            return get_codec(codec).decompress_to(decrypted_compressed, write, max_length=chunk_size)
+    except CompressionError as e:
+        raise PackageVerificationError(f"Lỗi giải nén chunk {index}: {str(e)}")
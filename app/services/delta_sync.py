@@ -0,0 +1,400 @@
+"""
+Truyền delta kiểu rsync cho phiên bản mới của file đã gửi trước đó
+- Người nhận chia bản cũ thành các block, gửi checksum yếu (Adler-32, cuộn được) và mạnh
+  (SHA-512 cắt 16 byte) của từng block
+- Người gửi dò bản mới bằng checksum cuộn, tạo chuỗi lệnh: sao chép block của bản cũ
+  hoặc dữ liệu mới (literal). Chuỗi lệnh này là dữ liệu gốc được nén/mã hóa theo chunk
+  như file bình thường
+- Người nhận áp chuỗi lệnh lên bản cũ để dựng lại bản mới
+"""
+
+import os
+import math
+import mmap
+import base64
+import struct
+import hashlib
+import zlib
+
+# Kích thước block: khoảng căn bậc hai kích thước file, trong giới hạn dưới đây
+MIN_BLOCK_SIZE = 2 * 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+# Số block tối đa để message chữ ký vừa giới hạn kích thước message WebSocket
+MAX_SIGNATURE_BLOCKS = 16 * 1024
+STRONG_DIGEST_SIZE = 16
+SIGNATURE_ENTRY = struct.Struct('>I16s')
+
+# Lệnh trong chuỗi delta: 'C' + block đầu + số block; 'L' + độ dài + dữ liệu
+OP_COPY = b'C'
+OP_LITERAL = b'L'
+COPY_ARGS = struct.Struct('>QI')
+LITERAL_ARGS = struct.Struct('>I')
+MAX_LITERAL_OP = 1024 * 1024
+IO_BLOCK_SIZE = 64 * 1024
+
+# Bỏ delta (gửi cả file) nếu phải dò quá nhiều byte liên tiếp không khớp
+# hoặc phần literal chiếm quá tỷ lệ này của file
+MAX_UNMATCHED_SCAN = 2 * 1024 * 1024
+MAX_LITERAL_RATIO = 0.5
+
+_ADLER_MOD = 65521
+
+
+class DeltaError(ValueError):
+    """Chữ ký hoặc chuỗi lệnh delta không hợp lệ"""
+
+
+def choose_block_size(file_size):
+    """
+    Chọn kích thước block cho bản cũ
+    Args:
+        file_size (int): Kích thước bản cũ
+    Returns:
+        int: Kích thước block (bội số của 1 KB)
+    """
+    size = max(MIN_BLOCK_SIZE, math.isqrt(file_size), -(-file_size // MAX_SIGNATURE_BLOCKS))
+    size = -(-size // 1024) * 1024
+    return min(size, MAX_BLOCK_SIZE)
+
+
+def strong_digest(block):
+    """Checksum mạnh của block: SHA-512 cắt 16 byte"""
+    return hashlib.sha512(block).digest()[:STRONG_DIGEST_SIZE]
+
+
+class BlockSignature:
+    """Chữ ký các block của bản cũ"""
+
+    def __init__(self, block_size, basis_size, basis_digest, entries):
+        """
+        Args:
+            block_size (int): Kích thước block
+            basis_size (int): Kích thước bản cũ
+            basis_digest (str): SHA-512 hex của bản cũ
+            entries (list): (checksum yếu, checksum mạnh) của từng block theo thứ tự
+        """
+        self.block_size = block_size
+        self.basis_size = basis_size
+        self.basis_digest = basis_digest
+        self.entries = entries
+        self._table = None
+
+    @property
+    def block_count(self):
+        return len(self.entries)
+
+    def to_message(self):
+        """
+        Đóng gói chữ ký để gửi trong message JSON
+        Returns:
+            dict: block_size, basis_size, basis_digest, signatures (Base64)
+        """
+        packed = b''.join(SIGNATURE_ENTRY.pack(weak, strong) for weak, strong in self.entries)
+        return {
+            'block_size': self.block_size,
+            'basis_size': self.basis_size,
+            'basis_digest': self.basis_digest,
+            'signatures': base64.b64encode(packed).decode('ascii')
+        }
+
+    @classmethod
+    def from_message(cls, message):
+        """
+        Đọc chữ ký từ message JSON
+        Args:
+            message (dict): Message do to_message tạo
+        Returns:
+            BlockSignature: Chữ ký
+        Raises:
+            DeltaError: Nếu chữ ký không hợp lệ
+        """
+        try:
+            block_size = int(message['block_size'])
+            basis_size = int(message['basis_size'])
+            basis_digest = str(message['basis_digest'])
+            packed = base64.b64decode(message['signatures'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise DeltaError(f"Chữ ký delta không đúng định dạng: {e}")
+        if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE or basis_size < 0:
+            raise DeltaError("Kích thước block không hợp lệ")
+        if len(packed) % SIGNATURE_ENTRY.size or len(packed) // SIGNATURE_ENTRY.size != -(-basis_size // block_size):
+            raise DeltaError("Số block trong chữ ký không khớp kích thước bản cũ")
+        return cls(block_size, basis_size, basis_digest, list(SIGNATURE_ENTRY.iter_unpack(packed)))
+
+    def block_length(self, index):
+        """Độ dài thực của block (block cuối có thể ngắn hơn)"""
+        return min(self.block_size, self.basis_size - index * self.block_size)
+
+    def table(self):
+        """Bảng checksum yếu -> các block đầy đủ có checksum đó (dựng khi dùng lần đầu)"""
+        if self._table is None:
+            self._table = {}
+            for index, (weak, _) in enumerate(self.entries):
+                if self.block_length(index) == self.block_size:
+                    self._table.setdefault(weak, []).append(index)
+        return self._table
+
+
+def compute_signature(file_obj, block_size=None):
+    """
+    Tính chữ ký các block của bản cũ (đọc tuần tự một lượt)
+    Args:
+        file_obj: File bản cũ mở ở chế độ nhị phân
+        block_size (int): Kích thước block (mặc định chọn theo kích thước file)
+    Returns:
+        BlockSignature: Chữ ký
+    """
+    basis_size = os.fstat(file_obj.fileno()).st_size
+    block_size = block_size or choose_block_size(basis_size)
+    file_obj.seek(0)
+    hasher = hashlib.sha512()
+    entries = []
+    for block in iter(lambda: file_obj.read(block_size), b''):
+        hasher.update(block)
+        entries.append((zlib.adler32(block), strong_digest(block)))
+    return BlockSignature(block_size, basis_size, hasher.hexdigest(), entries)
+
+
+class DeltaPlan:
+    """Kết quả so bản mới với chữ ký bản cũ: chuỗi lệnh sao chép / literal"""
+
+    def __init__(self, signature, ops, target_size):
+        """
+        Args:
+            signature (BlockSignature): Chữ ký bản cũ
+            ops (list): ('copy', block đầu, số block) hoặc ('literal', offset trong bản mới, độ dài)
+            target_size (int): Kích thước bản mới
+        """
+        self.signature = signature
+        self.ops = ops
+        self.target_size = target_size
+        self.literal_bytes = sum(op[2] for op in ops if op[0] == 'literal')
+
+    def metadata(self):
+        """Thông tin delta ghi vào metadata gói tin"""
+        return {
+            'basis_digest': self.signature.basis_digest,
+            'block_size': self.signature.block_size,
+            'literal_bytes': self.literal_bytes
+        }
+
+    def iter_stream(self, data):
+        """
+        Sinh chuỗi lệnh delta đã mã hóa nhị phân
+        Args:
+            data: Nội dung bản mới (bytes hoặc mmap)
+        Yields:
+            bytes: Từng phần của chuỗi lệnh
+        """
+        for kind, first, length in self.ops:
+            if kind == 'copy':
+                yield OP_COPY + COPY_ARGS.pack(first, length)
+                continue
+            for start in range(first, first + length, MAX_LITERAL_OP):
+                piece = data[start:min(start + MAX_LITERAL_OP, first + length)]
+                yield OP_LITERAL + LITERAL_ARGS.pack(len(piece))
+                yield piece
+
+    def open_reader(self, file_obj):
+        """
+        Đọc chuỗi lệnh delta như một file (dùng với iter_file_chunks)
+        Args:
+            file_obj: File bản mới mở ở chế độ nhị phân
+        Returns:
+            StreamReader: Đối tượng có read(n)
+        """
+        def pieces():
+            with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from self.iter_stream(data)
+        return StreamReader(pieces())
+
+
+class StreamReader:
+    """Bọc iterator các đoạn bytes thành đối tượng có read(n)"""
+
+    def __init__(self, pieces):
+        self._pieces = iter(pieces)
+        self._buffer = bytearray()
+
+    def read(self, size):
+        while len(self._buffer) < size:
+            piece = next(self._pieces, None)
+            if piece is None:
+                break
+            self._buffer += piece
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def compute_delta(file_obj, signature):
+    """
+    So bản mới với chữ ký bản cũ bằng checksum cuộn
+    Args:
+        file_obj: File bản mới mở ở chế độ nhị phân
+        signature (BlockSignature): Chữ ký bản cũ
+    Returns:
+        DeltaPlan: Chuỗi lệnh, hoặc None nếu delta không có lợi (nên gửi cả file)
+    """
+    target_size = os.fstat(file_obj.fileno()).st_size
+    if target_size == 0 or signature.block_count == 0:
+        return None
+    with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        ops = _match_blocks(data, signature)
+    if ops is None:
+        return None
+    plan = DeltaPlan(signature, ops, target_size)
+    if plan.literal_bytes > target_size * MAX_LITERAL_RATIO:
+        return None
+    return plan
+
+
+def _match_blocks(data, signature):
+    """Dò các block của bản cũ trong bản mới; trả về danh sách lệnh hoặc None nếu bỏ cuộc"""
+    block_size = signature.block_size
+    table = signature.table()
+    entries = signature.entries
+    size = len(data)
+    ops = []
+
+    def add_literal(start, end):
+        if end > start:
+            ops.append(('literal', start, end - start))
+
+    def add_copy(index):
+        last = ops[-1] if ops else None
+        if last and last[0] == 'copy' and last[1] + last[2] == index:
+            ops[-1] = ('copy', last[1], last[2] + 1)
+        else:
+            ops.append(('copy', index, 1))
+
+    literal_start = pos = 0
+    weak = None
+    while pos + block_size <= size:
+        if weak is None:
+            # Đầu block mới: tính checksum trực tiếp (C), sau đó chỉ cuộn từng byte
+            weak = zlib.adler32(data[pos:pos + block_size])
+            a, b = weak & 0xffff, weak >> 16
+        candidates = table.get(weak)
+        if candidates:
+            strong = strong_digest(data[pos:pos + block_size])
+            match = next((index for index in candidates if entries[index][1] == strong), None)
+            if match is not None:
+                add_literal(literal_start, pos)
+                add_copy(match)
+                pos += block_size
+                literal_start = pos
+                weak = None
+                continue
+        if pos + block_size >= size:
+            break
+        if pos - literal_start >= MAX_UNMATCHED_SCAN:
+            return None
+        outgoing, incoming = data[pos], data[pos + block_size]
+        a = (a - outgoing + incoming) % _ADLER_MOD
+        b = (b - block_size * outgoing + a - 1) % _ADLER_MOD
+        weak = a | (b << 16)
+        pos += 1
+
+    # Block cuối của bản cũ có thể ngắn hơn block_size, chỉ khớp ở cuối bản mới
+    tail_index = signature.block_count - 1
+    tail_length = signature.block_length(tail_index)
+    tail_start = size - tail_length
+    if (tail_length < block_size and tail_start >= literal_start
+            and strong_digest(data[tail_start:]) == entries[tail_index][1]):
+        add_literal(literal_start, tail_start)
+        add_copy(tail_index)
+    else:
+        add_literal(literal_start, size)
+    return ops
+
+
+class DeltaPatcher:
+    """Áp chuỗi lệnh delta (nhận từng phần tùy ý) lên bản cũ, ghi bản mới qua write()"""
+
+    def __init__(self, basis_file, signature, write, max_output):
+        """
+        Args:
+            basis_file: File bản cũ (mở nhị phân, chỉ đọc bằng pread)
+            signature (BlockSignature): Chữ ký bản cũ do chính người nhận tính
+            write: Hàm nhận từng phần dữ liệu bản mới
+            max_output (int): Kích thước tối đa của bản mới
+        """
+        self.basis_fd = basis_file.fileno()
+        self.signature = signature
+        self.write = write
+        self.max_output = max_output
+        self.output_size = 0
+        self._header = bytearray()
+        self._literal_left = 0
+
+    def _emit(self, data):
+        self.output_size += len(data)
+        if self.output_size > self.max_output:
+            raise DeltaError("Bản dựng lại vượt quá kích thước khai báo")
+        self.write(data)
+
+    def _copy(self, first, count):
+        signature = self.signature
+        if count < 1 or first + count > signature.block_count:
+            raise DeltaError("Lệnh sao chép block nằm ngoài bản cũ")
+        offset = first * signature.block_size
+        end = min((first + count) * signature.block_size, signature.basis_size)
+        if self.output_size + end - offset > self.max_output:
+            raise DeltaError("Bản dựng lại vượt quá kích thước khai báo")
+        while offset < end:
+            data = os.pread(self.basis_fd, min(IO_BLOCK_SIZE, end - offset), offset)
+            if not data:
+                raise DeltaError("Bản cũ bị thay đổi khi đang dựng lại")
+            self._emit(data)
+            offset += len(data)
+
+    def feed(self, data):
+        """
+        Xử lý thêm một phần chuỗi lệnh
+        Args:
+            data (bytes | memoryview): Phần tiếp theo của chuỗi lệnh
+        Raises:
+            DeltaError: Nếu chuỗi lệnh không hợp lệ
+        """
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view):
+            if self._literal_left:
+                length = min(self._literal_left, len(view) - pos)
+                self._emit(view[pos:pos + length])
+                self._literal_left -= length
+                pos += length
+                continue
+
+            # Phần đầu lệnh (mã lệnh + tham số) có thể bị chia ra nhiều lần feed
+            if self._header:
+                op = bytes(self._header[:1])
+            else:
+                op = bytes(view[pos:pos + 1])
+                if op not in (OP_COPY, OP_LITERAL):
+                    raise DeltaError("Lệnh delta không hợp lệ")
+            needed = 1 + (COPY_ARGS.size if op == OP_COPY else LITERAL_ARGS.size)
+            take = min(needed - len(self._header), len(view) - pos)
+            self._header += view[pos:pos + take]
+            pos += take
+            if len(self._header) < needed:
+                continue
+
+            if op == OP_COPY:
+                self._copy(*COPY_ARGS.unpack_from(self._header, 1))
+            else:
+                (self._literal_left,) = LITERAL_ARGS.unpack_from(self._header, 1)
+            self._header.clear()
+
+    def finish(self):
+        """
+        Kiểm tra chuỗi lệnh kết thúc trọn vẹn
+        Returns:
+            int: Kích thước bản mới
+        Raises:
+            DeltaError: Nếu chuỗi lệnh bị cắt cụt
+        """
+        if self._header or self._literal_left:
+            raise DeltaError("Chuỗi lệnh delta bị cắt cụt")
+        return self.output_size
@@ -0,0 +1,194 @@
+"""
+Pool cặp khóa RSA sinh sẵn cho bước trao đổi khóa
+Khóa được sinh nền trong process worker, lấy khóa có sẵn chỉ tốn O(1)
+"""
+
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from Crypto.PublicKey import RSA
+from app.config import Config
+from app.services.crypto_service import CryptoService
+
+logger = logging.getLogger(__name__)
+
+
+def generate_private_key_der(key_size):
+    """
+    Sinh khóa RSA và trả về dạng DER (chạy trong worker nên phải pickle được)
+    Args:
+        key_size (int): Kích thước khóa (bit)
+    Returns:
+        bytes: Private key dạng DER
+    """
+    return RSA.generate(key_size).export_key(format='DER')
+
+
+class RSAKeyPool:
+    """Pool giữ sẵn một số cặp khóa RSA mới, tự bổ sung nền khi bị lấy bớt"""
+
+    def __init__(self, size=8, key_size=1024, workers=1, executor='process'):
+        """
+        Khởi tạo pool
+        Args:
+            size (int): Số cặp khóa giữ sẵn
+            key_size (int): Kích thước khóa RSA (bit)
+            workers (int): Số worker sinh khóa
+            executor (str): 'process' hoặc 'thread'
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Loại executor không hỗ trợ: {executor}")
+        self.size = size
+        self.key_size = key_size
+        self.workers = max(1, workers)
+        self.executor_type = executor
+        self._keys = deque()
+        self._pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def _get_executor(self):
+        """Khởi tạo executor sinh khóa khi dùng lần đầu (gọi khi đang giữ lock)"""
+        if self._executor is None:
+            if self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='rsa-keygen'
+                )
+        return self._executor
+
+    def start(self):
+        """Bắt đầu sinh khóa nền để lấp đầy pool"""
+        self._refill()
+
+    def _refill(self):
+        """Gửi yêu cầu sinh khóa cho phần còn thiếu của pool"""
+        with self._lock:
+            if self._closed:
+                return
+            missing = self.size - len(self._keys) - self._pending
+            if missing <= 0:
+                return
+            executor = self._get_executor()
+            self._pending += missing
+        for _ in range(missing):
+            future = executor.submit(generate_private_key_der, self.key_size)
+            future.add_done_callback(self._on_generated)
+
+    def _on_generated(self, future):
+        """Nhận khóa vừa sinh từ worker và đưa vào pool"""
+        keypair = None
+        try:
+            private_key = RSA.import_key(future.result())
+            keypair = (private_key, private_key.publickey())
+        except Exception as e:
+            if not future.cancelled():
+                logger.error(f"Lỗi sinh khóa RSA nền: {e}")
+        with self._lock:
+            self._pending -= 1
+            if keypair is not None:
+                self._keys.append(keypair)
+                self.generated += 1
+
+    def try_acquire(self):
+        """
+        Lấy ngay một cặp khóa có sẵn và kích hoạt bổ sung nền
+        Returns:
+            tuple: (private_key, public_key) hoặc None nếu pool rỗng (miss)
+        """
+        with self._lock:
+            if self._keys:
+                keypair = self._keys.popleft()
+                self.hits += 1
+            else:
+                keypair = None
+                self.misses += 1
+        self._refill()
+        return keypair
+
+    def acquire(self):
+        """
+        Lấy một cặp khóa, nếu pool rỗng thì sinh đồng bộ
+        Returns:
+            tuple: (private_key, public_key)
+        """
+        keypair = self.try_acquire()
+        if keypair is None:
+            logger.warning("Pool khóa RSA rỗng, sinh khóa đồng bộ")
+            private_key = RSA.generate(self.key_size)
+            keypair = (private_key, private_key.publickey())
+        return keypair
+
+    async def acquire_async(self):
+        """
+        Lấy một cặp khóa mà không chặn event loop; nếu pool rỗng thì chờ worker sinh khóa
+        Returns:
+            tuple: (private_key, public_key)
+        """
+        keypair = self.try_acquire()
+        if keypair is None:
+            logger.warning("Pool khóa RSA rỗng, chờ worker sinh khóa")
+            with self._lock:
+                executor = self._get_executor()
+            der = await asyncio.wrap_future(executor.submit(generate_private_key_der, self.key_size))
+            private_key = RSA.import_key(der)
+            keypair = (private_key, private_key.publickey())
+        return keypair
+
+    def stats(self):
+        """
+        Thống kê pool
+        Returns:
+            dict: depth (số khóa sẵn có), capacity, pending, hits, misses, generated
+        """
+        with self._lock:
+            return {
+                'depth': len(self._keys),
+                'capacity': self.size,
+                'pending': self._pending,
+                'hits': self.hits,
+                'misses': self.misses,
+                'generated': self.generated
+            }
+
+    def shutdown(self):
+        """Dừng sinh khóa nền"""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_key_pool():
+    """
+    Lấy pool khóa RSA dùng chung của process (cấu hình theo Config)
+    Returns:
+        RSAKeyPool: Pool dùng chung
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = RSAKeyPool(
+                size=Config.RSA_KEY_POOL_SIZE,
+                key_size=CryptoService().rsa_key_size,
+                workers=Config.RSA_KEY_POOL_WORKERS,
+                executor=Config.RSA_KEY_POOL_EXECUTOR
+            )
+        return _default_pool
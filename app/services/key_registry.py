@@ -0,0 +1,150 @@
+"""
+Registry khóa công khai đã parse sẵn, dùng chung cho mọi luồng xác minh chữ ký
+Khóa được đánh chỉ mục theo fingerprint của PEM và giữ trong bộ đệm LRU có giới hạn
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from Crypto.PublicKey import RSA
+from cryptography.hazmat.primitives import serialization
+from app.config import Config
+from app.services.crypto_backends import get_backend
+
+
+def key_fingerprint(public_key_pem):
+    """
+    Tính fingerprint của khóa công khai dạng PEM
+    Args:
+        public_key_pem (str | bytes): Khóa công khai PEM
+    Returns:
+        str: SHA-256 hex của PEM đã chuẩn hóa (bỏ khoảng trắng đầu/cuối, CRLF -> LF)
+    """
+    if isinstance(public_key_pem, bytes):
+        public_key_pem = public_key_pem.decode('utf-8')
+    normalized = public_key_pem.strip().replace('\r\n', '\n')
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class PublicKeyEntry:
+    """Khóa công khai đã parse, xác minh/mã hóa qua backend RSA đang chọn"""
+
+    def __init__(self, fingerprint, public_key_pem):
+        """
+        Args:
+            fingerprint (str): Fingerprint của PEM
+            public_key_pem (str): Khóa công khai PEM
+        """
+        self.fingerprint = fingerprint
+        self.pem = public_key_pem
+        self.rsa_key = RSA.import_key(public_key_pem)
+        self._crypto_key = None
+
+    @property
+    def crypto_key(self):
+        """Khóa dạng đối tượng của thư viện cryptography (parse khi dùng lần đầu)"""
+        if self._crypto_key is None:
+            self._crypto_key = serialization.load_pem_public_key(self.pem.encode('utf-8'))
+        return self._crypto_key
+
+    def verify(self, data, signature):
+        """
+        Xác minh chữ ký RSA/SHA-512 (PKCS#1 v1.5)
+        Args:
+            data (bytes): Dữ liệu gốc
+            signature (bytes): Chữ ký cần xác minh
+        Returns:
+            bool: True nếu chữ ký hợp lệ
+        """
+        return get_backend('rsa').rsa_verify(self.rsa_key, data, signature)
+
+    def encrypt(self, data):
+        """
+        Mã hóa dữ liệu bằng RSA PKCS#1 v1.5
+        Args:
+            data (bytes): Dữ liệu cần mã hóa
+        Returns:
+            bytes: Dữ liệu đã mã hóa
+        """
+        return get_backend('rsa').rsa_encrypt(self.rsa_key, data)
+
+
+class PublicKeyRegistry:
+    """Bộ đệm LRU các khóa công khai đã parse, an toàn khi dùng từ nhiều thread"""
+
+    def __init__(self, maxsize=1024):
+        """
+        Args:
+            maxsize (int): Số khóa tối đa giữ trong bộ đệm
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, public_key_pem):
+        """
+        Lấy khóa đã parse theo PEM, parse và lưu vào bộ đệm nếu chưa có
+        Args:
+            public_key_pem (str | bytes): Khóa công khai PEM
+        Returns:
+            PublicKeyEntry: Khóa đã parse
+        Raises:
+            ValueError: Nếu PEM không hợp lệ
+        """
+        if isinstance(public_key_pem, bytes):
+            public_key_pem = public_key_pem.decode('utf-8')
+        fingerprint = key_fingerprint(public_key_pem)
+
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Parse ngoài lock để không chặn các luồng khác
+        entry = PublicKeyEntry(fingerprint, public_key_pem)
+
+        with self._lock:
+            self._entries[fingerprint] = entry
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, public_key_pem):
+        """
+        Xóa khóa khỏi bộ đệm (khi người dùng đổi khóa)
+        Args:
+            public_key_pem (str | bytes): Khóa công khai PEM cũ
+        """
+        if not public_key_pem:
+            return
+        with self._lock:
+            self._entries.pop(key_fingerprint(public_key_pem), None)
+
+    def clear(self):
+        """Xóa toàn bộ bộ đệm"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Thống kê bộ đệm
+        Returns:
+            dict: size, maxsize, hits, misses
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# Registry dùng chung của process
+key_registry = PublicKeyRegistry(maxsize=Config.PUBLIC_KEY_CACHE_SIZE)
@@ -0,0 +1,404 @@
+"""
+Registry metric trong process (counter, gauge, histogram) và xuất theo định dạng text
+của Prometheus (text exposition 0.0.4), không cần thư viện ngoài.
+Flask phục vụ tại /metrics; process chỉ chạy WebSocket server dùng start_metrics_server.
+Số liệu của nhiều process (các worker của server_cluster) được gộp bằng collect() + merge_families().
+"""
+
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Cách gộp gauge giữa các process
+MERGE_MODES = {'sum': lambda a, b: a + b, 'max': max}
+# Mốc histogram độ trễ (giây): từ 0.5 ms tới 10 giây
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    """Escape giá trị nhãn theo định dạng text exposition"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Phần chung của các loại metric: tên, mô tả, tên nhãn và các giá trị theo nhãn"""
+
+    metric_type = 'untyped'
+    multiprocess_mode = 'sum'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Args:
+            name (str): Tên metric
+            documentation (str): Mô tả (dòng # HELP)
+            labelnames (tuple): Tên các nhãn
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """Bộ giá trị nhãn theo thứ tự labelnames"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} cần đúng các nhãn {self.labelnames}, nhận {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, function):
+        """
+        Lấy giá trị lúc xuất thay vì cập nhật tay (vd: độ dài một dict, thống kê sẵn có)
+        Args:
+            function: Hàm không tham số trả về số (metric không nhãn)
+                hoặc dict {bộ giá trị nhãn: số}
+        """
+        self._function = function
+
+    def _samples(self):
+        """Các cặp (bộ giá trị nhãn, giá trị) hiện tại"""
+        if self._function is None:
+            with self._lock:
+                return list(self._values.items())
+        try:
+            values = self._function()
+        except Exception as e:
+            logger.warning(f"Không đọc được metric {self.name}: {e}")
+            return []
+        if isinstance(values, dict):
+            return [(tuple(str(v) for v in key), value) for key, value in values.items()]
+        return [((), values)]
+
+    def value(self, **labels):
+        """Giá trị hiện tại theo nhãn (0 nếu chưa có)"""
+        key = self._key(labels)
+        return dict(self._samples()).get(key, 0)
+
+    def collect(self):
+        """
+        Ảnh chụp giá trị hiện tại (pickle được, để gửi giữa các process)
+        Returns:
+            dict: name, type, help, labelnames, mode (cách gộp giữa process) và samples {bộ nhãn: giá trị}
+        """
+        return {
+            'name': self.name,
+            'type': self.metric_type,
+            'help': self.documentation,
+            'labelnames': self.labelnames,
+            'mode': self.multiprocess_mode,
+            'samples': dict(self._samples())
+        }
+
+
+class Counter(Metric):
+    """Giá trị chỉ tăng (số byte, số transfer...)"""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Tăng counter
+        Args:
+            amount (float): Lượng tăng (không âm)
+        """
+        if amount < 0:
+            raise ValueError("Counter chỉ được tăng")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Giá trị tăng giảm tùy ý (số kết nối đang mở...)"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        """
+        Args:
+            multiprocess_mode (str): Cách gộp giá trị của nhiều process: 'sum' hoặc 'max'
+        """
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in MERGE_MODES:
+            raise ValueError(f"Cách gộp không hỗ trợ: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Phân bố giá trị (độ trễ) theo các mốc cố định, kèm tổng và số lần đo"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (tuple): Các mốc trên (không gồm +Inf)
+        """
+        super().__init__(name, documentation, labelnames)
+        if 'le' in self.labelnames:
+            raise ValueError("Histogram không dùng được nhãn 'le'")
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        """
+        Ghi nhận một giá trị
+        Args:
+            value (float): Giá trị đo (giây với histogram độ trễ)
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian chạy khối with (kể cả khi khối phát sinh ngoại lệ)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        """Số lần đo theo nhãn"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            return state[2] if state else 0
+
+    def collect(self):
+        """Như Metric.collect, mỗi giá trị là (số lần đo theo từng mốc, tổng, số lần đo); kèm buckets"""
+        with self._lock:
+            samples = {key: (list(state[0]), state[1], state[2]) for key, state in self._values.items()}
+        return {
+            'name': self.name,
+            'type': self.metric_type,
+            'help': self.documentation,
+            'labelnames': self.labelnames,
+            'mode': 'sum',
+            'buckets': self.buckets,
+            'samples': samples
+        }
+
+
+class MetricsRegistry:
+    """Tập metric của process, tạo theo tên (gọi lại cùng tên trả về metric đã có)"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} đã đăng ký với kiểu hoặc nhãn khác")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        return self._get_or_create(Gauge, name, documentation, labelnames, multiprocess_mode=multiprocess_mode)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name):
+        """Metric đã đăng ký theo tên, hoặc None"""
+        return self._metrics.get(name)
+
+    def collect(self):
+        """
+        Ảnh chụp toàn bộ metric
+        Returns:
+            list: Các family (xem Metric.collect)
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.collect() for metric in metrics]
+
+    def render(self):
+        """
+        Xuất toàn bộ metric
+        Returns:
+            str: Nội dung text exposition
+        """
+        return render_families(self.collect())
+
+
+def _labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render_families(families):
+    """
+    Xuất các family theo định dạng text exposition
+    Args:
+        families (list): Kết quả của MetricsRegistry.collect() hoặc merge_families()
+    Returns:
+        str: Nội dung text exposition
+    """
+    lines = []
+    for family in sorted(families, key=lambda family: family['name']):
+        name, labelnames = family['name'], family['labelnames']
+        lines.append(f'# HELP {name} {family["help"]}')
+        lines.append(f'# TYPE {name} {family["type"]}')
+        for key, value in sorted(family['samples'].items()):
+            if family['type'] != 'histogram':
+                lines.append(f'{name}{_labels(labelnames, key)} {_format_value(value)}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(family['buckets'], counts):
+                cumulative += bucket_count
+                le = _format_value(bound) if math.isinf(bound) else repr(float(bound))
+                lines.append(f'{name}_bucket{_labels(labelnames, key, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labelnames, key)} {_format_value(total)}')
+            lines.append(f'{name}_count{_labels(labelnames, key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def merge_families(snapshots):
+    """
+    Gộp số liệu của nhiều process: counter và histogram cộng lại,
+    gauge cộng hoặc lấy giá trị lớn nhất theo multiprocess_mode
+    Args:
+        snapshots (iterable): Kết quả MetricsRegistry.collect() của từng process
+    Returns:
+        list: Các family đã gộp
+    """
+    merged = {}
+    for families in snapshots:
+        for family in families:
+            target = merged.get(family['name'])
+            if target is None:
+                merged[family['name']] = dict(family, samples={
+                    key: (list(value[0]), value[1], value[2]) if family['type'] == 'histogram' else value
+                    for key, value in family['samples'].items()
+                })
+                continue
+            samples = target['samples']
+            for key, value in family['samples'].items():
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = (list(value[0]), value[1], value[2]) if family['type'] == 'histogram' else value
+                elif family['type'] == 'histogram':
+                    samples[key] = ([a + b for a, b in zip(current[0], value[0])],
+                                    current[1] + value[1], current[2] + value[2])
+                else:
+                    samples[key] = MERGE_MODES[target['mode']](current, value)
+    return list(merged.values())
+
+
+# Registry dùng chung của process
+registry = MetricsRegistry()
+
+# Metric truyền file, dùng chung cho server, client và ứng dụng Flask
+TRANSFER_BYTES = registry.counter(
+    'securefile_transfer_bytes_total',
+    'Byte message chunk đã nhận (in, phía server) hoặc đã gửi (out, phía client)',
+    ['direction']
+)
+TRANSFERS = registry.counter(
+    'securefile_transfers_total',
+    'Số transfer file theo vai trò và kết quả',
+    ['role', 'status']
+)
+CRYPTO_STAGE_SECONDS = registry.histogram(
+    'securefile_crypto_stage_seconds',
+    'Thời gian từng bước xử lý của SecureFileTransfer',
+    ['stage']
+)
+WS_MESSAGE_SECONDS = registry.histogram(
+    'securefile_ws_message_seconds',
+    'Thời gian server xử lý một message WebSocket theo loại',
+    ['type']
+)
+WS_CONNECTIONS = registry.gauge(
+    'securefile_ws_connections',
+    'Kết nối WebSocket đang mở tới server'
+)
+SOCKETIO_CONNECTIONS = registry.gauge(
+    'securefile_socketio_connections',
+    'Kết nối Socket.IO đang mở'
+)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Trả registry ở /metrics"""
+
+    registry = registry
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Không ghi log cho mỗi lần Prometheus lấy số liệu
+        pass
+
+
+def start_metrics_server(port, host='localhost', metrics_registry=None):
+    """
+    Phục vụ /metrics trên một HTTP server riêng (thread nền), cho process chỉ chạy WebSocket server
+    Args:
+        port (int): Port HTTP (0 để hệ điều hành chọn)
+        host (str): Địa chỉ lắng nghe
+        metrics_registry (MetricsRegistry): Registry cần xuất (mặc định registry chung)
+    Returns:
+        ThreadingHTTPServer: Server đang chạy (gọi shutdown() để dừng)
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': metrics_registry or registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Metrics tại http://{host}:{server.server_address[1]}/metrics")
+    return server
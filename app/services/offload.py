@@ -0,0 +1,235 @@
+"""
+Đưa các bước tốn CPU của server (xác minh RSA, giải mã AES-GCM, SHA-512, giải nén)
+ra khỏi event loop asyncio, và đo độ trễ của event loop để thấy loop còn phản hồi kịp
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+import multiprocessing
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Số mẫu độ trễ gần nhất giữ lại để tính phân vị
+LAG_WINDOW = 600
+
+
+class OffloadExecutor:
+    """
+    Chạy tác vụ đồng bộ trên thread pool hoặc process pool, giới hạn số tác vụ
+    đang chờ/chạy nên một client gửi dồn dập không chiếm hết worker và bộ nhớ
+    """
+
+    def __init__(self, workers=None, executor='thread', max_pending=None):
+        """
+        Args:
+            workers (int): Số worker (mặc định bằng số core)
+            executor (str): 'thread', 'process' hoặc 'inline' (chạy ngay trên event loop)
+            max_pending (int): Số tác vụ tối đa được giao cho pool cùng lúc (mặc định 2 x số worker)
+        """
+        if executor not in ('thread', 'process', 'inline'):
+            raise ValueError(f"Loại executor không hỗ trợ: {executor}")
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.executor_type = executor
+        self.max_pending = max(1, max_pending or self.workers * 2)
+        self._pool = None
+        self._local_pool = None
+        self._lock = threading.Lock()
+        # asyncio.Semaphore gắn với một event loop, mỗi loop dùng một semaphore riêng
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def isolated(self):
+        """True nếu tác vụ chạy ở process khác (chỉ nhận hàm và tham số pickle được)"""
+        return self.executor_type == 'process'
+
+    def _get_pool(self, local):
+        """Khởi tạo pool khi dùng lần đầu; local=True luôn là thread pool của process này"""
+        with self._lock:
+            if self.executor_type == 'process' and not local:
+                if self._pool is None:
+                    # Dùng spawn để tránh fork khi process cha đang chạy nhiều thread
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+                return self._pool
+            if self._local_pool is None:
+                self._local_pool = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='offload-worker'
+                )
+            return self._local_pool
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_pending)
+        return semaphore
+
+    async def run(self, fn, *args):
+        """
+        Chạy fn(*args) trên pool đã cấu hình
+        Args:
+            fn: Hàm đồng bộ (phải pickle được nếu dùng process pool)
+        Returns:
+            Kết quả của fn
+        """
+        return await self._submit(fn, args, local=False)
+
+    async def run_local(self, fn, *args):
+        """
+        Chạy fn(*args) trên thread của process này; dùng cho tác vụ gắn với trạng thái
+        không chuyển sang process khác được (file đang mở, khóa đã parse)
+        Args:
+            fn: Hàm đồng bộ
+        Returns:
+            Kết quả của fn
+        """
+        return await self._submit(fn, args, local=True)
+
+    async def _submit(self, fn, args, local):
+        self.waiting += 1
+        async with self._semaphore():
+            self.waiting -= 1
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                if self.executor_type == 'inline':
+                    return fn(*args)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_pool(local), functools.partial(fn, *args))
+            finally:
+                self.in_flight -= 1
+                self.completed += 1
+                self.busy_seconds += time.perf_counter() - started
+
+    def stats(self):
+        """
+        Thống kê executor
+        Returns:
+            dict: executor, workers, max_pending, in_flight, waiting, completed, busy_seconds
+        """
+        return {
+            'executor': self.executor_type,
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'completed': self.completed,
+            'busy_seconds': round(self.busy_seconds, 6)
+        }
+
+    def shutdown(self):
+        """Dừng các pool"""
+        with self._lock:
+            for pool in (self._pool, self._local_pool):
+                if pool is not None:
+                    pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = self._local_pool = None
+
+
+class LoopLagMonitor:
+    """Đo độ trễ event loop: thời gian một lần sleep ngắn bị trễ so với dự kiến"""
+
+    def __init__(self, interval=0.1, warn_threshold=0.25):
+        """
+        Args:
+            interval (float): Khoảng đo (giây)
+            warn_threshold (float): Độ trễ (giây) bắt đầu ghi log cảnh báo
+        """
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.samples = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=LAG_WINDOW)
+        self._task = None
+
+    def start(self):
+        """Bắt đầu đo trên event loop đang chạy (gọi nhiều lần không sao)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """Dừng đo"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - expected))
+
+    def record(self, lag):
+        """
+        Ghi nhận một mẫu độ trễ
+        Args:
+            lag (float): Độ trễ (giây)
+        """
+        self.samples += 1
+        self.total += lag
+        self.last = lag
+        self.max = max(self.max, lag)
+        self._recent.append(lag)
+        if lag >= self.warn_threshold:
+            logger.warning(f"Event loop bị chặn {lag * 1000:.0f} ms")
+
+    def stats(self):
+        """
+        Thống kê độ trễ (giây)
+        Returns:
+            dict: samples, last, mean, max, p50 và p99 của các mẫu gần nhất
+        """
+        recent = sorted(self._recent)
+
+        def percentile(fraction):
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(fraction * len(recent)))]
+
+        return {
+            'samples': self.samples,
+            'last': round(self.last, 6),
+            'mean': round(self.total / self.samples, 6) if self.samples else 0.0,
+            'max': round(self.max, 6),
+            'p50': round(percentile(0.5), 6),
+            'p99': round(percentile(0.99), 6)
+        }
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def get_offload_executor():
+    """
+    Lấy executor dùng chung của process (cấu hình theo Config)
+    Returns:
+        OffloadExecutor: Executor dùng chung
+    """
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = OffloadExecutor(
+                workers=Config.SERVER_OFFLOAD_WORKERS,
+                executor=Config.SERVER_OFFLOAD_EXECUTOR,
+                max_pending=Config.SERVER_OFFLOAD_MAX_PENDING
+            )
+        return _default_executor
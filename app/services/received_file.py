@@ -0,0 +1,199 @@
+"""
+Ghi file nhận được thẳng xuống đĩa theo từng chunk.
+Ciphertext được giải mã vào một buffer dùng lại suốt transfer và giải nén tăng dần ra
+file tạm, nên bộ nhớ dùng cho mỗi transfer chỉ cỡ một chunk bất kể kích thước file.
+"""
+
+import os
+import hmac
+import tempfile
+from pathlib import Path
+from app.services.crypto_backends import get_backend
+from app.services.crypto_service import PackageVerificationError
+from app.services.delta_sync import DeltaError, DeltaPatcher
+
+# Kích thước mỗi lần đọc khi hash lại phần đã nhận của transfer nhận tiếp
+RESUME_READ_SIZE = 1024 * 1024
+
+
+class ReceivedFileWriter:
+    """File đang nhận: ghi vào file tạm duy nhất, đổi tên nguyên tử khi nhận đủ"""
+
+    def __init__(self, received_dir, filename, decryptor, content_digest=None,
+                 delta_basis=None, target_size=None, partial_path=None, resume_offset=None):
+        """
+        Tạo file tạm trong thư mục nhận
+        Args:
+            received_dir (Path): Thư mục lưu file nhận được
+            filename (str): Tên file đích (đã bỏ phần đường dẫn)
+            decryptor (PackageDecryptor): Bộ giải mã của gói tin
+            content_digest (str): SHA-512 hex người gửi công bố cho nội dung file;
+                nếu có, dữ liệu ghi ra được hash và đối chiếu khi hoàn tất
+            delta_basis (tuple): (file bản cũ, BlockSignature) nếu dữ liệu nhận là chuỗi lệnh delta;
+                writer chịu trách nhiệm đóng file bản cũ
+            target_size (int): Kích thước bản mới khai báo trong header (giới hạn khi dựng lại delta)
+            partial_path (Path): File dữ liệu cố định của transfer có thể nhận tiếp (thay cho file tạm ngẫu nhiên)
+            resume_offset (int): Nếu có, nhận tiếp partial_path: giữ resume_offset byte đầu, bỏ phần sau
+        """
+        self.received_dir = Path(received_dir)
+        self.filename = filename
+        self.file_path = self.received_dir / filename
+        self.decryptor = decryptor
+        self.content_digest = content_digest
+        self.bytes_written = 0
+        self._hasher = get_backend('sha512').sha512() if content_digest else None
+
+        # Dữ liệu giải mã đi thẳng ra file, hoặc qua bộ dựng lại delta nếu gửi dạng delta
+        self.basis_file = None
+        self._patcher = None
+        self._sink = self._write
+        if delta_basis is not None:
+            self.basis_file, signature = delta_basis
+            self._patcher = DeltaPatcher(self.basis_file, signature, self._write, target_size)
+            self._sink = self._patcher.feed
+
+        if partial_path is None:
+            # Tên file tạm duy nhất nên hai transfer cùng tên không ghi đè lên nhau
+            fd, temp_path = tempfile.mkstemp(dir=self.received_dir, prefix=f'.{filename}.', suffix='.part')
+            self.temp_path = Path(temp_path)
+            self.file = os.fdopen(fd, 'wb')
+        elif resume_offset is None:
+            self.temp_path = Path(partial_path)
+            self.file = open(self.temp_path, 'wb')
+        else:
+            self.temp_path = Path(partial_path)
+            self.file = open(self.temp_path, 'r+b')
+            self._resume(resume_offset)
+        self.buffer = bytearray(decryptor.chunk_size)
+
+    def _resume(self, offset):
+        """Bỏ phần dữ liệu sau checkpoint và hash lại phần đã nhận (nếu cần đối chiếu digest)"""
+        self.file.truncate(offset)
+        if self._hasher is not None:
+            self.file.seek(0)
+            for block in iter(lambda: self.file.read(min(RESUME_READ_SIZE, offset - self.file.tell())), b''):
+                self._hasher.update(block)
+        self.file.seek(offset)
+        self.bytes_written = offset
+
+    def checkpoint(self):
+        """
+        Đẩy dữ liệu đã ghi xuống đĩa (fsync) và trả vị trí để ghi vào nhật ký transfer,
+        để nhật ký không bao giờ ghi nhận chunk chưa thực sự nằm trên đĩa (mất điện, OS treo)
+        Returns:
+            tuple: (chunk tiếp theo cần nhận, số byte dữ liệu hợp lệ trong file, đã nhận chunk cuối)
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.decryptor.next_index, self.file.tell(), self.decryptor.complete
+
+    @property
+    def complete(self):
+        """True khi đã nhận tới chunk cuối"""
+        return self.decryptor.complete
+
+    def write_chunk(self, chunk):
+        """
+        Kiểm tra, giải mã và ghi một chunk ra file tạm
+        Args:
+            chunk (dict): Chunk đã mã hóa
+        Returns:
+            int: Số byte dữ liệu gốc (hoặc chuỗi lệnh delta) đã xử lý
+        Raises:
+            PackageVerificationError: Nếu chunk hoặc lệnh delta không hợp lệ
+        """
+        try:
+            written = self.decryptor.decrypt_chunk_to(chunk, self.buffer, self._sink)
+        except DeltaError as e:
+            raise PackageVerificationError(f"Delta không hợp lệ: {e}")
+        self.bytes_written += written
+        return written
+
+    def unseal_args(self, chunk):
+        """
+        Kiểm tra thứ tự chunk và trả tham số cho open_chunk, để giải mã ở process khác
+        (ciphertext dạng memoryview được sao ra bytes để pickle được)
+        Args:
+            chunk (dict): Chunk đã mã hóa
+        Returns:
+            tuple: (session_key, base_nonce, chunk_size, chunk)
+        Raises:
+            PackageVerificationError: Nếu chunk sai thứ tự
+        """
+        self.decryptor.check_sequence(chunk)
+        if isinstance(chunk.get('cipher'), memoryview):
+            chunk = dict(chunk, cipher=bytes(chunk['cipher']))
+        return self.decryptor.session_key, self.decryptor.base_nonce, self.decryptor.chunk_size, chunk
+
+    def write_plain(self, data):
+        """
+        Ghi dữ liệu gốc của một chunk đã giải mã ở nơi khác (xem unseal_args)
+        Args:
+            data (bytes): Dữ liệu gốc (hoặc chuỗi lệnh delta) của chunk
+        Returns:
+            int: Số byte đã xử lý
+        Raises:
+            PackageVerificationError: Nếu lệnh delta không hợp lệ
+        """
+        try:
+            self._sink(data)
+        except DeltaError as e:
+            raise PackageVerificationError(f"Delta không hợp lệ: {e}")
+        self.bytes_written += len(data)
+        return len(data)
+
+    def _write(self, data):
+        """Ghi một phần dữ liệu gốc ra file tạm (và hash nếu cần đối chiếu digest)"""
+        if self._hasher is not None:
+            self._hasher.update(data)
+        self.file.write(data)
+
+    def _release(self):
+        """Đóng file tạm, file bản cũ và giải phóng buffer"""
+        self.file.close()
+        self.buffer = None
+        if self.basis_file is not None:
+            self.basis_file.close()
+            self.basis_file = None
+
+    def commit(self):
+        """
+        Đóng file tạm và đổi tên thành file đích (thay file cũ cùng tên nếu có)
+        Returns:
+            Path: Đường dẫn file đã lưu
+        Raises:
+            PackageVerificationError: Nếu thiếu chunk cuối, delta dở dang
+                hoặc nội dung không khớp content_digest
+        """
+        self.decryptor.finish()
+        if self._patcher is not None:
+            try:
+                self._patcher.finish()
+            except DeltaError as e:
+                raise PackageVerificationError(f"Delta không hợp lệ: {e}")
+        self._release()
+        if self._hasher is not None and not hmac.compare_digest(
+                self._hasher.hexdigest(), str(self.content_digest)):
+            raise PackageVerificationError("Nội dung file không khớp content_digest")
+        # mkstemp tạo file quyền 0600, đổi về quyền như file tạo bằng open() thông thường
+        os.chmod(self.temp_path, 0o644)
+        os.replace(self.temp_path, self.file_path)
+        return self.file_path
+
+    def suspend(self):
+        """
+        Tạm dừng transfer có thể nhận tiếp: đóng file nhưng giữ dữ liệu
+        Returns:
+            tuple: Checkpoint cuối (như checkpoint())
+        """
+        position = self.checkpoint()
+        self._release()
+        return position
+
+    def abort(self):
+        """Đóng và xóa file tạm của transfer chưa hoàn chỉnh"""
+        self._release()
+        try:
+            self.temp_path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,222 @@
+"""
+Chỉ mục các file trong thư mục nhận cho trang danh sách file (/list_received_files).
+Chỉ mục nằm trong bộ nhớ và chỉ cập nhật khi thư mục thay đổi (mtime/inode của thư mục khác lần trước):
+khi đó đọc lại tên file (không stat) và chỉ stat file mới hoặc đã bị thay (inode khác).
+File luôn được lưu bằng đổi tên nguyên tử nên mọi lần lưu đều làm đổi mtime của thư mục;
+server chạy cùng process còn báo trực tiếp qua record() ngay khi lưu.
+Mỗi thay đổi tăng generation, dùng làm ETag để request lặp lại khi không có gì mới chỉ tốn một lần stat.
+"""
+
+import os
+import json
+import time
+import uuid
+import base64
+import bisect
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = ('time', 'size', 'name')
+# Thư mục đổi trong khoảng này (ns) thì chưa tin mtime: hai lần đổi trong cùng một tick đồng hồ
+# của kernel cho cùng mtime, nên lần gọi sau vẫn đọc lại thư mục
+RACY_WINDOW_NS = 1_000_000_000
+
+
+class InvalidCursor(ValueError):
+    """Cursor phân trang không hợp lệ"""
+
+
+class ReceivedFilesIndex:
+    """Danh sách file đã nhận (tên, kích thước, thời gian sửa) với các thứ tự sắp xếp dựng sẵn"""
+
+    def __init__(self, received_dir):
+        """
+        Args:
+            received_dir (str | Path): Thư mục lưu file nhận được
+        """
+        self.received_dir = Path(received_dir)
+        self._entries = {}  # tên file -> (size, mtime_ns, inode)
+        self._sorted = {}  # khóa sắp xếp -> danh sách (khóa, tên) tăng dần, dựng lại khi cần
+        self._dir_signature = None
+        self.epoch = uuid.uuid4().hex[:8]  # Phân biệt với chỉ mục trước khi process khởi động lại
+        self.generation = 0
+        self.rescans = 0
+        self._lock = threading.Lock()
+
+    def _directory_signature(self):
+        try:
+            stat = self.received_dir.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino
+
+    def refresh(self):
+        """
+        Cập nhật chỉ mục nếu thư mục đã thay đổi
+        Returns:
+            str: Phiên bản hiện tại của chỉ mục (đổi mỗi khi danh sách file đổi), dùng làm ETag
+        """
+        with self._lock:
+            signature = self._directory_signature()
+            if signature is None or signature != self._dir_signature:
+                self._rescan()
+                racy = signature is not None and time.time_ns() - signature[0] < RACY_WINDOW_NS
+                self._dir_signature = None if racy else signature
+            return f'{self.epoch}-{self.generation}'
+
+    def _rescan(self):
+        """So tên và inode trong thư mục với chỉ mục, chỉ stat file mới/đã thay (gọi khi đang giữ lock)"""
+        self.rescans += 1
+        seen = {}
+        try:
+            with os.scandir(self.received_dir) as entries:
+                for entry in entries:
+                    # Bỏ file ẩn: file tạm đang nhận (.part), chỉ mục nội dung, nhật ký transfer
+                    if not entry.name.startswith('.') and entry.is_file(follow_symlinks=False):
+                        seen[entry.name] = entry.inode()
+        except FileNotFoundError:
+            pass
+        changed = False
+        for name in [name for name in self._entries if name not in seen]:
+            del self._entries[name]
+            changed = True
+        for name, inode in seen.items():
+            known = self._entries.get(name)
+            if known is not None and known[2] == inode:
+                continue
+            try:
+                stat = (self.received_dir / name).stat()
+            except OSError:
+                continue
+            self._entries[name] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            changed = True
+        if changed:
+            self._changed()
+
+    def record(self, path):
+        """
+        Ghi nhận file vừa lưu (server gọi ngay sau khi lưu, không cần chờ đọc lại thư mục)
+        Args:
+            path (str | Path): File trong thư mục nhận
+        """
+        path = Path(path)
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        with self._lock:
+            entry = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            if self._entries.get(path.name) != entry:
+                self._entries[path.name] = entry
+                self._changed()
+
+    def _changed(self):
+        self._sorted.clear()
+        self.generation += 1
+
+    def _ordered(self, sort):
+        """Danh sách (khóa, tên) tăng dần theo sort (gọi khi đang giữ lock)"""
+        if sort not in self._sorted:
+            self._sorted[sort] = sorted((self._sort_key(sort, name, entry), name)
+                                        for name, entry in self._entries.items())
+        return self._sorted[sort]
+
+    @staticmethod
+    def _sort_key(sort, name, entry):
+        if sort == 'time':
+            return [entry[1], name]
+        if sort == 'size':
+            return [entry[0], name]
+        return [name]
+
+    @staticmethod
+    def encode_cursor(key):
+        return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor, sort):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except ValueError:
+            raise InvalidCursor('Cursor không hợp lệ')
+        expected = (str,) if sort == 'name' else (int, str)
+        if (not isinstance(key, list) or len(key) != len(expected)
+                or not all(isinstance(value, kind) for value, kind in zip(key, expected))):
+            raise InvalidCursor('Cursor không hợp lệ')
+        return key
+
+    def page(self, sort='time', descending=True, prefix='', limit=100, cursor=None):
+        """
+        Một trang danh sách file theo keyset: trang sau bắt đầu ngay sau khóa của file cuối trang trước,
+        nên không bị lệch khi có file mới và không phải đếm bỏ qua các trang trước
+        Args:
+            sort (str): 'time', 'size' hoặc 'name'
+            descending (bool): True để sắp giảm dần (mặc định: file mới nhất trước)
+            prefix (str): Chỉ lấy file có tên bắt đầu bằng prefix
+            limit (int): Số file tối đa trong trang (None: lấy hết)
+            cursor (str): next_cursor của trang trước (None cho trang đầu)
+        Returns:
+            tuple: (danh sách dict name/size/mtime, next_cursor hoặc None nếu đã hết)
+        Raises:
+            ValueError: Nếu sort không hợp lệ
+            InvalidCursor: Nếu cursor không hợp lệ
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Không hỗ trợ sắp xếp theo {sort}")
+        after = self.decode_cursor(cursor, sort) if cursor else None
+        self.refresh()
+        with self._lock:
+            ordered = self._ordered(sort)
+            low, high = 0, len(ordered)
+            if sort == 'name' and prefix:
+                # Sắp theo tên thì các file cùng prefix nằm liền nhau
+                low = bisect.bisect_left(ordered, ([prefix], ''))
+                high = bisect.bisect_left(ordered, ([prefix + '\U0010ffff'], ''))
+            if descending:
+                start = bisect.bisect_left(ordered, (after, '')) if after is not None else high
+                positions = range(min(start, high) - 1, low - 1, -1)
+            else:
+                start = bisect.bisect_right(ordered, (after, '\U0010ffff')) if after is not None else low
+                positions = range(max(start, low), high)
+            files, last_key = [], None
+            for position in positions:
+                key, name = ordered[position]
+                if not name.startswith(prefix):
+                    continue
+                if len(files) == limit:
+                    return files, self.encode_cursor(last_key)
+                size, mtime_ns, _ = self._entries[name]
+                files.append({'name': name, 'size': size, 'mtime': mtime_ns / 1e9})
+                last_key = key
+            return files, None
+
+    def stats(self):
+        """
+        Thống kê
+        Returns:
+            dict: files, generation, rescans (số lần đọc lại thư mục)
+        """
+        with self._lock:
+            return {'files': len(self._entries), 'generation': self.generation, 'rescans': self.rescans}
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_received_files_index(received_dir='received_files'):
+    """
+    Lấy chỉ mục dùng chung của một thư mục nhận (route Flask và server cùng process dùng chung)
+    Args:
+        received_dir (str | Path): Thư mục lưu file nhận được
+    Returns:
+        ReceivedFilesIndex: Chỉ mục của thư mục
+    """
+    key = os.path.abspath(received_dir)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = ReceivedFilesIndex(received_dir)
+        return _indexes[key]
@@ -0,0 +1,268 @@
+"""
+Hàng đợi job gửi file cho route /send_file: request HTTP chỉ xếp job và trả job ID ngay,
+các worker trên event loop của pool client (xem client_pool) mã hóa và gửi lần lượt.
+Trạng thái và tiến độ từng job được tra tại /api/send_jobs/<id>.
+"""
+
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from app.config import Config
+from app.services.client_pool import get_client_pool
+from app.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái job
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+# Mốc histogram thời gian job (giây): gửi file lớn có thể mất vài phút
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+SEND_JOB_SECONDS = registry.histogram(
+    'securefile_send_job_seconds',
+    'Thời gian job gửi file chờ trong hàng đợi (wait) và chạy (run)',
+    ['stage'],
+    buckets=JOB_BUCKETS
+)
+SEND_JOBS = registry.counter(
+    'securefile_send_jobs_total',
+    'Số job gửi file theo kết quả (rejected: hàng đợi đầy)',
+    ['status']
+)
+
+# Các hàng đợi đang tồn tại, để gauge đọc số job lúc xuất
+_queues = weakref.WeakSet()
+
+registry.gauge(
+    'securefile_send_job_queue', 'Job gửi file đang chờ (queued) hoặc đang chạy (running)', ['state']
+).set_function(lambda: {
+    (state,): sum(queue.stats()[state] for queue in list(_queues)) for state in (JOB_QUEUED, JOB_RUNNING)
+})
+
+
+class JobQueueFull(Exception):
+    """Hàng đợi job đã đầy"""
+
+
+class SendJob:
+    """Một lần gửi file qua hàng đợi"""
+
+    def __init__(self, file_path, notify_room=None, content_digest=None):
+        """
+        Args:
+            file_path (str): Đường dẫn file cần gửi
+            notify_room (str): Room Socket.IO nhận thông báo khi job kết thúc (None nếu không cần)
+            content_digest (str): SHA-512 hex của file nếu đã biết (xem SecureFileClient.send_file)
+        """
+        self.id = uuid.uuid4().hex
+        self.file_path = str(file_path)
+        self.notify_room = notify_room
+        self.content_digest = content_digest
+        self.status = JOB_QUEUED
+        self.chunks_sent = 0
+        self.chunks_total = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def update_progress(self, sent, total=None):
+        """Callback tiến độ của SecureFileClient.send_file (gọi sau mỗi chunk)"""
+        self.chunks_sent = sent
+        self.chunks_total = total
+
+    @property
+    def progress(self):
+        """Tỉ lệ hoàn thành 0..1, hoặc None nếu chưa biết tổng số chunk (gửi delta)"""
+        if self.status == JOB_SUCCEEDED:
+            return 1.0
+        if not self.chunks_total:
+            return 0.0 if self.status == JOB_QUEUED else None
+        return min(1.0, self.chunks_sent / self.chunks_total)
+
+    @property
+    def done(self):
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: Trạng thái job cho API
+        """
+        return {
+            'id': self.id,
+            'filename': Path(self.file_path).name,
+            'status': self.status,
+            'progress': self.progress,
+            'chunks_sent': self.chunks_sent,
+            'chunks_total': self.chunks_total,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished
+        }
+
+
+class SendJobQueue:
+    """Hàng đợi có giới hạn và một số worker cố định chạy trên event loop của pool client"""
+
+    def __init__(self, pool=None, workers=None, max_queued=None, retention=None, on_finish=None):
+        """
+        Args:
+            pool (SecureClientPool): Pool kết nối dùng để gửi (mặc định pool chung)
+            workers (int): Số job chạy cùng lúc
+            max_queued (int): Số job được chờ trong hàng đợi
+            retention (float): Số giây job đã kết thúc còn tra cứu được
+            on_finish (callable): Nếu có, được gọi on_finish(job) khi job kết thúc (từ thread của pool)
+        """
+        self.pool = pool or get_client_pool()
+        self.workers = max(1, workers or Config.SEND_JOB_WORKERS)
+        self.max_queued = max(1, max_queued or Config.SEND_JOB_MAX_QUEUED)
+        self.retention = retention if retention is not None else Config.SEND_JOB_RETENTION
+        self.on_finish = on_finish
+        self._jobs = OrderedDict()  # job ID -> SendJob theo thứ tự tạo
+        self._pending = None  # Hàng chờ (asyncio.Queue trên event loop của pool)
+        self._tasks = []
+        self._lock = threading.Lock()
+        _queues.add(self)
+
+    def submit(self, file_path, notify_room=None, content_digest=None):
+        """
+        Xếp một file vào hàng đợi gửi
+        Args:
+            file_path (str): Đường dẫn file cần gửi
+            notify_room (str): Room Socket.IO nhận thông báo khi job kết thúc
+            content_digest (str): SHA-512 hex của file nếu đã biết
+        Returns:
+            SendJob: Job vừa tạo
+        Raises:
+            JobQueueFull: Nếu đã có max_queued job đang chờ
+        """
+        job = SendJob(file_path, notify_room, content_digest)
+        with self._lock:
+            self._expire()
+            queued = sum(1 for existing in self._jobs.values() if existing.status == JOB_QUEUED)
+            if queued >= self.max_queued:
+                SEND_JOBS.inc(status='rejected')
+                raise JobQueueFull(f"Hàng đợi gửi file đã đầy ({self.max_queued} job)")
+            self._jobs[job.id] = job
+        self.pool.start().call_soon_threadsafe(self._enqueue, job)
+        logger.info(f"Đã xếp job {job.id} gửi file {job.file_path}")
+        return job
+
+    def get(self, job_id):
+        """
+        Args:
+            job_id (str): ID job
+        Returns:
+            SendJob: Job, hoặc None nếu không có (hoặc đã hết hạn lưu)
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _expire(self):
+        """Bỏ các job đã kết thúc quá retention giây (gọi khi đang giữ lock)"""
+        deadline = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished < deadline:
+                del self._jobs[job_id]
+
+    def _enqueue(self, job):
+        # Chạy trên event loop của pool: khởi tạo hàng chờ và các worker ở lần đầu
+        if self._pending is None:
+            self._pending = asyncio.Queue()
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._pending.put_nowait(job)
+
+    async def _worker(self):
+        while True:
+            job = await self._pending.get()
+            await self._run(job)
+
+    async def _run(self, job):
+        """Gửi file của một job và ghi nhận kết quả"""
+        job.started = time.time()
+        job.status = JOB_RUNNING
+        SEND_JOB_SECONDS.observe(job.started - job.created, stage='wait')
+        try:
+            sending = self.pool.send_file_async(job.file_path, job.update_progress, job.content_digest)
+            saved = await asyncio.wait_for(sending, Config.CLIENT_POOL_SEND_TIMEOUT)
+            job.error = None if saved else 'Gửi file thất bại'
+        except asyncio.TimeoutError:
+            saved = False
+            job.error = f"Quá thời gian gửi ({Config.CLIENT_POOL_SEND_TIMEOUT:g} giây)"
+            logger.error(f"Job {job.id} quá thời gian gửi")
+        except Exception as e:
+            saved = False
+            job.error = str(e)
+            logger.error(f"Job {job.id} lỗi: {e}")
+        job.finished = time.time()
+        job.status = JOB_SUCCEEDED if saved else JOB_FAILED
+        SEND_JOB_SECONDS.observe(job.finished - job.started, stage='run')
+        SEND_JOBS.inc(status=job.status)
+        logger.info(f"Job {job.id} kết thúc: {job.status}")
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                logger.warning(f"Không gửi được thông báo job {job.id}: {e}")
+
+    async def _stop_workers(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def close(self, timeout=5.0):
+        """
+        Dừng các worker (job đang chạy bị hủy, job đang chờ không được gửi). Pool không bị đóng
+        Args:
+            timeout (float): Thời gian chờ tối đa (giây)
+        """
+        if self._tasks:
+            try:
+                self.pool.submit(self._stop_workers()).result(timeout)
+            except Exception as e:
+                logger.warning(f"Không dừng êm được worker của hàng đợi job: {e}")
+
+    def stats(self):
+        """
+        Thống kê
+        Returns:
+            dict: Số job theo trạng thái và số worker
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in (JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED)}
+        for job in jobs:
+            counts[job.status] += 1
+        return dict(counts, workers=self.workers)
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_send_job_queue(on_finish=None):
+    """
+    Lấy hàng đợi job dùng chung của process (cấu hình theo Config)
+    Args:
+        on_finish (callable): Callback khi job kết thúc, chỉ dùng ở lần tạo đầu tiên
+    Returns:
+        SendJobQueue: Hàng đợi dùng chung
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = SendJobQueue(on_finish=on_finish)
+        return _default_queue
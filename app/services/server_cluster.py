@@ -0,0 +1,213 @@
+"""
+Chạy nhiều process WebSocket server cùng lắng nghe một port bằng SO_REUSEPORT.
+Kernel chia kết nối mới cho các worker, nên xác minh/giải mã của các client chạy song song
+trên nhiều core thay vì chung một GIL, không cần load balancer đứng trước.
+
+    python -m app.services.server_cluster --workers 4 --port 8765 --metrics-port 9108
+"""
+
+import os
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+import multiprocessing
+from app.config import Config
+from app.services.metrics import merge_families, registry, render_families, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# Thời gian chờ một worker trả số liệu khi gộp metrics (giây)
+COLLECT_TIMEOUT = 2.0
+# Khoảng kiểm tra worker còn sống (giây)
+SUPERVISE_INTERVAL = 1.0
+
+
+def reuse_port_supported():
+    """True nếu hệ điều hành có SO_REUSEPORT (Linux, BSD, macOS; Windows không có)"""
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+def _answer_collect_requests(conn):
+    """Thread trong worker: trả ảnh chụp registry mỗi khi process cha yêu cầu"""
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request == 'collect':
+            conn.send(registry.collect())
+
+
+async def _serve(host, port):
+    # Import trong worker để process cha không phải nạp server (và khởi tạo các pool) khi chỉ giám sát
+    from app.services.websocket_server import start_secure_server
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    await start_secure_server(host, port, reuse_port=True, stop=stop)
+
+
+def worker_main(index, host, port, conn):
+    """
+    Điểm vào của process worker: một SecureFileServer trên event loop riêng
+    Args:
+        index (int): Số thứ tự worker
+        host (str): Địa chỉ host
+        port (int): Port dùng chung
+        conn (Connection): Đầu pipe nhận yêu cầu lấy số liệu từ process cha
+    """
+    logging.basicConfig(level=logging.INFO, format=f'[worker {index}] %(levelname)s:%(name)s:%(message)s')
+    threading.Thread(target=_answer_collect_requests, args=(conn,), name='metrics-pipe', daemon=True).start()
+    logger.info(f"Worker {index} (pid {os.getpid()}) khởi chạy")
+    asyncio.run(_serve(host, port))
+
+
+class ServerCluster:
+    """Khởi chạy, giám sát và dừng các worker; gộp metrics của chúng"""
+
+    def __init__(self, workers=None, host='localhost', port=8765, shutdown_grace=None):
+        """
+        Args:
+            workers (int): Số process worker (mặc định Config.SERVER_WORKERS)
+            host (str): Địa chỉ host
+            port (int): Port WebSocket dùng chung
+            shutdown_grace (float): Thời gian worker được chờ transfer đang nhận khi dừng (giây)
+        """
+        self.workers = max(1, workers or Config.SERVER_WORKERS)
+        self.host = host
+        self.port = port
+        self.shutdown_grace = shutdown_grace if shutdown_grace is not None else Config.SERVER_SHUTDOWN_GRACE
+        # Dùng spawn để tránh fork khi process cha đang chạy nhiều thread
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = [None] * self.workers
+        self._pipes = [None] * self.workers
+        self._lock = threading.Lock()
+        self.restarts = 0
+        registry.gauge(
+            'securefile_cluster_workers', 'Số process worker của server đang chạy'
+        ).set_function(self.alive)
+
+    def alive(self):
+        """Số worker đang chạy"""
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    def _spawn(self, index):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=worker_main, args=(index, self.host, self.port, child_conn),
+            name=f'secure-server-{index}'
+        )
+        process.start()
+        child_conn.close()
+        self._processes[index] = process
+        self._pipes[index] = parent_conn
+
+    def start(self):
+        """
+        Khởi chạy các worker
+        Raises:
+            RuntimeError: Nếu hệ điều hành không hỗ trợ SO_REUSEPORT
+        """
+        if not reuse_port_supported():
+            raise RuntimeError("Hệ điều hành không hỗ trợ SO_REUSEPORT, hãy chạy một process (start_secure_server)")
+        with self._lock:
+            for index in range(self.workers):
+                self._spawn(index)
+        logger.info(f"Đã khởi chạy {self.workers} worker tại ws://{self.host}:{self.port}")
+
+    def supervise(self):
+        """Khởi chạy lại các worker đã thoát ngoài ý muốn"""
+        with self._lock:
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    logger.warning(f"Worker {index} đã thoát (mã {process.exitcode}), khởi chạy lại")
+                    self._pipes[index].close()
+                    self._spawn(index)
+                    self.restarts += 1
+
+    def collect(self):
+        """
+        Gộp số liệu của các worker và process cha
+        Returns:
+            list: Các family đã gộp (xem metrics.merge_families)
+        """
+        snapshots = [registry.collect()]
+        # Mỗi pipe chỉ phục vụ một yêu cầu tại một thời điểm
+        with self._lock:
+            for index, conn in enumerate(self._pipes):
+                if conn is None or not self._processes[index].is_alive():
+                    continue
+                try:
+                    conn.send('collect')
+                    if conn.poll(COLLECT_TIMEOUT):
+                        snapshots.append(conn.recv())
+                    else:
+                        logger.warning(f"Worker {index} không trả số liệu kịp")
+                except (EOFError, OSError) as e:
+                    logger.warning(f"Không lấy được số liệu worker {index}: {e}")
+        return merge_families(snapshots)
+
+    def render(self):
+        """
+        Returns:
+            str: Metrics đã gộp theo định dạng text exposition
+        """
+        return render_families(self.collect())
+
+    def stop(self):
+        """Dừng êm các worker (SIGTERM), worker không dừng kịp thì bị kill"""
+        with self._lock:
+            processes = [process for process in self._processes if process is not None]
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join(self.shutdown_grace + 5)
+                if process.is_alive():
+                    logger.warning(f"Worker {process.name} không dừng kịp, kill")
+                    process.kill()
+                    process.join()
+            for conn in self._pipes:
+                if conn is not None:
+                    conn.close()
+            self._processes = [None] * self.workers
+            self._pipes = [None] * self.workers
+        logger.info("Đã dừng các worker")
+
+    def run(self, metrics_port=None):
+        """
+        Khởi chạy và giám sát tới khi nhận SIGINT/SIGTERM, sau đó dừng êm các worker
+        Args:
+            metrics_port (int): Nếu có, phục vụ metrics đã gộp tại http://host:metrics_port/metrics
+        """
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+        self.start()
+        metrics_server = start_metrics_server(metrics_port, self.host, self) if metrics_port is not None else None
+        try:
+            while not stopping.wait(SUPERVISE_INTERVAL):
+                self.supervise()
+        finally:
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Chạy nhiều process WebSocket server trên cùng một port')
+    parser.add_argument('--workers', type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--metrics-port', type=int, default=Config.WS_METRICS_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    ServerCluster(args.workers, args.host, args.port).run(args.metrics_port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Nhật ký các transfer đang nhận dở (thư mục .partial trong thư mục nhận)
+Mỗi transfer có một file JSON ghi chunk cuối đã xác minh và vị trí tương ứng trong file dữ liệu,
+nên client mất kết nối có thể nhận tiếp từ đó, kể cả sau khi server khởi động lại.
+Khóa phiên của file được bọc bằng AES-GCM với khóa suy ra từ Config.RESUME_JOURNAL_KEY (hoặc SECRET_KEY),
+nên đọc được thư mục nhận thôi thì chưa giải mã được phần đã nhận
+"""
+
+import os
+import re
+import json
+import base64
+import time
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from Crypto.Hash import SHA512
+from Crypto.Protocol.KDF import HKDF
+from app.config import Config
+from app.services.crypto_backends import get_backend
+
+try:
+    import fcntl
+except ImportError:  # Windows: không chạy được nhiều process trên một port nên chỉ cần kiểm tra trong process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_DIRNAME = '.partial'
+# ID transfer do client sinh: 16 byte ngẫu nhiên dạng hex
+TRANSFER_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+WRAP_NONCE_SIZE = 12
+WRAP_TAG_SIZE = 16
+
+
+class TransferJournal:
+    """Nhật ký transfer dở dang: <id>.json (trạng thái) và <id>.part (dữ liệu đã ghi)"""
+
+    def __init__(self, received_dir, ttl, secret=None):
+        """
+        Args:
+            received_dir (str | Path): Thư mục lưu file nhận được
+            ttl (float): Số giây giữ transfer không có tiến triển trước khi xóa
+            secret (str): Bí mật để bọc khóa phiên (mặc định Config.RESUME_JOURNAL_KEY, không có thì SECRET_KEY);
+                phải giống nhau giữa các lần chạy thì mới nhận tiếp được sau khi khởi động lại
+        """
+        self.partial_dir = Path(received_dir) / PARTIAL_DIRNAME
+        self.ttl = ttl
+        secret = secret or Config.RESUME_JOURNAL_KEY or Config.SECRET_KEY
+        self._wrap_key = HKDF(secret.encode('utf-8'), 32, b'', SHA512, context=b'transfer-journal-key')
+        self.gc_interval = max(1.0, ttl / 10)
+        self._last_gc = 0.0
+        self._claims = {}  # ID transfer -> fd đang giữ khóa <id>.lock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def valid_id(transfer_id):
+        """True nếu transfer_id đúng định dạng (không thể chứa đường dẫn)"""
+        return isinstance(transfer_id, str) and bool(TRANSFER_ID_PATTERN.match(transfer_id))
+
+    def data_path(self, transfer_id):
+        """Đường dẫn file dữ liệu của transfer"""
+        return self.partial_dir / f'{transfer_id}.part'
+
+    def _record_path(self, transfer_id):
+        return self.partial_dir / f'{transfer_id}.json'
+
+    def _lock_path(self, transfer_id):
+        # Khóa nằm ở file riêng: <id>.json được thay bằng os.replace mỗi lần ghi nên khóa trên nó không giữ được
+        return self.partial_dir / f'{transfer_id}.lock'
+
+    def claim(self, transfer_id):
+        """
+        Giành quyền ghi transfer (khóa flock độc quyền trên <id>.lock), để hai worker của server_cluster
+        không cùng nhận tiếp một transfer vào chung file .part. Giữ tới khi release/remove
+        Args:
+            transfer_id (str): ID transfer
+        Returns:
+            bool: True nếu đã giữ được khóa, False nếu process/kết nối khác đang nhận transfer này
+        """
+        if fcntl is None:
+            return True
+        self.partial_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(self._lock_path(transfer_id), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        with self._lock:
+            self._claims[transfer_id] = fd
+        return True
+
+    def release(self, transfer_id):
+        """Nhả khóa của transfer (nếu đang giữ)"""
+        with self._lock:
+            fd = self._claims.pop(transfer_id, None)
+        if fd is not None:
+            os.close(fd)
+
+    def wrap_key(self, transfer_id, session_key):
+        """
+        Bọc khóa phiên để ghi vào nhật ký (AES-GCM, gắn với transfer_id)
+        Args:
+            transfer_id (str): ID transfer
+            session_key (bytes): Khóa phiên của file
+        Returns:
+            str: Khóa đã bọc dạng base64
+        """
+        nonce = os.urandom(WRAP_NONCE_SIZE)
+        ciphertext, tag = get_backend('aes_gcm').gcm_encrypt(
+            self._wrap_key, nonce, session_key, transfer_id.encode('ascii'))
+        return base64.b64encode(nonce + ciphertext + tag).decode('ascii')
+
+    def unwrap_key(self, transfer_id, wrapped):
+        """
+        Mở khóa phiên đã bọc bằng wrap_key
+        Returns:
+            bytes: Khóa phiên
+        Raises:
+            ValueError: Nếu khóa bọc hỏng, của transfer khác hoặc bọc bằng bí mật khác
+        """
+        data = base64.b64decode(wrapped)
+        if len(data) <= WRAP_NONCE_SIZE + WRAP_TAG_SIZE:
+            raise ValueError('Khóa phiên đã bọc không hợp lệ')
+        return get_backend('aes_gcm').gcm_decrypt(
+            self._wrap_key, data[:WRAP_NONCE_SIZE], data[WRAP_NONCE_SIZE:-WRAP_TAG_SIZE],
+            data[-WRAP_TAG_SIZE:], transfer_id.encode('ascii'))
+
+    def create(self, transfer_id, record):
+        """
+        Ghi nhận transfer mới
+        Args:
+            transfer_id (str): ID transfer
+            record (dict): Trạng thái (khóa file, nonce gốc, chunk_size, tên file...)
+        """
+        now = time.time()
+        self._save(transfer_id, dict(record, next_index=0, offset=0, complete=False, created=now, updated=now))
+
+    def load(self, transfer_id):
+        """
+        Đọc trạng thái transfer
+        Args:
+            transfer_id (str): ID transfer
+        Returns:
+            dict: Trạng thái, hoặc None nếu không có, đã hết hạn hoặc hỏng
+        """
+        if not self.valid_id(transfer_id):
+            return None
+        try:
+            record = json.loads(self._record_path(transfer_id).read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Nhật ký transfer {transfer_id} bị hỏng, bỏ qua: {e}")
+            return None
+        try:
+            data_size = self.data_path(transfer_id).stat().st_size
+        except FileNotFoundError:
+            data_size = -1
+        # Hết hạn, hoặc file dữ liệu thiếu phần đã ghi nhận (bị xóa/cắt ngoài ý muốn)
+        if time.time() - record.get('updated', 0) > self.ttl or data_size < record.get('offset', 0):
+            self.remove(transfer_id)
+            return None
+        return record
+
+    def checkpoint(self, transfer_id, next_index, offset, complete=False):
+        """
+        Ghi nhận các chunk trước next_index đã xác minh và nằm trong offset byte đầu file dữ liệu
+        Args:
+            transfer_id (str): ID transfer
+            next_index (int): Chunk tiếp theo cần nhận
+            offset (int): Số byte dữ liệu hợp lệ trong file .part
+            complete (bool): True nếu đã nhận chunk cuối (chỉ còn chờ file_end)
+        """
+        record = self.load(transfer_id)
+        if record is None:
+            return
+        record.update(next_index=next_index, offset=offset, complete=complete, updated=time.time())
+        self._save(transfer_id, record)
+
+    def remove(self, transfer_id):
+        """Xóa nhật ký, file dữ liệu và file khóa của transfer (nếu còn), rồi nhả khóa"""
+        for path in (self._record_path(transfer_id), self.data_path(transfer_id), self._lock_path(transfer_id)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self.release(transfer_id)
+
+    def _save(self, transfer_id, record):
+        """Ghi file tạm rồi đổi tên để nhật ký không bao giờ ghi dở (mkstemp tạo quyền 0600)"""
+        with self._lock:
+            # Nhật ký chứa khóa file nên thư mục chỉ chủ sở hữu truy cập được
+            self.partial_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.partial_dir, prefix=f'.{transfer_id}.', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+                # fsync trước khi đổi tên, rồi fsync thư mục để bản ghi mới còn sau khi mất điện
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self._record_path(transfer_id))
+            self._fsync_dir()
+
+    def _fsync_dir(self):
+        """fsync thư mục .partial (không làm được trên Windows)"""
+        if os.name == 'nt':
+            return
+        fd = os.open(self.partial_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def collect_garbage(self, active=()):
+        """
+        Xóa transfer quá TTL không có tiến triển và file mồ côi
+        Args:
+            active (iterable): ID transfer đang nhận (không xóa)
+        Returns:
+            int: Số transfer đã xóa
+        """
+        self._last_gc = time.time()
+        if not self.partial_dir.is_dir():
+            return 0
+        active = set(active)
+        removed = 0
+        for path in self.partial_dir.iterdir():
+            transfer_id = path.name.lstrip('.').split('.', 1)[0]
+            if transfer_id in active or not self.valid_id(transfer_id):
+                continue
+            try:
+                expired = time.time() - path.stat().st_mtime > self.ttl
+            except FileNotFoundError:
+                continue
+            if path.suffix == '.tmp' and expired:
+                # File tạm còn sót khi server dừng giữa lúc ghi nhật ký
+                path.unlink(missing_ok=True)
+            elif path.suffix == '.json' and expired:
+                self.remove(transfer_id)
+                removed += 1
+            elif (path.suffix in ('.part', '.lock') and expired
+                  and not self._record_path(transfer_id).exists()):
+                self.remove(transfer_id)
+                removed += 1
+        if removed:
+            logger.info(f"Đã xóa {removed} transfer dở dang quá hạn")
+        return removed
+
+    def maybe_collect_garbage(self, active=()):
+        """Dọn dẹp nếu đã quá gc_interval kể từ lần trước"""
+        if time.time() - self._last_gc >= self.gc_interval:
+            return self.collect_garbage(active)
+        return 0
+
+    def stats(self):
+        """
+        Thống kê
+        Returns:
+            dict: partial (số transfer đang chờ nhận tiếp)
+        """
+        if not self.partial_dir.is_dir():
+            return {'partial': 0}
+        return {'partial': sum(1 for path in self.partial_dir.glob('*.json'))}
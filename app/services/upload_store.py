@@ -0,0 +1,351 @@
+"""
+Upload file theo kiểu giao thức tus: tạo upload với kích thước khai báo, gửi dữ liệu thành nhiều
+request nối tiếp (PATCH với Upload-Offset), mất kết nối thì hỏi offset (HEAD) rồi gửi tiếp.
+Dữ liệu được ghi thẳng vào file .part riêng của upload và hash SHA-512 ngay khi tới, nên khi nhận đủ
+chỉ cần đổi tên nguyên tử; digest được lưu lại để lần gửi sau không phải đọc lại file để hash.
+
+Bố cục trong thư mục upload:
+    .uploads/<id>.json   trạng thái upload (tên file, kích thước, offset, digest)
+    .uploads/<id>.part   dữ liệu đã nhận
+    <id>/<tên file>      file hoàn chỉnh (thư mục riêng nên upload trùng tên không ghi đè nhau)
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from app.config import Config
+from app.services.crypto_backends import get_backend
+
+logger = logging.getLogger(__name__)
+
+STATE_DIRNAME = '.uploads'
+# ID upload do server sinh: uuid4 dạng hex
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# Kích thước mỗi lần đọc từ request và khi hash lại phần đã nhận
+READ_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Lỗi upload"""
+
+
+class UploadNotFound(UploadError):
+    """Không có upload (hoặc đã hết hạn)"""
+
+
+class UploadConflict(UploadError):
+    """Offset không khớp, upload đang được ghi bởi request khác hoặc đã hoàn tất"""
+
+
+class UploadTooLarge(UploadError):
+    """Kích thước vượt giới hạn hoặc dữ liệu vượt kích thước đã khai báo"""
+
+
+def parse_metadata(header):
+    """
+    Đọc header Upload-Metadata của tus: các cặp "key base64(value)" cách nhau bởi dấu phẩy
+    Args:
+        header (str): Giá trị header (có thể rỗng)
+    Returns:
+        dict: {key: value (str)}
+    Raises:
+        UploadError: Nếu giá trị không phải base64/UTF-8 hợp lệ
+    """
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (header or '').split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value.strip(), validate=True).decode('utf-8')
+        except ValueError:
+            raise UploadError(f"Upload-Metadata không hợp lệ: {key}")
+    return metadata
+
+
+class UploadStore:
+    """Các upload dở dang và đã hoàn tất trong một thư mục"""
+
+    def __init__(self, upload_dir, max_size, ttl):
+        """
+        Args:
+            upload_dir (str | Path): Thư mục lưu upload
+            max_size (int): Kích thước tối đa của một file (byte)
+            ttl (float): Số giây giữ upload dở dang không có tiến triển trước khi xóa
+        """
+        self.upload_dir = Path(upload_dir)
+        self.state_dir = self.upload_dir / STATE_DIRNAME
+        self.max_size = max_size
+        self.ttl = ttl
+        self.gc_interval = max(1.0, ttl / 10)
+        self._last_gc = 0.0
+        self._hashers = {}  # ID upload -> (offset, hasher) của upload đang nhận trong process này
+        self._writing = set()  # ID upload đang có request ghi
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def valid_id(upload_id):
+        """True nếu upload_id đúng định dạng (không thể chứa đường dẫn)"""
+        return isinstance(upload_id, str) and bool(UPLOAD_ID_PATTERN.match(upload_id))
+
+    def _record_path(self, upload_id):
+        return self.state_dir / f'{upload_id}.json'
+
+    def _data_path(self, upload_id):
+        return self.state_dir / f'{upload_id}.part'
+
+    def create(self, length, filename):
+        """
+        Tạo upload mới
+        Args:
+            length (int): Kích thước file (byte)
+            filename (str): Tên file (bỏ phần đường dẫn)
+        Returns:
+            dict: Trạng thái upload (id, filename, length, offset...)
+        Raises:
+            UploadError: Nếu tên file hoặc kích thước không hợp lệ
+            UploadTooLarge: Nếu length vượt max_size
+        """
+        filename = Path(filename or '').name
+        if not filename or filename.startswith('.'):
+            raise UploadError('Tên file không hợp lệ')
+        if isinstance(length, bool) or not isinstance(length, int) or length < 0:
+            raise UploadError('Upload-Length không hợp lệ')
+        if length > self.max_size:
+            raise UploadTooLarge(f"File vượt giới hạn {self.max_size} byte")
+        self.maybe_collect_garbage()
+
+        upload_id = uuid.uuid4().hex
+        now = time.time()
+        record = {'id': upload_id, 'filename': filename, 'length': length, 'offset': 0,
+                  'sha512': None, 'path': None, 'created': now, 'updated': now}
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._data_path(upload_id).touch()
+        self._save(record)
+        with self._lock:
+            self._hashers[upload_id] = (0, get_backend('sha512').sha512())
+        if length == 0:
+            record = self._finalize(record)
+        return record
+
+    def get(self, upload_id):
+        """
+        Đọc trạng thái upload
+        Args:
+            upload_id (str): ID upload
+        Returns:
+            dict: Trạng thái upload
+        Raises:
+            UploadNotFound: Nếu không có, đã hết hạn hoặc nhật ký hỏng
+        """
+        if not self.valid_id(upload_id):
+            raise UploadNotFound('Không tìm thấy upload')
+        try:
+            record = json.loads(self._record_path(upload_id).read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            raise UploadNotFound('Không tìm thấy upload')
+        except (OSError, ValueError) as e:
+            logger.warning(f"Trạng thái upload {upload_id} bị hỏng, bỏ qua: {e}")
+            raise UploadNotFound('Không tìm thấy upload')
+        if record['path'] is None and time.time() - record['updated'] > self.ttl:
+            self.delete(upload_id)
+            raise UploadNotFound('Upload đã hết hạn')
+        return record
+
+    def write(self, upload_id, offset, stream):
+        """
+        Ghi tiếp dữ liệu vào upload, hash ngay khi đọc; nhận đủ thì hoàn tất (đổi tên nguyên tử).
+        Nếu stream lỗi giữa chừng (client ngắt), phần đã ghi vẫn được giữ để gửi tiếp
+        Args:
+            upload_id (str): ID upload
+            offset (int): Vị trí bắt đầu theo client (phải bằng offset hiện tại)
+            stream: Đối tượng có read(size) (vd: request.stream)
+        Returns:
+            dict: Trạng thái upload sau khi ghi (có path và sha512 nếu đã hoàn tất)
+        Raises:
+            UploadNotFound: Nếu không có upload
+            UploadConflict: Nếu offset không khớp, upload đã hoàn tất hoặc đang được ghi
+            UploadTooLarge: Nếu dữ liệu vượt kích thước đã khai báo (phần dữ liệu của request bị bỏ)
+        """
+        with self._lock:
+            if upload_id in self._writing:
+                raise UploadConflict('Upload đang được ghi bởi request khác')
+            self._writing.add(upload_id)
+        try:
+            record = self.get(upload_id)
+            if record['path'] is not None:
+                raise UploadConflict('Upload đã hoàn tất')
+            if offset != record['offset']:
+                raise UploadConflict(f"Upload-Offset không khớp (server đang ở {record['offset']})")
+            return self._append(record, stream)
+        finally:
+            with self._lock:
+                self._writing.discard(upload_id)
+
+    def _append(self, record, stream):
+        upload_id, start = record['id'], record['offset']
+        hasher = self._hasher(upload_id, start)
+        position = start
+        try:
+            with open(self._data_path(upload_id), 'r+b') as f:
+                # Bỏ phần dữ liệu sau offset đã ghi nhận (request trước bị ngắt giữa lúc ghi)
+                f.truncate(start)
+                f.seek(start)
+                try:
+                    for block in iter(lambda: stream.read(READ_SIZE), b''):
+                        if position + len(block) > record['length']:
+                            f.truncate(start)
+                            position = start
+                            raise UploadTooLarge('Dữ liệu vượt Upload-Length đã khai báo')
+                        f.write(block)
+                        hasher.update(block)
+                        position += len(block)
+                finally:
+                    f.flush()
+        except UploadTooLarge:
+            # Hasher đã nhận một phần dữ liệu bị bỏ: lần ghi sau hash lại từ file
+            with self._lock:
+                self._hashers.pop(upload_id, None)
+            raise
+        finally:
+            if position != start:
+                with self._lock:
+                    self._hashers[upload_id] = (position, hasher)
+                record.update(offset=position, updated=time.time())
+                self._save(record)
+        if position == record['length']:
+            record = self._finalize(record)
+        return record
+
+    def _hasher(self, upload_id, offset):
+        """Hasher đã hash offset byte đầu của upload; hash lại từ file nếu process chưa có (vd: sau khởi động lại)"""
+        with self._lock:
+            cached = self._hashers.get(upload_id)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        hasher = get_backend('sha512').sha512()
+        with open(self._data_path(upload_id), 'rb') as f:
+            remaining = offset
+            for block in iter(lambda: f.read(min(READ_SIZE, remaining)), b''):
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    def _finalize(self, record):
+        """Đổi tên file .part thành <id>/<tên file> và lưu digest"""
+        upload_id = record['id']
+        with self._lock:
+            _, hasher = self._hashers.pop(upload_id)
+        final_dir = self.upload_dir / upload_id
+        final_dir.mkdir(parents=True, exist_ok=True)
+        final_path = final_dir / record['filename']
+        os.replace(self._data_path(upload_id), final_path)
+        stat = final_path.stat()
+        record.update(path=str(final_path), sha512=hasher.hexdigest(), mtime_ns=stat.st_mtime_ns,
+                      updated=time.time())
+        self._save(record)
+        logger.info(f"Upload {upload_id} hoàn tất: {final_path} ({record['length']} byte)")
+        return record
+
+    def digest_of(self, file_path):
+        """
+        Digest SHA-512 đã tính khi upload, nếu file_path là file của một upload đã hoàn tất và chưa bị sửa
+        Args:
+            file_path (str): Đường dẫn file
+        Returns:
+            str: SHA-512 hex, hoặc None nếu không biết (cần hash lại)
+        """
+        path = Path(file_path)
+        if not self.valid_id(path.parent.name) or path.parent.parent.resolve() != self.upload_dir.resolve():
+            return None
+        try:
+            record = self.get(path.parent.name)
+            stat = path.stat()
+        except (UploadNotFound, OSError):
+            return None
+        if (record['path'] is None or Path(record['path']).name != path.name
+                or stat.st_size != record['length'] or stat.st_mtime_ns != record['mtime_ns']):
+            return None
+        return record['sha512']
+
+    def delete(self, upload_id):
+        """
+        Xóa upload (dữ liệu dở dang hoặc file đã hoàn tất)
+        Args:
+            upload_id (str): ID upload
+        """
+        if not self.valid_id(upload_id):
+            raise UploadNotFound('Không tìm thấy upload')
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        for path in (self._record_path(upload_id), self._data_path(upload_id)):
+            path.unlink(missing_ok=True)
+        final_dir = self.upload_dir / upload_id
+        if final_dir.is_dir():
+            for path in final_dir.iterdir():
+                path.unlink(missing_ok=True)
+            final_dir.rmdir()
+
+    def _save(self, record):
+        """Ghi file tạm rồi đổi tên để trạng thái không bao giờ ghi dở"""
+        fd, temp_path = tempfile.mkstemp(dir=self.state_dir, prefix=f".{record['id']}.", suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        os.replace(temp_path, self._record_path(record['id']))
+
+    def collect_garbage(self):
+        """
+        Xóa upload dở dang quá TTL không có tiến triển (upload đã hoàn tất được giữ)
+        Returns:
+            int: Số upload đã xóa
+        """
+        self._last_gc = time.time()
+        if not self.state_dir.is_dir():
+            return 0
+        removed = 0
+        for path in self.state_dir.glob('*.json'):
+            # File khác trong thư mục (tên không phải upload ID) không thuộc kho upload: bỏ qua
+            if not self.valid_id(path.stem):
+                continue
+            try:
+                record = json.loads(path.read_text(encoding='utf-8'))
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError):
+                record = None
+            if not isinstance(record, dict) or 'path' not in record or 'updated' not in record:
+                record = None
+            if record is None or (record['path'] is None and time.time() - record['updated'] > self.ttl):
+                self.delete(path.stem)
+                removed += 1
+        if removed:
+            logger.info(f"Đã xóa {removed} upload dở dang quá hạn")
+        return removed
+
+    def maybe_collect_garbage(self):
+        """Dọn dẹp nếu đã quá gc_interval kể từ lần trước"""
+        if time.time() - self._last_gc >= self.gc_interval:
+            return self.collect_garbage()
+        return 0
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """
+    Lấy kho upload dùng chung của process (cấu hình theo Config)
+    Returns:
+        UploadStore: Kho upload dùng chung
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = UploadStore(Config.UPLOAD_DIR, Config.MAX_CONTENT_LENGTH, Config.UPLOAD_TTL)
+        return _default_store
@@ -1,11 +1,12 @@
-from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
+from app.services.key_registry import key_registry
 import base64
 import json
 
 def verify_metadata_signature(public_key_pem, metadata, signature_b64):
     try:
-        public_key = serialization.load_pem_public_key(public_key_pem.encode())
+        public_key = key_registry.get(public_key_pem).crypto_key
         data = json.dumps(metadata, separators=(',', ':')).encode()
         signature = base64.b64decode(signature_b64)
         public_key.verify(
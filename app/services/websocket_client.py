@@ -3,69 +3,213 @@ WebSocket Client để test gửi file tài chính an toàn
 Thực hiện vai trò người gửi theo đề tài 4
 """
 
+import os
 import json
 import asyncio
+import functools
+import itertools
 import websockets
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from app.services.crypto_service import SecureFileTransfer
+from app.config import Config
+from app.services.crypto_service import SecureFileTransfer, file_content_digest
+from app.services.delta_sync import BlockSignature, DeltaError, compute_delta
+from app.services.key_pool import get_key_pool
+from app.services.metrics import TRANSFER_BYTES, TRANSFERS
+from app.services.wire_protocol import (
+    SUPPORTED_FEATURES, FEATURE_BINARY, FEATURE_CREDIT, FEATURE_MUX, FEATURE_RESUME, encode_chunk_message,
+    max_chunk_payload
+)
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Thread sinh chunk của gói tin (nén, mã hóa và hash) cho mọi client của process:
+# pool client và hàng đợi job chạy mọi kết nối trên một event loop, loop chỉ còn gửi/nhận
+_package_executor = ThreadPoolExecutor(max_workers=Config.CRYPTO_WORKERS, thread_name_prefix='client-seal')
+
+
+def next_package_part(package_parts):
+    """
+    Sinh chunk tiếp theo của gói tin (prepare_file_package/resume_file_package) ngoài event loop.
+    Header vẫn sinh trên event loop: nó đặt package_params và số thứ tự file của transfer_service dùng chung
+    Args:
+        package_parts (iterator): Gói tin dạng stream, đã lấy header
+    Returns:
+        concurrent.futures.Future: Kết quả là chunk tiếp theo, hoặc None nếu đã hết
+    """
+    return _package_executor.submit(next, package_parts, None)
+
 
 class SecureFileClient:
     """WebSocket Client gửi file an toàn"""
     
-    def __init__(self, server_uri="ws://localhost:8765"):
+    def __init__(self, server_uri="ws://localhost:8765", key_pool=None):
         """
         Khởi tạo client
         Args:
             server_uri (str): URI của WebSocket server
+            key_pool (RSAKeyPool): Pool khóa RSA sinh sẵn (mặc định dùng pool chung)
         """
         self.server_uri = server_uri
         self.websocket = None
         self.transfer_service = SecureFileTransfer()
+        self.key_pool = key_pool or get_key_pool()
         self.receiver_public_key = None
         self.state = 'disconnected'
+        self.features = []  # Tính năng đã thỏa thuận với server (vd: binary frame)
+        self.max_message_size = None  # Giới hạn message của server (server cũ không báo)
+        self.max_streams = None  # Số file server nhận song song trên một kết nối mux
+        # Transfer bị ngắt kết nối, có thể gửi tiếp (xem resume_file): transfer_id -> thông tin gửi tiếp.
+        # Mỗi file một mục vì với mux nhiều file cùng gửi trên một kết nối
+        self.pending_transfers = {}
+        self.retry_after = None  # Số giây server (đang bận) đề nghị chờ trước khi thử lại
+        # Phản hồi của server được task đọc nền chuyển vào hàng đợi theo request_id
+        # (None: hàng đợi chung, dùng khi chưa/không thỏa thuận mux)
+        self._replies = {}
+        self._reader = None
+        self._closed = None
+        self._request_ids = itertools.count(1)
         
     async def connect(self):
         """Kết nối tới WebSocket server"""
         try:
             self.websocket = await websockets.connect(self.server_uri)
             self.state = 'connected'
+            self.features = []
+            self._replies = {None: asyncio.Queue()}
+            self._closed = None
+            self._reader = asyncio.create_task(self._read_replies(self.websocket))
             logger.info(f"Đã kết nối tới server: {self.server_uri}")
             return True
         except Exception as e:
             logger.error(f"Không thể kết nối server: {e}")
             return False
     
+    @property
+    def connected(self):
+        """True nếu kết nối còn mở (task đọc nền chưa thấy kết nối đóng)"""
+        return self.websocket is not None and self.websocket.open and self._closed is None
+    
     async def disconnect(self):
         """Ngắt kết nối khỏi server"""
         if self.websocket:
             await self.websocket.close()
+            if self._reader is not None:
+                # Task đọc nền kết thúc khi kết nối đã đóng
+                await self._reader
+                self._reader = None
             self.state = 'disconnected'
             logger.info("Đã ngắt kết nối khỏi server")
     
-    async def send_message(self, message_data):
+    async def _read_replies(self, websocket):
+        """
+        Task đọc nền: chuyển từng phản hồi của server tới hàng đợi của request_id mà nó mang
+        Args:
+            websocket: Kết nối tới server
+        """
+        closed = None
+        try:
+            async for message in websocket:
+                try:
+                    response = json.loads(message)
+                    request_id = response.get('request_id')
+                except (ValueError, AttributeError):
+                    logger.warning("Bỏ qua phản hồi không đúng định dạng từ server")
+                    continue
+                queue = self._replies.get(request_id)
+                if queue is None and request_id is None:
+                    queue = self._replies[None]
+                if queue is None:
+                    # Transfer đã kết thúc phía client (vd: sau NACK), bỏ qua phản hồi muộn
+                    logger.debug(f"Bỏ qua phản hồi của request_id {request_id} đã kết thúc")
+                    continue
+                queue.put_nowait(response)
+        except websockets.exceptions.ConnectionClosed as e:
+            closed = e
+        finally:
+            # Đánh thức mọi bên đang chờ phản hồi: kết nối đã đóng
+            self._closed = closed or websockets.exceptions.ConnectionClosed(
+                websocket.close_rcvd, websocket.close_sent
+            )
+            for queue in self._replies.values():
+                queue.put_nowait(self._closed)
+    
+    def _open_request(self):
+        """
+        Cấp request_id mới và hàng đợi phản hồi cho nó
+        Returns:
+            int: request_id, hoặc None nếu kết nối không dùng mux (mọi phản hồi vào hàng đợi chung)
+        """
+        if self._closed is not None:
+            raise self._closed
+        if FEATURE_MUX not in self.features:
+            return None
+        request_id = next(self._request_ids)
+        self._replies[request_id] = asyncio.Queue()
+        return request_id
+    
+    def _close_request(self, request_id):
+        """Bỏ hàng đợi của request_id đã xong (phản hồi đến muộn sẽ bị bỏ qua)"""
+        if request_id is not None:
+            self._replies.pop(request_id, None)
+    
+    async def _receive(self, request_id=None):
+        """
+        Đợi phản hồi tiếp theo của request_id
+        Args:
+            request_id (int): ID của yêu cầu (None: hàng đợi chung)
+        Returns:
+            dict: Phản hồi từ server
+        Raises:
+            ConnectionClosed: Nếu kết nối đã đóng
+        """
+        response = await self._replies[request_id].get()
+        if isinstance(response, Exception):
+            raise response
+        return response
+    
+    async def send_message(self, message_data, request_id=None):
         """
         Gửi message tới server
         Args:
             message_data (dict): Dữ liệu message
+            request_id (int): ID của transfer đang mở; None để dùng ID riêng cho message này
         Returns:
             dict: Phản hồi từ server
         """
         if not self.websocket:
             raise Exception("Chưa kết nối tới server")
         
-        # Gửi message
-        await self.websocket.send(json.dumps(message_data))
-        logger.info(f"Đã gửi message type: {message_data.get('type')}")
+        own_request = request_id is None
+        if own_request:
+            request_id = self._open_request()
+        try:
+            # Gửi message
+            await self.post_message(message_data, request_id)
+            logger.info(f"Đã gửi message type: {message_data.get('type')}")
+            
+            # Đợi phản hồi
+            return await self._receive(request_id)
+        finally:
+            if own_request:
+                self._close_request(request_id)
+    
+    async def post_message(self, message_data, request_id=None):
+        """
+        Gửi message tới server mà không đợi phản hồi
+        Args:
+            message_data (dict): Dữ liệu message
+            request_id (int): ID của yêu cầu khi kết nối dùng mux
+        """
+        if not self.websocket:
+            raise Exception("Chưa kết nối tới server")
         
-        # Đợi phản hồi
-        response = await self.websocket.recv()
-        return json.loads(response)
+        if request_id is not None:
+            message_data = dict(message_data, request_id=request_id)
+        await self.websocket.send(json.dumps(message_data))
     
     async def perform_handshake(self):
         """
@@ -77,14 +221,21 @@ class SecureFileClient:
             # Gửi "Hello!"
             response = await self.send_message({
                 'type': 'hello',
-                'message': 'Hello!'
+                'message': 'Hello!',
+                'features': list(SUPPORTED_FEATURES)
             })
             
             if (response.get('type') == 'handshake_response' and 
                 response.get('message') == 'Ready!'):
+                # Server cũ không trả 'features' -> dùng JSON
+                self.features = [f for f in response.get('features') or [] if f in SUPPORTED_FEATURES]
+                self.max_message_size = response.get('max_message_size')
+                self.max_streams = response.get('max_streams')
                 self.state = 'handshake_complete'
-                logger.info("Handshake thành công")
+                logger.info(f"Handshake thành công (tính năng: {self.features or 'json'})")
                 return True
+            elif self._note_busy(response):
+                return False
             else:
                 logger.error(f"Handshake thất bại: {response}")
                 return False
@@ -100,8 +251,13 @@ class SecureFileClient:
             bool: True nếu thành công
         """
         try:
-            # Khởi tạo sender và lấy public key
-            sender_public_key = self.transfer_service.initialize_sender()
+            if self.transfer_service.sender_private_key is not None:
+                # Kết nối lại: dùng lại cặp khóa cũ để server nhận ra người gửi của transfer dở dang
+                sender_public_key = self.transfer_service.sender_public_key.export_key().decode('utf-8')
+            else:
+                # Khởi tạo sender bằng cặp khóa lấy từ pool và lấy public key
+                keypair = await self.key_pool.acquire_async()
+                sender_public_key = self.transfer_service.initialize_sender(keypair)
             
             # Gửi public key tới server
             response = await self.send_message({
@@ -125,14 +281,61 @@ class SecureFileClient:
             logger.error(f"Lỗi trao đổi khóa: {e}")
             return False
     
-    async def send_file(self, file_path):
+    async def open_session(self):
         """
-        Gửi file đã mã hóa tới server
+        Mở phiên nhiều file: trao bí mật phiên một lần (RSA), các file sau
+        dùng khóa suy ra bằng HKDF nên không tốn thêm thao tác RSA
+        Returns:
+            bool: True nếu thành công
+        """
+        try:
+            encrypted_secret, signature = self.transfer_service.create_session()
+            response = await self.send_message({
+                'type': 'session_init',
+                'encrypted_secret': encrypted_secret,
+                'signature': signature
+            })
+            
+            if response.get('status') == 'success':
+                self.state = 'session_open'
+                logger.info("Mở phiên nhiều file thành công")
+                return True
+            
+            # Server không nhận phiên: quay về chế độ envelope từng file
+            self.transfer_service.session_secret = None
+            logger.error(f"Mở phiên thất bại: {response}")
+            return False
+            
+        except Exception as e:
+            self.transfer_service.session_secret = None
+            logger.error(f"Lỗi mở phiên: {e}")
+            return False
+    
+    async def connect_session(self):
+        """
+        Kết nối, handshake, trao khóa và mở phiên nhiều file: sau bước này mỗi file
+        không tốn thêm thao tác RSA nào
+        Returns:
+            bool: True nếu thành công
+        """
+        return (await self.connect()
+                and await self.perform_handshake()
+                and await self.exchange_keys()
+                and await self.open_session())
+    
+    async def send_file(self, file_path, progress=None, content_digest=None):
+        """
+        Gửi file đã mã hóa tới server. Với mux, mọi message của file mang chung một request_id
+        nên có thể gọi song song nhiều lần trên cùng kết nối (xem send_files)
         Args:
             file_path (str): Đường dẫn file cần gửi
+            progress (callable): Nếu có, được gọi progress(số chunk đã gửi, tổng số chunk) sau mỗi chunk
+                (tổng là None khi gửi delta vì chưa biết trước)
+            content_digest (str): SHA-512 hex của nội dung nếu đã biết (vd: tính khi upload), để không phải hash lại file
         Returns:
             bool: True nếu thành công
         """
+        request_id = transfer_id = None
         try:
             # Kiểm tra file tồn tại
             if not Path(file_path).exists():
@@ -141,41 +344,346 @@ class SecureFileClient:
             
             logger.info(f"Đang chuẩn bị gửi file: {file_path}")
             
-            # Chuẩn bị gói tin file
-            metadata_signature, encrypted_session_key, file_package = \
-                self.transfer_service.prepare_file_package(file_path)
+            # Digest nội dung để server bỏ qua file đã có (dedup), kiểm tra bản dựng lại từ delta
+            # và file không đổi khi gửi tiếp sau mất kết nối
+            flow_control = FEATURE_CREDIT in self.features
+            resumable = Config.RESUME_ENABLED and flow_control and FEATURE_RESUME in self.features
+            use_delta = Config.DELTA_ENABLED and Path(file_path).stat().st_size >= Config.DELTA_MIN_SIZE
+            if content_digest is None and (Config.DEDUP_ENABLED or use_delta or resumable):
+                content_digest = await asyncio.to_thread(file_content_digest, file_path)
             
-            # Tạo metadata
-            filename = Path(file_path).name
-            metadata = self.transfer_service.crypto.create_metadata(filename)
+            # Server đã có bản cũ cùng tên thì chỉ gửi phần thay đổi
+            request_id = self._open_request()
+            delta = await self.plan_delta(file_path, request_id) if use_delta else None
             
-            # Gửi gói tin file
-            response = await self.send_message({
-                'type': 'file_transfer',
-                'metadata': metadata,
-                'metadata_signature': metadata_signature,
-                'encrypted_session_key': encrypted_session_key,
-                'file_package': file_package
-            })
+            # Chuẩn bị gói tin file dạng stream: header rồi tới từng chunk
+            binary = FEATURE_BINARY in self.features
+            package_parts = self.transfer_service.prepare_file_package(
+                file_path, chunk_size=self._max_chunk_size(binary),
+                content_digest=content_digest, delta=delta
+            )
             
-            # Kiểm tra phản hồi
-            if response.get('type') == 'ack':
-                logger.info(f"File gửi thành công: {response.get('message')}")
-                return True
-            elif response.get('type') == 'nack':
-                logger.error(f"File bị từ chối: {response.get('message')}")
-                return False
-            else:
-                logger.error(f"Phản hồi không mong đợi: {response}")
-                return False
+            # Gửi header gói tin (metadata đã ký, session key đã mã hóa)
+            message = {
+                'type': 'file_begin' if flow_control else 'file_transfer',
+                'header': next(package_parts)
+            }
+            # Lấy ngay sau khi sinh header: các file gửi song song dùng chung transfer_service
+            package_params = self.transfer_service.package_params
+            if resumable and delta is None:
+                transfer_id = message['transfer_id'] = os.urandom(16).hex()
+            await self.post_message(message, request_id)
+            
+            credit = None
+            if flow_control or content_digest:
+                # Server trả lời ACK (đã có nội dung), send_chunks (cần dữ liệu, kèm credit) hoặc NACK
+                response = await self._receive(request_id)
+                if response.get('type') != 'send_chunks':
+                    package_parts.close()
+                    return self._handle_transfer_response(response, transfer_id)
+                if flow_control:
+                    credit = int(response.get('credit', 0))
+                if transfer_id is not None and response.get('resumable'):
+                    stat = os.stat(file_path)
+                    self.pending_transfers[transfer_id] = {
+                        'transfer_id': transfer_id,
+                        'file_path': str(file_path),
+                        'params': package_params,
+                        'content_digest': content_digest,
+                        'size': stat.st_size,
+                        'mtime_ns': stat.st_mtime_ns
+                    }
+            
+            on_chunk = None
+            if progress is not None:
+                total = None if delta is not None else max(
+                    1, -(-os.path.getsize(file_path) // package_params['chunk_size']))
+                on_chunk = functools.partial(progress, total=total)
+            return await self._send_chunks(package_parts, binary, credit, request_id=request_id,
+                                           progress=on_chunk, transfer_id=transfer_id)
                 
+        except (websockets.exceptions.ConnectionClosed, OSError) as e:
+            # Giữ pending_transfers[transfer_id] (nếu có) để gửi tiếp khi kết nối lại
+            TRANSFERS.inc(role='client', status='interrupted')
+            logger.error(f"Mất kết nối khi gửi file: {e}")
+            return False
         except Exception as e:
+            self.pending_transfers.pop(transfer_id, None)
             logger.error(f"Lỗi gửi file: {e}")
             return False
+        finally:
+            self._close_request(request_id)
+    
+    async def resume_file(self):
+        """
+        Gửi tiếp lần lượt mọi transfer bị ngắt (pending_transfers) trên kết nối hiện tại
+        Returns:
+            bool: True nếu mọi file đã được lưu; False nếu còn file chưa gửi xong (vd: lại mất kết nối);
+                None nếu có file không gửi tiếp được (cần gửi lại từ đầu)
+        """
+        results = [await self.resume_transfer(transfer_id) for transfer_id in list(self.pending_transfers)]
+        if False in results:
+            return False
+        return None if None in results else True
+    
+    async def resume_transfer(self, transfer_id):
+        """
+        Gửi tiếp một transfer bị ngắt trên kết nối hiện tại
+        Args:
+            transfer_id (str): Khóa trong pending_transfers
+        Returns:
+            bool: True nếu file đã được lưu; None nếu không gửi tiếp được (cần gửi lại từ đầu)
+        """
+        pending = self.pending_transfers[transfer_id]
+        file_path = pending['file_path']
+        request_id = None
+        try:
+            # Chunk gửi tiếp dùng lại khóa và nonce cũ: chỉ an toàn khi nội dung file không đổi
+            stat = os.stat(file_path)
+            unchanged = ((stat.st_size, stat.st_mtime_ns) == (pending['size'], pending['mtime_ns'])
+                         and await asyncio.to_thread(file_content_digest, file_path) == pending['content_digest'])
+            if not unchanged:
+                logger.warning(f"File {file_path} đã thay đổi kể từ lần gửi trước, gửi lại từ đầu")
+                del self.pending_transfers[transfer_id]
+                return None
+            
+            request_id = self._open_request()
+            response = await self.send_message({
+                'type': 'file_resume',
+                'transfer_id': transfer_id
+            }, request_id)
+            if self._note_busy(response):
+                return False
+            if response.get('type') != 'resume_from':
+                logger.warning(f"Server không nhận tiếp được transfer: {response.get('message')}")
+                del self.pending_transfers[transfer_id]
+                return None
+            
+            next_index = int(response['next_index'])
+            logger.info(f"Gửi tiếp file {file_path} từ chunk {next_index} (byte {response.get('offset')})")
+            package_parts = self.transfer_service.resume_file_package(file_path, pending['params'], next_index)
+            return await self._send_chunks(
+                package_parts, FEATURE_BINARY in self.features, int(response.get('credit', 0)), next_index,
+                request_id, transfer_id=transfer_id
+            )
+            
+        except (websockets.exceptions.ConnectionClosed, OSError) as e:
+            TRANSFERS.inc(role='client', status='interrupted')
+            logger.error(f"Mất kết nối khi gửi tiếp file: {e}")
+            return False
+        except Exception as e:
+            self.pending_transfers.pop(transfer_id, None)
+            logger.error(f"Lỗi gửi tiếp file: {e}")
+            return False
+        finally:
+            self._close_request(request_id)
+    
+    async def _send_chunks(self, package_parts, binary, credit, sent=0, request_id=None, progress=None,
+                           transfer_id=None):
+        """
+        Gửi các chunk đã mã hóa rồi đợi ACK/NACK
+        Args:
+            package_parts (iterator): Các chunk đã mã hóa
+            binary (bool): True để gửi bằng binary frame
+            credit (int): Số chunk được gửi trước khi chờ server cấp thêm; None nếu không điều khiển luồng
+            sent (int): Số chunk server đã nhận trước đó (khi gửi tiếp)
+            request_id (int): ID transfer khi kết nối dùng mux
+            progress (callable): Nếu có, được gọi với số chunk đã gửi sau mỗi chunk
+            transfer_id (str): Khóa trong pending_transfers nếu transfer gửi tiếp được
+        Returns:
+            bool: True nếu file đã được lưu
+        """
+        # Gửi lần lượt từng chunk đã mã hóa (binary frame nếu server hỗ trợ); chunk được sinh ngoài event loop
+        sealing = None
+        try:
+            while True:
+                sealing = next_package_part(package_parts)
+                chunk = await asyncio.wrap_future(sealing)
+                if chunk is None:
+                    break
+                if credit is not None:
+                    # Hết credit: chờ server ghi xong và cấp thêm (hoặc NACK sớm)
+                    while credit <= 0:
+                        response = await self._receive(request_id)
+                        if response.get('type') != 'credit':
+                            return self._handle_transfer_response(response, transfer_id)
+                        credit += int(response.get('credit', 0))
+                    credit -= 1
+                message = encode_chunk_message(chunk, binary, request_id)
+                await self.websocket.send(message)
+                TRANSFER_BYTES.inc(len(message), direction='out')
+                sent += 1
+                if progress is not None:
+                    progress(sent)
+        finally:
+            if sealing is None:
+                package_parts.close()
+            else:
+                # Task bị hủy khi thread còn đang sinh chunk: đóng generator sau khi thread xong
+                sealing.add_done_callback(lambda _: package_parts.close())
+        
+        if credit is not None:
+            await self.post_message({'type': 'file_end', 'chunks': sent}, request_id)
+        
+        # Đợi ACK/NACK sau chunk cuối (hoặc NACK sớm nếu có chunk lỗi)
+        response = await self._receive(request_id)
+        while response.get('type') == 'credit':
+            response = await self._receive(request_id)
+        return self._handle_transfer_response(response, transfer_id)
+    
+    def _stream_limit(self, concurrency=None):
+        """
+        Số file được gửi song song trên kết nối mux
+        Args:
+            concurrency (int): Số bên gọi muốn (mặc định Config.MUX_MAX_STREAMS)
+        Returns:
+            int: Số file, không vượt max_streams server báo khi handshake
+        """
+        limit = concurrency or Config.MUX_MAX_STREAMS
+        if self.max_streams:
+            limit = min(limit, int(self.max_streams))
+        return max(1, limit)
+    
+    def _max_chunk_size(self, binary):
+        """
+        Kích thước chunk để mỗi message file_chunk lọt giới hạn message của server
+        Args:
+            binary (bool): True nếu chunk đi bằng binary frame
+        Returns:
+            int: Kích thước chunk, hoặc None để dùng mặc định
+        """
+        if not self.max_message_size:
+            return None
+        limit = max_chunk_payload(int(self.max_message_size), binary)
+        return min(self.transfer_service.crypto.chunk_size, limit)
+    
+    async def request_delta_signature(self, filename, request_id=None):
+        """
+        Xin server chữ ký các block của bản đang lưu cùng tên
+        Args:
+            filename (str): Tên file trên server
+            request_id (int): ID transfer sẽ gửi delta (server giữ bản cũ cho đúng transfer đó)
+        Returns:
+            BlockSignature: Chữ ký bản cũ, hoặc None nếu server không có bản cũ
+        """
+        response = await self.send_message({
+            'type': 'delta_signature_request',
+            'filename': filename
+        }, request_id)
+        if response.get('type') != 'delta_signature' or not response.get('available'):
+            return None
+        try:
+            return BlockSignature.from_message(response)
+        except DeltaError as e:
+            logger.warning(f"Bỏ qua chữ ký delta không hợp lệ: {e}")
+            return None
+    
+    async def plan_delta(self, file_path, request_id=None):
+        """
+        Tính delta của file so với bản cũ trên server
+        Args:
+            file_path (str): Đường dẫn file cần gửi
+            request_id (int): ID transfer sẽ gửi file
+        Returns:
+            DeltaPlan: Chuỗi lệnh delta, hoặc None nếu nên gửi cả file
+        """
+        signature = await self.request_delta_signature(Path(file_path).name, request_id)
+        if signature is None:
+            return None
+        
+        def compute():
+            with open(file_path, 'rb') as f:
+                return compute_delta(f, signature)
+        
+        # Dò checksum cuộn tốn CPU, chạy ngoài event loop
+        delta = await asyncio.to_thread(compute)
+        if delta is None:
+            logger.info("Delta không có lợi, gửi toàn bộ file")
+        else:
+            logger.info(f"Gửi delta: {delta.literal_bytes}/{delta.target_size} byte mới")
+        return delta
+    
+    def _handle_transfer_response(self, response, transfer_id=None):
+        """
+        Kiểm tra phản hồi cuối của server cho một file
+        Args:
+            response (dict): Message ACK/NACK từ server
+            transfer_id (str): Khóa trong pending_transfers của file (nếu có)
+        Returns:
+            bool: True nếu file đã được lưu
+        """
+        if self._note_busy(response):
+            # Server quá tải: giữ pending_transfers[transfer_id] (nếu có) để gửi tiếp khi thử lại
+            TRANSFERS.inc(role='client', status='busy')
+            return False
+        # Server đã có kết quả cuối cho file, không còn gì để gửi tiếp
+        self.pending_transfers.pop(transfer_id, None)
+        if response.get('type') == 'ack':
+            TRANSFERS.inc(role='client', status='deduplicated' if response.get('deduplicated') else 'saved')
+            if response.get('deduplicated'):
+                logger.info(f"Server đã có nội dung file, bỏ qua truyền dữ liệu: {response.get('message')}")
+            else:
+                logger.info(f"File gửi thành công: {response.get('message')}")
+            return True
+        elif response.get('type') == 'nack':
+            TRANSFERS.inc(role='client', status='rejected')
+            logger.error(f"File bị từ chối: {response.get('message')}")
+            return False
+        else:
+            TRANSFERS.inc(role='client', status='error')
+            logger.error(f"Phản hồi không mong đợi: {response}")
+            return False
+    
+    def _note_busy(self, response):
+        """
+        Ghi nhận phản hồi 'busy' của server
+        Args:
+            response (dict): Message từ server
+        Returns:
+            bool: True nếu server báo bận (retry_after đã được lưu)
+        """
+        if response.get('type') != 'busy':
+            return False
+        try:
+            self.retry_after = max(0.0, float(response.get('retry_after', Config.BUSY_RETRY_AFTER)))
+        except (TypeError, ValueError):
+            self.retry_after = Config.BUSY_RETRY_AFTER
+        logger.warning(f"Server bận: {response.get('message')}")
+        return True
     
     async def send_file_secure(self, file_path):
         """
-        Quy trình hoàn chỉnh gửi file an toàn
+        Quy trình hoàn chỉnh gửi file an toàn. Nếu mất kết nối giữa chừng và server giữ
+        transfer dở dang, client kết nối lại và gửi tiếp từ chunk server đã xác minh
+        (tối đa Config.RESUME_ATTEMPTS lần, chờ tăng dần giữa các lần). Server báo bận
+        thì thử lại sau retry_after giây (tối đa Config.BUSY_RETRY_ATTEMPTS lần)
+        Args:
+            file_path (str): Đường dẫn file cần gửi
+        Returns:
+            bool: True nếu thành công
+        """
+        self.pending_transfers.clear()
+        delay = Config.RESUME_RETRY_DELAY
+        resume_attempts = busy_attempts = 0
+        while True:
+            self.retry_after = None
+            if await self._send_file_attempt(file_path):
+                return True
+            if self.retry_after is not None and busy_attempts < Config.BUSY_RETRY_ATTEMPTS:
+                busy_attempts += 1
+                wait = self.retry_after
+                logger.warning(f"Thử lại sau {wait:.1f} giây vì server bận (lần {busy_attempts})")
+            elif self.pending_transfers and resume_attempts < Config.RESUME_ATTEMPTS:
+                resume_attempts += 1
+                wait, delay = delay, delay * 2
+                logger.warning(f"Thử kết nối lại để gửi tiếp sau {wait:.1f} giây (lần {resume_attempts})")
+            else:
+                return False
+            await asyncio.sleep(wait)
+    
+    async def _send_file_attempt(self, file_path):
+        """
+        Một lần kết nối gửi file (gửi tiếp nếu có pending_transfers)
         Args:
             file_path (str): Đường dẫn file cần gửi
         Returns:
@@ -196,8 +704,11 @@ class SecureFileClient:
             if not await self.exchange_keys():
                 return False
             
-            # 4. Gửi file
-            if not await self.send_file(file_path):
+            # 4. Gửi file (hoặc gửi tiếp phần còn lại nếu lần trước bị ngắt)
+            success = await self.resume_file() if self.pending_transfers else None
+            if success is None:
+                success = await self.send_file(file_path)
+            if not success:
                 return False
             
             logger.info("=== GỬI FILE THÀNH CÔNG ===")
@@ -210,6 +721,46 @@ class SecureFileClient:
             await self.disconnect()
 
 
+    async def send_files(self, file_paths, concurrency=None):
+        """
+        Gửi nhiều file trên một kết nối, chỉ trao khóa RSA một lần cho cả phiên.
+        Nếu server hỗ trợ mux, nhiều file được gửi song song trên kết nối để che độ trễ khứ hồi
+        Args:
+            file_paths (list): Danh sách đường dẫn file
+            concurrency (int): Số file gửi song song (mặc định Config.MUX_MAX_STREAMS,
+                không vượt số server cho phép)
+        Returns:
+            dict: Kết quả gửi từng file {file_path: bool}
+        """
+        results = {str(file_path): False for file_path in file_paths}
+        try:
+            logger.info(f"=== BẮT ĐẦU PHIÊN GỬI {len(results)} FILE ===")
+            
+            if not await self.connect_session():
+                return results
+            
+            if FEATURE_MUX in self.features:
+                slots = asyncio.Semaphore(self._stream_limit(concurrency))
+                
+                async def send_one(file_path):
+                    async with slots:
+                        results[file_path] = await self.send_file(file_path)
+                
+                await asyncio.gather(*(send_one(file_path) for file_path in results))
+            else:
+                for file_path in results:
+                    results[file_path] = await self.send_file(file_path)
+            
+            logger.info(f"=== KẾT THÚC PHIÊN: {sum(results.values())}/{len(results)} FILE THÀNH CÔNG ===")
+            return results
+            
+        except Exception as e:
+            logger.error(f"Lỗi phiên gửi file: {e}")
+            return results
+        finally:
+            await self.disconnect()
+
+
 # Hàm test client
 async def test_send_file(file_path="test_files/finance.txt"):
     """
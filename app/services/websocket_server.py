@@ -4,24 +4,115 @@ Thực hiện handshake, trao khóa và truyền file theo đề tài 4
 """
 
 import json
+import base64
+import functools
+import time
 import asyncio
+import weakref
 import websockets
 import logging
 from pathlib import Path
-from app.services.crypto_service import SecureFileTransfer
+from app.config import Config
+from app.services.admission import AdmissionLimiter
+from app.services.crypto_service import (
+    PackageDecryptor, PackageVerificationError, SecureFileTransfer, open_chunk
+)
+from app.services.content_index import ContentIndex
+from app.services.delta_sync import compute_signature
+from app.services.key_pool import get_key_pool
+from app.services.key_registry import key_fingerprint
+from app.services.metrics import (
+    TRANSFER_BYTES, TRANSFERS, WS_CONNECTIONS, WS_MESSAGE_SECONDS, registry, start_metrics_server
+)
+from app.services.offload import LoopLagMonitor, get_offload_executor
+from app.services.received_file import ReceivedFileWriter
+from app.services.received_index import get_received_files_index
+from app.services.transfer_journal import TransferJournal
+from app.services.wire_protocol import (
+    FEATURE_CREDIT, FEATURE_MUX, FEATURE_RESUME, FrameError, decode_chunk, decode_frame, negotiate_features,
+    valid_request_id
+)
 
 # Cấu hình logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Các server đang tồn tại trong process, để metric dạng gauge đọc trạng thái lúc xuất
+_servers = weakref.WeakSet()
+
+# Loại message có nhãn riêng trong metric thời gian xử lý (loại khác gộp thành 'other')
+MESSAGE_TYPES = (
+    'hello', 'key_exchange', 'session_init', 'file_transfer', 'file_begin', 'delta_signature_request',
+    'file_chunk', 'file_resume', 'file_end', 'receiver_ready'
+)
+
+# Trạng thái client đã trao khóa xong (được báo dedup hit)
+KEYED_STATES = ('keys_exchanged', 'session_open')
+
 
 class SecureFileServer:
     """WebSocket Server xử lý truyền file an toàn"""
     
-    def __init__(self):
-        """Khởi tạo server"""
+    def __init__(self, key_pool=None, received_dir='received_files', offload=None,
+                 max_message_size=None, credit_window=None, max_connections=None,
+                 max_transfers=None, max_buffered_bytes=None, admission_timeout=None, max_streams=None):
+        """
+        Khởi tạo server
+        Args:
+            key_pool (RSAKeyPool): Pool khóa RSA sinh sẵn (mặc định dùng pool chung)
+            received_dir (str | Path): Thư mục lưu file nhận được
+            offload (OffloadExecutor): Nơi chạy xác minh/giải mã ngoài event loop (mặc định dùng executor chung)
+            max_message_size (int): Giới hạn kích thước message WebSocket (báo cho client khi handshake)
+            credit_window (int): Số chunk client được gửi trước khi chờ server cấp thêm
+            max_connections (int): Số kết nối được phục vụ cùng lúc
+            max_transfers (int): Số file được nhận cùng lúc
+            max_buffered_bytes (int): Tổng ciphertext chờ giải mã được giữ trong bộ nhớ
+            admission_timeout (float): Thời gian chờ tối đa trong hàng đợi trước khi trả 'busy' (giây)
+            max_streams (int): Số file một kết nối mux được nhận cùng lúc
+        """
         self.clients = {}  # Lưu thông tin clients kết nối
         self.file_transfer = SecureFileTransfer()
+        self.key_pool = key_pool or get_key_pool()
+        self.received_dir = Path(received_dir)
+        self.content_index = ContentIndex(self.received_dir)  # Chỉ mục nội dung để dedup
+        self.file_index = get_received_files_index(self.received_dir)  # Danh sách file cho /list_received_files
+        self.offload = offload or get_offload_executor()
+        self.loop_lag = LoopLagMonitor(Config.LOOP_LAG_INTERVAL, Config.LOOP_LAG_WARN)
+        self.max_message_size = max_message_size or Config.WS_MAX_MESSAGE_SIZE
+        self.credit_window = max(1, credit_window or Config.TRANSFER_CREDIT_WINDOW)
+        # Nhật ký transfer dở dang để client mất kết nối nhận tiếp được
+        self.journal = TransferJournal(self.received_dir, Config.RESUME_TTL)
+        self.active_transfers = set()  # ID transfer đang có kết nối nhận
+        # Giới hạn tải: vượt giới hạn thì chờ theo thứ tự đến, quá hạn thì client nhận 'busy'
+        self.connection_limiter = AdmissionLimiter(
+            'connections', max_connections or Config.SERVER_MAX_CONNECTIONS
+        )
+        self.transfer_limiter = AdmissionLimiter('transfers', max_transfers or Config.SERVER_MAX_TRANSFERS)
+        self.buffer_limiter = AdmissionLimiter(
+            'buffered_bytes', max_buffered_bytes or Config.SERVER_MAX_BUFFERED_BYTES
+        )
+        self.admission_timeout = admission_timeout or Config.ADMISSION_TIMEOUT
+        self.max_streams = max(1, max_streams or Config.MUX_MAX_STREAMS)
+        self.draining = False  # Đang dừng: không nhận transfer mới
+        _servers.add(self)
+    
+    def stats(self):
+        """
+        Thống kê server
+        Returns:
+            dict: Số client, độ trễ event loop, executor xác minh/giải mã, dedup, nhận tiếp và hàng đợi
+        """
+        return {
+            'clients': len(self.clients),
+            'loop_lag': self.loop_lag.stats(),
+            'offload': self.offload.stats(),
+            'dedup': self.content_index.stats(),
+            'resume': dict(self.journal.stats(), active=len(self.active_transfers)),
+            'admission': {
+                limiter.name: limiter.stats()
+                for limiter in (self.connection_limiter, self.transfer_limiter, self.buffer_limiter)
+            }
+        }
         
     async def handle_client(self, websocket):
         """
@@ -31,18 +122,35 @@ class SecureFileServer:
         """
         client_id = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
         logger.info(f"Client {client_id} đã kết nối")
+        self.loop_lag.start()
+        
+        # Quá nhiều kết nối: chờ tới lượt trước khi đọc message nào của client
+        if not await self.connection_limiter.acquire(timeout=self.admission_timeout):
+            logger.warning(f"Từ chối client {client_id}: đã đủ {self.connection_limiter.limit} kết nối")
+            try:
+                await websocket.send(json.dumps(self.busy_message(self.connection_limiter)))
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            return
+        WS_CONNECTIONS.inc()
         
         try:
             # Đăng ký client
             self.clients[client_id] = {
                 'websocket': websocket,
                 'state': 'connected',
-                'transfer_service': SecureFileTransfer()
+                'transfer_service': SecureFileTransfer(),
+                'features': [],
+                'streams': {}  # Trạng thái transfer theo request_id (None khi không dùng mux)
             }
             
             # Xử lý các message từ client
             async for message in websocket:
-                await self.process_message(client_id, message)
+                if FEATURE_MUX in self.clients[client_id]['features']:
+                    # Mux: message của các request_id khác nhau được xử lý song song
+                    await self.dispatch_message(client_id, message)
+                else:
+                    await self.process_message(client_id, message)
                 
         except websockets.exceptions.ConnectionClosed:
             logger.info(f"Client {client_id} đã ngắt kết nối")
@@ -51,22 +159,149 @@ class SecureFileServer:
         finally:
             # Cleanup khi client ngắt kết nối
             if client_id in self.clients:
+                client_info = self.clients[client_id]
+                # Message mux đang xử lý được chạy nốt (như message đang xử lý khi không mux)
+                if client_info.get('tasks'):
+                    await asyncio.gather(*client_info['tasks'], return_exceptions=True)
+                # Mất kết nối giữa chừng: transfer có nhật ký được giữ lại để nhận tiếp
+                for stream in list(client_info['streams'].values()):
+                    await self.abort_incoming(stream, keep_partial=True)
+                    self.release_delta_basis(stream)
                 del self.clients[client_id]
+            WS_CONNECTIONS.dec()
+            self.connection_limiter.release()
     
-    async def process_message(self, client_id, message):
+    @staticmethod
+    def decode_message(message):
+        """
+        Tách message thành phần JSON và ciphertext thô
+        Args:
+            message (str | bytes): Message JSON (text frame) hoặc binary frame
+        Returns:
+            tuple: (message dict, payload memoryview hoặc None)
+        Raises:
+            ValueError: Nếu message không đúng định dạng (JSONDecodeError, FrameError)
+        """
+        if isinstance(message, bytes):
+            # Binary frame: header JSON + ciphertext thô (không Base64)
+            return decode_frame(message)
+        return json.loads(message), None
+    
+    def request_id(self, client_id, data):
+        """
+        request_id của message
+        Args:
+            client_id (str): ID client
+            data (dict): Message từ client
+        Returns:
+            int | str: request_id nếu kết nối dùng mux và ID hợp lệ, ngược lại None
+        """
+        request_id = data.get('request_id')
+        if FEATURE_MUX in self.clients[client_id]['features'] and valid_request_id(request_id):
+            return request_id
+        return None
+    
+    def get_stream(self, client_id, data, create=True):
+        """
+        Trạng thái transfer (file đang nhận, credit, chỗ transfer...) mà message thuộc về
+        Args:
+            client_id (str): ID client
+            data (dict): Message từ client
+            create (bool): Tạo trạng thái mới nếu request_id chưa có
+        Returns:
+            dict: Trạng thái transfer, hoặc None nếu chưa có và create=False
+        """
+        streams = self.clients[client_id]['streams']
+        request_id = self.request_id(client_id, data)
+        stream = streams.get(request_id)
+        if stream is None and create:
+            stream = streams[request_id] = {'request_id': request_id}
+        return stream
+    
+    def drop_stream(self, client_id, stream):
+        """Bỏ trạng thái của transfer đã kết thúc (request_id có thể được dùng lại)"""
+        streams = self.clients[client_id]['streams']
+        if streams.get(stream['request_id']) is stream:
+            del streams[stream['request_id']]
+    
+    async def reply(self, client_id, message, request_id=None):
+        """
+        Gửi message tới client, kèm request_id của yêu cầu được trả lời
+        Args:
+            client_id (str): ID client
+            message (dict): Message phản hồi
+            request_id (int | str): request_id của yêu cầu (None nếu không dùng mux)
+        """
+        if request_id is not None:
+            message['request_id'] = request_id
+        await self.clients[client_id]['websocket'].send(json.dumps(message))
+    
+    async def dispatch_message(self, client_id, message):
+        """
+        Đưa message vào hàng xử lý theo request_id: message cùng ID chạy tuần tự đúng thứ tự đến
+        (các chunk của một file), message khác ID chạy song song. Số message đang chờ của kết nối
+        có giới hạn; đầy thì server ngừng đọc nên TCP tự chặn người gửi
+        Args:
+            client_id (str): ID client
+            message (str | bytes): Message từ client
+        """
+        client_info = self.clients[client_id]
+        try:
+            decoded = self.decode_message(message)
+        except ValueError:
+            decoded = None
+        if decoded is None or not isinstance(decoded[0], dict):
+            # Message lỗi định dạng: trả lỗi ngay
+            await self.process_message(client_id, message)
+            return
+        
+        request_id = self.request_id(client_id, decoded[0])
+        await client_info['pending'].acquire()
+        previous = client_info['tails'].get(request_id)
+        task = asyncio.create_task(self._process_in_order(client_id, message, decoded, previous))
+        client_info['tails'][request_id] = task
+        client_info['tasks'].add(task)
+        task.add_done_callback(functools.partial(self._message_done, client_info, request_id))
+    
+    async def _process_in_order(self, client_id, message, decoded, previous):
+        if previous is not None:
+            # Chờ message trước cùng request_id xử lý xong
+            await asyncio.wait((previous,))
+        try:
+            await self.process_message(client_id, message, decoded)
+        except websockets.exceptions.ConnectionClosed:
+            pass  # handle_client dọn dẹp khi vòng đọc message kết thúc
+    
+    @staticmethod
+    def _message_done(client_info, request_id, task):
+        client_info['tasks'].discard(task)
+        client_info['pending'].release()
+        if client_info['tails'].get(request_id) is task:
+            del client_info['tails'][request_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Lỗi xử lý message: {task.exception()}")
+    
+    async def process_message(self, client_id, message, decoded=None):
         """
         Xử lý message từ client theo luồng đề tài 4
         Args:
             client_id (str): ID của client
-            message (str): Message JSON từ client
+            message (str | bytes): Message JSON (text frame) hoặc binary frame từ client
+            decoded (tuple): Kết quả decode_message nếu đã tách sẵn
         """
+        started = time.perf_counter()
+        message_type = None
+        request_id = None
         try:
-            data = json.loads(message)
+            data, payload = decoded if decoded is not None else self.decode_message(message)
+            request_id = self.request_id(client_id, data)
             message_type = data.get('type')
-            client_info = self.clients[client_id]
-            websocket = client_info['websocket']
             
-            logger.info(f"Client {client_id} gửi message type: {message_type}")
+            if message_type == 'file_chunk':
+                TRANSFER_BYTES.inc(len(message), direction='in')
+                logger.debug(f"Client {client_id} gửi chunk {data.get('chunk', {}).get('index')}")
+            else:
+                logger.info(f"Client {client_id} gửi message type: {message_type}")
             
             # 1. HANDSHAKE - Bắt tay ban đầu
             if message_type == 'hello':
@@ -76,31 +311,59 @@ class SecureFileServer:
             elif message_type == 'key_exchange':
                 await self.handle_key_exchange(client_id, data)
                 
-            # 3. FILE_TRANSFER - Gửi file đã mã hóa
-            elif message_type == 'file_transfer':
-                await self.handle_file_transfer(client_id, data)
+            # 2b. SESSION_INIT - Trao bí mật phiên một lần cho nhiều file
+            elif message_type == 'session_init':
+                await self.handle_session_init(client_id, data)
+                
+            # 3. FILE_TRANSFER / FILE_BEGIN - Header gói tin file đã mã hóa
+            # (file_begin: luồng có điều khiển credit, kết thúc bằng file_end)
+            elif message_type in ('file_transfer', 'file_begin'):
+                await self.handle_file_transfer(client_id, data, flow_control=message_type == 'file_begin')
+                
+            # 3a. DELTA_SIGNATURE_REQUEST - Xin chữ ký bản cũ để gửi dạng delta
+            elif message_type == 'delta_signature_request':
+                await self.handle_delta_signature_request(client_id, data)
+                
+            # 3b. FILE_CHUNK - Từng chunk đã mã hóa của file
+            elif message_type == 'file_chunk':
+                await self.handle_file_chunk(client_id, data, payload)
+                
+            # 3c. FILE_RESUME - Nhận tiếp transfer bị ngắt kết nối
+            elif message_type == 'file_resume':
+                await self.handle_file_resume(client_id, data)
+                
+            # 3d. FILE_END - Người gửi đã gửi hết chunk (luồng file_begin)
+            elif message_type == 'file_end':
+                await self.handle_file_end(client_id, data)
                 
             # 4. RECEIVER_READY - Người nhận sẵn sàng
             elif message_type == 'receiver_ready':
                 await self.handle_receiver_ready(client_id, data)
                 
             else:
-                await websocket.send(json.dumps({
+                await self.reply(client_id, {
                     'type': 'error',
                     'message': f'Loại message không hỗ trợ: {message_type}'
-                }))
+                }, request_id)
                 
-        except json.JSONDecodeError:
-            await websocket.send(json.dumps({
+        except websockets.exceptions.ConnectionClosed:
+            raise
+        except (json.JSONDecodeError, FrameError):
+            await self.reply(client_id, {
                 'type': 'error',
                 'message': 'Message không đúng định dạng JSON'
-            }))
+            }, request_id)
         except Exception as e:
             logger.error(f"Lỗi xử lý message: {e}")
-            await websocket.send(json.dumps({
+            await self.reply(client_id, {
                 'type': 'error',
                 'message': f'Lỗi server: {str(e)}'
-            }))
+            }, request_id)
+        finally:
+            WS_MESSAGE_SECONDS.observe(
+                time.perf_counter() - started,
+                type=message_type if message_type in MESSAGE_TYPES else 'other'
+            )
     
     async def handle_handshake(self, client_id, data):
         """
@@ -109,21 +372,37 @@ class SecureFileServer:
             client_id (str): ID client
             data (dict): Dữ liệu handshake
         """
-        websocket = self.clients[client_id]['websocket']
+        client_info = self.clients[client_id]
+        request_id = self.request_id(client_id, data)
         
         if data.get('message') == 'Hello!':
+            # Thỏa thuận tính năng (binary frame), client cũ không gửi 'features' sẽ dùng JSON
+            features = negotiate_features(data.get('features'))
+            if FEATURE_MUX in features and 'tasks' not in client_info:
+                client_info.update({
+                    'tasks': set(),  # Message mux đang xử lý
+                    'tails': {},  # request_id -> message cuối cùng đang xử lý của ID đó
+                    # Mỗi file đang nhận giữ được tối đa một cửa sổ credit chunk đang chờ
+                    'pending': asyncio.Semaphore(self.max_streams * (self.credit_window + 2)),
+                    'stream_limiter': AdmissionLimiter('streams', self.max_streams)
+                })
+            client_info['features'] = features
+            
             # Phản hồi "Ready!" để hoàn thành handshake
-            self.clients[client_id]['state'] = 'ready'
-            await websocket.send(json.dumps({
+            client_info['state'] = 'ready'
+            await self.reply(client_id, {
                 'type': 'handshake_response',
-                'message': 'Ready!'
-            }))
+                'message': 'Ready!',
+                'features': features,
+                'max_message_size': self.max_message_size,
+                'max_streams': self.max_streams
+            }, request_id)
             logger.info(f"Handshake thành công với client {client_id}")
         else:
-            await websocket.send(json.dumps({
+            await self.reply(client_id, {
                 'type': 'error',
                 'message': 'Handshake không hợp lệ'
-            }))
+            }, request_id)
     
     async def handle_key_exchange(self, client_id, data):
         """
@@ -132,101 +411,677 @@ class SecureFileServer:
             client_id (str): ID client
             data (dict): Dữ liệu chứa public key
         """
-        websocket = self.clients[client_id]['websocket']
         transfer_service = self.clients[client_id]['transfer_service']
+        request_id = self.request_id(client_id, data)
         
         try:
             if data.get('action') == 'send_public_key':
                 # Nhận public key từ người gửi
                 sender_public_key = data.get('public_key')
                 
-                # Khởi tạo receiver và gửi public key của receiver
-                receiver_public_key = transfer_service.initialize_receiver()
+                # Khởi tạo receiver bằng cặp khóa lấy từ pool và gửi public key của receiver
+                keypair = await self.key_pool.acquire_async()
+                receiver_public_key = transfer_service.initialize_receiver(keypair)
                 
                 # Lưu public key của sender
                 self.clients[client_id]['sender_public_key'] = sender_public_key
                 self.clients[client_id]['state'] = 'keys_exchanged'
                 
-                await websocket.send(json.dumps({
+                await self.reply(client_id, {
                     'type': 'key_exchange_response',
                     'public_key': receiver_public_key,
                     'status': 'success'
-                }))
+                }, request_id)
                 
                 logger.info(f"Trao đổi khóa thành công với client {client_id}")
                 
+        except websockets.exceptions.ConnectionClosed:
+            raise
         except Exception as e:
-            await websocket.send(json.dumps({
+            await self.reply(client_id, {
                 'type': 'error',
                 'message': f'Lỗi trao đổi khóa: {str(e)}'
-            }))
+            }, request_id)
     
-    async def handle_file_transfer(self, client_id, data):
+    async def handle_session_init(self, client_id, data):
         """
-        Xử lý gói tin file đã mã hóa
+        Xử lý khởi tạo phiên nhiều file: xác minh chữ ký và giải mã bí mật phiên.
+        Sau bước này mỗi file chỉ cần số thứ tự, khóa file được suy ra bằng HKDF.
         Args:
             client_id (str): ID client
-            data (dict): Gói tin file
+            data (dict): Dữ liệu chứa bí mật phiên đã mã hóa và chữ ký
         """
-        websocket = self.clients[client_id]['websocket']
         transfer_service = self.clients[client_id]['transfer_service']
+        sender_public_key = self.clients[client_id].get('sender_public_key')
+        request_id = self.request_id(client_id, data)
+        
+        if not sender_public_key:
+            await self.reply(client_id, {
+                'type': 'error',
+                'message': 'Chưa trao đổi khóa'
+            }, request_id)
+            return
+        
+        try:
+            await self.offload.run_local(
+                transfer_service.accept_session,
+                data.get('encrypted_secret'), data.get('signature'), sender_public_key
+            )
+        except PackageVerificationError as e:
+            await self.reply(client_id, {
+                'type': 'session_init_response',
+                'status': 'error',
+                'message': f'Khởi tạo phiên thất bại: {e}'
+            }, request_id)
+            return
+        
+        self.clients[client_id]['state'] = 'session_open'
+        await self.reply(client_id, {
+            'type': 'session_init_response',
+            'status': 'success'
+        }, request_id)
+        logger.info(f"Đã mở phiên nhiều file với client {client_id}")
+    
+    async def handle_delta_signature_request(self, client_id, data):
+        """
+        Gửi chữ ký các block của bản đang lưu cùng tên để client chỉ gửi phần thay đổi
+        Args:
+            client_id (str): ID client
+            data (dict): Message chứa filename
+        """
+        client_info = self.clients[client_id]
+        stream = self.get_stream(client_id, data)
+        self.release_delta_basis(stream)
+        
+        # Chỉ client đã trao khóa mới được xem chữ ký nội dung file đã lưu
+        if not client_info.get('sender_public_key'):
+            await self.reply(client_id, {
+                'type': 'error',
+                'message': 'Cần trao đổi khóa trước khi xin chữ ký delta'
+            }, stream['request_id'])
+            return
+        
+        filename = Path(str(data.get('filename', ''))).name
+        basis_path = self.received_dir / filename
+        reply = {'type': 'delta_signature', 'filename': filename, 'available': False}
+        if filename and not filename.startswith('.') and basis_path.is_file():
+            # Giữ file bản cũ mở tới khi nhận xong: bản được vá chính là bản đã ký
+            basis_file = open(basis_path, 'rb')
+            try:
+                signature = await self.offload.run_local(compute_signature, basis_file)
+            except Exception:
+                basis_file.close()
+                raise
+            stream['delta_basis'] = {
+                'file': basis_file,
+                'signature': signature,
+                'filename': filename
+            }
+            reply.update(available=True, **signature.to_message())
+            logger.info(f"Gửi chữ ký delta của {filename} ({signature.block_count} block) cho client {client_id}")
+        await self.reply(client_id, reply, stream['request_id'])
+    
+    def release_delta_basis(self, stream):
+        """
+        Đóng file bản cũ đã mở cho delta nhưng chưa dùng (nếu có)
+        Args:
+            stream (dict): Trạng thái transfer (xem get_stream)
+        """
+        basis = stream.pop('delta_basis', None)
+        if basis is not None:
+            basis['file'].close()
+    
+    async def handle_file_transfer(self, client_id, data, flow_control=False):
+        """
+        Xử lý header gói tin file đã mã hóa, chuẩn bị nhận các chunk
+        Args:
+            client_id (str): ID client
+            data (dict): Message chứa header gói tin
+            flow_control (bool): True nếu là file_begin: cấp credit cho client và chờ file_end
+        """
+        transfer_service = self.clients[client_id]['transfer_service']
+        stream = self.get_stream(client_id, data)
+        request_id = stream['request_id']
+        
+        # Hủy transfer dở dang trước đó cùng request_id (nếu có)
+        await self.abort_incoming(stream)
+        # Bản cũ đã ký (nếu có) thuộc về transfer này; writer nhận quyền đóng khi dùng
+        delta_basis = stream.pop('delta_basis', None)
         
         try:
-            # Lấy thông tin từ gói tin
-            metadata = data.get('metadata')
-            metadata_signature = data.get('metadata_signature')
-            encrypted_session_key = data.get('encrypted_session_key')
-            file_package = data.get('file_package')
+            header = data.get('header')
             sender_public_key = self.clients[client_id].get('sender_public_key')
             
-            if not all([metadata, metadata_signature, encrypted_session_key, file_package, sender_public_key]):
-                await websocket.send(json.dumps({
-                    'type': 'nack',
-                    'message': 'Thiếu thông tin trong gói tin'
-                }))
+            if flow_control and FEATURE_CREDIT not in self.clients[client_id]['features']:
+                await self.reject_transfer(client_id, stream, 'Chưa thỏa thuận điều khiển luồng (credit)')
                 return
             
-            # Xác minh và giải mã gói tin file
-            success, result = transfer_service.verify_and_decrypt_package(
-                metadata, metadata_signature, encrypted_session_key, 
-                file_package, sender_public_key
-            )
+            if not header or not sender_public_key:
+                await self.reject_transfer(client_id, stream, 'Thiếu thông tin trong gói tin')
+                return
+            
+            # Đủ số transfer đang nhận: chờ tới lượt (header chưa được dùng nên client gửi lại được)
+            if not await self.admit_transfer(client_id, stream):
+                return
             
-            if not success:
-                await websocket.send(json.dumps({
-                    'type': 'nack',
-                    'message': f'Xác minh thất bại: {result}'
-                }))
+            # Xác minh chữ ký metadata và giải mã session key (RSA chạy ngoài event loop)
+            try:
+                decryptor = await self.offload.run_local(
+                    transfer_service.open_package, header, sender_public_key
+                )
+            except PackageVerificationError as e:
+                await self.reject_transfer(client_id, stream, f'Xác minh thất bại: {e}')
                 return
             
-            # Lưu file đã giải mã
-            metadata_obj = json.loads(metadata)
-            filename = metadata_obj.get('filename', 'finance.txt')
+            metadata_obj = json.loads(header['metadata'])
+            filename = Path(metadata_obj.get('filename', 'finance.txt')).name
+            content_digest = metadata_obj.get('content_digest')
+            delta = metadata_obj.get('delta')
+            
+            if delta is not None:
+                # Delta phải vá đúng bản cũ đã gửi chữ ký, và kết quả phải đối chiếu được digest
+                signature = delta_basis['signature'] if delta_basis else None
+                if (not content_digest or signature is None
+                        or delta_basis['filename'] != filename
+                        or delta.get('basis_digest') != signature.basis_digest
+                        or delta.get('block_size') != signature.block_size):
+                    await self.reject_transfer(client_id, stream, 'Bản cũ cho delta không khớp')
+                    return
             
             # Tạo thư mục received nếu chưa có
-            received_dir = Path('received_files')
-            received_dir.mkdir(exist_ok=True)
+            self.received_dir.mkdir(exist_ok=True)
+            
+            if content_digest and self.clients[client_id]['state'] in KEYED_STATES:
+                # Dedup: nội dung đã có thì chỉ liên kết sang tên mới, không nhận lại dữ liệu.
+                # Hit cho biết server đã có nội dung, nên chỉ trả cho client đã trao khóa xong
+                existing = await self.offload.run_local(self.content_index.lookup, content_digest)
+                if existing is not None:
+                    file_path = await self.offload.run_local(
+                        self.content_index.link, content_digest, existing, self.received_dir / filename
+                    )
+                    self.file_index.record(file_path)
+                    self.release_transfer_slot(stream)
+                    self.drop_stream(client_id, stream)
+                    await self.reply(client_id, {
+                        'type': 'ack',
+                        'message': f'File {filename} đã có sẵn nội dung, lưu thành công không cần truyền lại',
+                        'saved_path': str(file_path),
+                        'deduplicated': True
+                    }, request_id)
+                    TRANSFERS.inc(role='server', status='deduplicated')
+                    logger.info(f"Dedup: file {filename} từ client {client_id} liên kết tới {existing.name}")
+                    return
+            
+            # Transfer có nhật ký thì nhận tiếp được nếu mất kết nối (không áp dụng cho delta)
+            transfer_id = data.get('transfer_id')
+            resumable = (flow_control and delta is None and bool(content_digest)
+                         and self.resume_allowed(client_id, transfer_id)
+                         and self.journal.claim(transfer_id))
+            if resumable:
+                # Ghi nhận ngay để mất kết nối giữa chừng vẫn nhả khóa (abort_incoming)
+                self.active_transfers.add(transfer_id)
+                stream['transfer_id'] = transfer_id
             
-            # Lưu file
-            file_path = received_dir / filename
-            with open(file_path, 'wb') as f:
-                f.write(result)  # result là dữ liệu đã giải mã
+            if flow_control:
+                # Cấp trước một cửa sổ chunk; cấp thêm khi các chunk đã được ghi xong
+                stream['flow'] = {'credit': self.credit_window, 'consumed': 0}
+                await self.reply(client_id, {
+                    'type': 'send_chunks',
+                    'credit': self.credit_window,
+                    'resumable': resumable
+                }, request_id)
+            elif content_digest:
+                await self.reply(client_id, {'type': 'send_chunks'}, request_id)
             
-            # Gửi ACK
-            await websocket.send(json.dumps({
-                'type': 'ack',
-                'message': f'File {filename} đã được nhận và lưu thành công',
-                'saved_path': str(file_path)
-            }))
+            partial_path = None
+            if resumable:
+                await self.offload.run_local(self.journal.maybe_collect_garbage, set(self.active_transfers))
+                await self.offload.run_local(self.journal.create, transfer_id, {
+                    'filename': filename,
+                    'content_digest': content_digest,
+                    'file_size': int(header['file_size']),
+                    'session_key': self.journal.wrap_key(transfer_id, decryptor.session_key),
+                    'base_nonce': base64.b64encode(decryptor.base_nonce).decode('ascii'),
+                    'chunk_size': decryptor.chunk_size,
+                    'sender_key': key_fingerprint(sender_public_key)
+                })
+                partial_path = self.journal.data_path(transfer_id)
             
-            logger.info(f"File {filename} từ client {client_id} đã được lưu tại {file_path}")
+            # Dữ liệu giải mã được ghi dần vào file tạm, chỉ thay file đích khi nhận đủ
+            writer_basis = (delta_basis['file'], delta_basis['signature']) if delta is not None else None
+            stream['incoming'] = ReceivedFileWriter(
+                self.received_dir, filename, decryptor, content_digest,
+                delta_basis=writer_basis, target_size=int(header['file_size']),
+                partial_path=partial_path
+            )
+            if writer_basis is not None:
+                delta_basis = None
+                logger.info(f"Bắt đầu nhận delta của {filename} từ client {client_id} "
+                            f"({delta.get('literal_bytes')} byte mới)")
+            else:
+                logger.info(f"Bắt đầu nhận file {filename} từ client {client_id}")
                 
+        except websockets.exceptions.ConnectionClosed:
+            # Mất kết nối: để handle_client dọn dẹp (giữ transfer có nhật ký)
+            raise
         except Exception as e:
-            await websocket.send(json.dumps({
-                'type': 'nack',
-                'message': f'Lỗi xử lý file: {str(e)}'
-            }))
+            await self.reject_transfer(client_id, stream, f'Lỗi xử lý file: {str(e)}')
             logger.error(f"Lỗi xử lý file từ client {client_id}: {e}")
+        finally:
+            if delta_basis is not None:
+                delta_basis['file'].close()
+            if 'incoming' not in stream:
+                # Dedup, từ chối hoặc lỗi: không có file nào đang nhận giữ chỗ transfer
+                self.release_transfer_slot(stream)
+    
+    def resume_allowed(self, client_id, transfer_id):
+        """
+        Kiểm tra transfer mới có thể ghi nhật ký để nhận tiếp không
+        Args:
+            client_id (str): ID client
+            transfer_id (str): ID transfer client đề xuất
+        Returns:
+            bool: True nếu được
+        """
+        return (Config.RESUME_ENABLED
+                and FEATURE_RESUME in self.clients[client_id]['features']
+                and self.journal.valid_id(transfer_id)
+                and transfer_id not in self.active_transfers
+                and not self.journal.data_path(transfer_id).exists())
+    
+    async def handle_file_resume(self, client_id, data):
+        """
+        Nhận tiếp transfer bị ngắt: báo client chunk cần gửi tiếp theo theo nhật ký
+        Args:
+            client_id (str): ID client
+            data (dict): Message chứa transfer_id
+        """
+        client_info = self.clients[client_id]
+        stream = self.get_stream(client_id, data)
+        request_id = stream['request_id']
+        sender_public_key = client_info.get('sender_public_key')
+        transfer_id = data.get('transfer_id')
+        
+        # Transfer đang nhận dở cùng request_id (nếu có) bị thay thế
+        await self.abort_incoming(stream)
+        
+        if not sender_public_key:
+            await self.reply(client_id, {
+                'type': 'error',
+                'message': 'Chưa trao đổi khóa'
+            }, request_id)
+            return
+        
+        record = None
+        if (FEATURE_RESUME in client_info['features'] and FEATURE_CREDIT in client_info['features']
+                and self.journal.valid_id(transfer_id) and transfer_id not in self.active_transfers):
+            record = await self.offload.run_local(self.journal.load, transfer_id)
+        # Khóa trên nhật ký: worker khác của server_cluster có thể đang nhận tiếp chính transfer này
+        if (record is None or record.get('sender_key') != key_fingerprint(sender_public_key)
+                or not self.journal.claim(transfer_id)):
+            await self.reply(client_id, {
+                'type': 'resume_unavailable',
+                'transfer_id': transfer_id,
+                'message': 'Không có transfer dở dang để nhận tiếp'
+            }, request_id)
+            return
+        
+        self.active_transfers.add(transfer_id)
+        if not await self.admit_transfer(client_id, stream):
+            self.active_transfers.discard(transfer_id)
+            self.journal.release(transfer_id)
+            return
+        try:
+            decryptor = PackageDecryptor(
+                self.journal.unwrap_key(transfer_id, record['session_key']),
+                base64.b64decode(record['base_nonce']),
+                int(record['chunk_size'])
+            )
+            decryptor.next_index = int(record['next_index'])
+            decryptor.complete = bool(record.get('complete'))
+            # Cắt bỏ phần chưa ghi nhận và hash lại phần đã nhận: chạy ngoài event loop
+            incoming = await self.offload.run_local(functools.partial(
+                ReceivedFileWriter, self.received_dir, record['filename'], decryptor,
+                record['content_digest'], target_size=int(record['file_size']),
+                partial_path=self.journal.data_path(transfer_id), resume_offset=int(record['offset'])
+            ))
+        except Exception as e:
+            self.active_transfers.discard(transfer_id)
+            self.release_transfer_slot(stream)
+            self.journal.remove(transfer_id)
+            logger.error(f"Không nhận tiếp được transfer {transfer_id}: {e}")
+            await self.reply(client_id, {
+                'type': 'resume_unavailable',
+                'transfer_id': transfer_id,
+                'message': f'Nhật ký transfer không dùng được: {e}'
+            }, request_id)
+            return
+        
+        stream.update({
+            'incoming': incoming,
+            'transfer_id': transfer_id,
+            'flow': {'credit': self.credit_window, 'consumed': 0}
+        })
+        await self.reply(client_id, {
+            'type': 'resume_from',
+            'transfer_id': transfer_id,
+            'next_index': decryptor.next_index,
+            'offset': int(record['offset']),
+            'credit': self.credit_window
+        }, request_id)
+        logger.info(f"Nhận tiếp file {record['filename']} từ chunk {decryptor.next_index} cho client {client_id}")
+    
+    async def checkpoint_transfer(self, stream):
+        """
+        Ghi checkpoint của transfer có nhật ký (mỗi RESUME_CHECKPOINT_INTERVAL chunk và ở chunk cuối)
+        Args:
+            stream (dict): Trạng thái transfer
+        """
+        transfer_id = stream.get('transfer_id')
+        incoming = stream.get('incoming')
+        if transfer_id is None or incoming is None:
+            return
+        if incoming.complete or incoming.decryptor.next_index % max(1, Config.RESUME_CHECKPOINT_INTERVAL) == 0:
+            await self.offload.run_local(lambda: self.journal.checkpoint(transfer_id, *incoming.checkpoint()))
+    
+    async def handle_file_chunk(self, client_id, data, payload=None):
+        """
+        Xử lý một chunk đã mã hóa: kiểm tra, giải mã và ghi ngay ra file.
+        Chunk lỗi bị từ chối lập tức (NACK), các chunk sau của transfer đó bị bỏ qua.
+        Args:
+            client_id (str): ID client
+            data (dict): Message chứa chunk
+            payload (memoryview): Ciphertext thô nếu chunk đến bằng binary frame
+        """
+        stream = self.get_stream(client_id, data, create=False) or {}
+        incoming = stream.get('incoming')
+        
+        if incoming is None:
+            # Transfer đã bị từ chối trước đó, bỏ qua các chunk còn lại
+            if stream.get('transfer_rejected'):
+                return
+            await self.reply(client_id, {
+                'type': 'error',
+                'message': 'Nhận chunk khi chưa có gói tin file'
+            }, self.request_id(client_id, data))
+            return
+        
+        flow = stream.get('flow')
+        try:
+            if flow is not None:
+                flow['credit'] -= 1
+                if flow['credit'] < 0:
+                    await self.reject_transfer(client_id, stream, 'Client gửi vượt quá credit được cấp')
+                    return
+            
+            chunk = decode_chunk(data.get('chunk'), payload)
+            # Giới hạn tổng ciphertext đang chờ giải mã của mọi client; trong lúc chờ server
+            # không xử lý thêm chunk của transfer này nên người gửi hết credit và dừng lại
+            size = len(chunk['cipher'])
+            if not await self.buffer_limiter.acquire(size, timeout=self.admission_timeout):
+                # Transfer có nhật ký được giữ lại để client gửi tiếp khi server bớt tải
+                await self.abort_incoming(stream, keep_partial=True, status='busy')
+                await self.reply_busy(client_id, stream, self.buffer_limiter)
+                return
+            try:
+                await self.write_chunk(incoming, chunk)
+            finally:
+                self.buffer_limiter.release(size)
+            await self.checkpoint_transfer(stream)
+            
+            if flow is None:
+                if incoming.complete:
+                    await self.complete_transfer(client_id, stream)
+            elif not incoming.complete:
+                await self.grant_credit(client_id, stream, flow)
+                
+        except PackageVerificationError as e:
+            await self.reject_transfer(client_id, stream, f'Xác minh thất bại: {e}')
+        except websockets.exceptions.ConnectionClosed:
+            # Mất kết nối: để handle_client dọn dẹp (giữ transfer có nhật ký)
+            raise
+        except Exception as e:
+            await self.reject_transfer(client_id, stream, f'Lỗi xử lý file: {str(e)}')
+            logger.error(f"Lỗi xử lý chunk từ client {client_id}: {e}")
+    
+    async def grant_credit(self, client_id, stream, flow):
+        """
+        Cấp thêm credit sau khi chunk đã được ghi xong; gom lại nửa cửa sổ mỗi lần
+        để không phải gửi một message cho mỗi chunk
+        Args:
+            client_id (str): ID client
+            stream (dict): Trạng thái transfer
+            flow (dict): Trạng thái credit của transfer
+        """
+        flow['consumed'] += 1
+        if flow['consumed'] < max(1, self.credit_window // 2):
+            return
+        granted, flow['consumed'] = flow['consumed'], 0
+        flow['credit'] += granted
+        await self.reply(client_id, {
+            'type': 'credit',
+            'credit': granted
+        }, stream['request_id'])
+    
+    async def handle_file_end(self, client_id, data):
+        """
+        Người gửi báo đã gửi hết chunk: kiểm tra đủ chunk rồi lưu file và gửi ACK
+        Args:
+            client_id (str): ID client
+            data (dict): Message chứa số chunk đã gửi
+        """
+        stream = self.get_stream(client_id, data, create=False) or {}
+        incoming = stream.get('incoming')
+        
+        if incoming is None or stream.get('flow') is None:
+            # Transfer đã bị từ chối trước đó thì bỏ qua
+            if stream.get('transfer_rejected'):
+                return
+            await self.reply(client_id, {
+                'type': 'error',
+                'message': 'Nhận file_end khi chưa có gói tin file'
+            }, self.request_id(client_id, data))
+            return
+        
+        if not incoming.complete:
+            await self.reject_transfer(client_id, stream, 'Xác minh thất bại: Gói tin bị cắt cụt (thiếu chunk cuối)')
+        elif data.get('chunks') != incoming.decryptor.next_index:
+            await self.reject_transfer(client_id, stream, 'Số chunk trong file_end không khớp số chunk đã nhận')
+        else:
+            await self.complete_transfer(client_id, stream)
+    
+    async def write_chunk(self, incoming, chunk):
+        """
+        Kiểm tra, giải mã và ghi một chunk ngoài event loop.
+        Message cùng request_id được xử lý tuần tự nên các chunk của một transfer không chạy chồng nhau.
+        Args:
+            incoming (ReceivedFileWriter): File đang nhận
+            chunk (dict): Chunk đã mã hóa
+        Raises:
+            PackageVerificationError: Nếu chunk không hợp lệ
+        """
+        if self.offload.isolated:
+            # Process pool: giải mã ở process khác, ghi file ở thread của process này
+            data = await self.offload.run(open_chunk, *incoming.unseal_args(chunk))
+            await self.offload.run_local(incoming.write_plain, data)
+        else:
+            await self.offload.run(incoming.write_chunk, chunk)
+    
+    async def complete_transfer(self, client_id, stream):
+        """
+        Hoàn tất transfer sau chunk cuối và gửi ACK
+        Args:
+            client_id (str): ID client
+            stream (dict): Trạng thái transfer
+        """
+        incoming = stream['incoming']
+        try:
+            file_path = await self.offload.run_local(incoming.commit)
+        except PackageVerificationError as e:
+            await self.reject_transfer(client_id, stream, f'Xác minh thất bại: {e}')
+            return
+        del stream['incoming']
+        self.release_transfer_slot(stream)
+        stream.pop('flow', None)
+        transfer_id = stream.pop('transfer_id', None)
+        self.drop_stream(client_id, stream)
+        if transfer_id is not None:
+            # Dữ liệu đã được chuyển thành file đích, chỉ còn nhật ký cần xóa
+            self.active_transfers.discard(transfer_id)
+            self.journal.remove(transfer_id)
+        filename = incoming.filename
+        self.file_index.record(file_path)
+        if incoming.content_digest:
+            await self.offload.run_local(self.content_index.add, incoming.content_digest, file_path)
+        
+        TRANSFERS.inc(role='server', status='saved')
+        
+        # Gửi ACK
+        await self.reply(client_id, {
+            'type': 'ack',
+            'message': f'File {filename} đã được nhận và lưu thành công',
+            'saved_path': str(file_path)
+        }, stream['request_id'])
+        
+        logger.info(f"File {filename} từ client {client_id} đã được lưu tại {file_path}")
+    
+    async def reject_transfer(self, client_id, stream, message):
+        """
+        Từ chối transfer: xóa file dở dang và gửi NACK
+        Args:
+            client_id (str): ID client
+            stream (dict): Trạng thái transfer
+            message (str): Lý do từ chối
+        """
+        await self.abort_incoming(stream, status=None)
+        stream['transfer_rejected'] = True
+        TRANSFERS.inc(role='server', status='rejected')
+        await self.reply(client_id, {
+            'type': 'nack',
+            'message': message
+        }, stream['request_id'])
+    
+    def busy_message(self, limiter):
+        """
+        Message báo server đang bận
+        Args:
+            limiter (AdmissionLimiter): Giới hạn đã hết chỗ
+        Returns:
+            dict: Message 'busy' kèm số giây client nên chờ trước khi thử lại
+        """
+        return {
+            'type': 'busy',
+            'resource': limiter.name,
+            'retry_after': Config.BUSY_RETRY_AFTER,
+            'message': f'Server đang bận ({limiter.name}), thử lại sau {Config.BUSY_RETRY_AFTER:g} giây'
+        }
+    
+    async def reply_busy(self, client_id, stream, limiter):
+        """
+        Báo client transfer không được nhận vì server quá tải; các chunk còn lại bị bỏ qua
+        Args:
+            client_id (str): ID client
+            stream (dict): Trạng thái transfer
+            limiter (AdmissionLimiter): Giới hạn đã hết chỗ
+        """
+        stream['transfer_rejected'] = True
+        await self.reply(client_id, self.busy_message(limiter), stream['request_id'])
+        logger.warning(f"Server bận ({limiter.name}), yêu cầu client {client_id} thử lại sau")
+    
+    async def admit_transfer(self, client_id, stream):
+        """
+        Chờ tới lượt nhận một file: giới hạn số file cùng lúc của kết nối (mux) rồi của cả server
+        Args:
+            client_id (str): ID client
+            stream (dict): Trạng thái transfer
+        Returns:
+            bool: True nếu được nhận (giữ chỗ tới khi transfer kết thúc); False nếu đã trả 'busy'
+        """
+        limiter = self.transfer_limiter
+        if not self.draining:
+            stream_limiter = self.clients[client_id].get('stream_limiter')
+            if stream_limiter is not None:
+                # Kết nối mux: chờ chỗ trong số file của kết nối trước, khi chờ không chiếm chỗ của server
+                if await stream_limiter.acquire(timeout=self.admission_timeout):
+                    stream['stream_slot'] = stream_limiter
+                else:
+                    limiter = stream_limiter
+            if limiter is self.transfer_limiter and await self.transfer_limiter.acquire(
+                    timeout=self.admission_timeout):
+                stream['transfer_slot'] = True
+                return True
+            self.release_transfer_slot(stream)
+        TRANSFERS.inc(role='server', status='busy')
+        await self.reply_busy(client_id, stream, limiter)
+        return False
+    
+    async def drain(self, timeout):
+        """
+        Ngừng nhận transfer mới (client nhận 'busy' và thử lại ở process khác)
+        và chờ các transfer đang nhận hoàn tất
+        Args:
+            timeout (float): Thời gian chờ tối đa (giây)
+        Returns:
+            bool: True nếu không còn transfer nào đang nhận
+        """
+        self.draining = True
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.transfer_limiter.in_use and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+        return not self.transfer_limiter.in_use
+    
+    def release_transfer_slot(self, stream):
+        """Trả chỗ transfer của kết nối và của server (nếu đang giữ)"""
+        stream_limiter = stream.pop('stream_slot', None)
+        if stream_limiter is not None:
+            stream_limiter.release()
+        if stream.pop('transfer_slot', False):
+            self.transfer_limiter.release()
+    
+    async def abort_incoming(self, stream, keep_partial=False, status='aborted'):
+        """
+        Hủy transfer đang nhận dở (nếu có) và xóa file chưa hoàn chỉnh
+        Args:
+            stream (dict): Trạng thái transfer
+            keep_partial (bool): True để giữ transfer có nhật ký (mất kết nối) cho lần nhận tiếp
+            status (str): Kết quả ghi vào metric transfer nếu có file bị hủy (None: bên gọi tự ghi)
+        """
+        stream['transfer_rejected'] = False
+        stream.pop('flow', None)
+        self.release_transfer_slot(stream)
+        transfer_id = stream.pop('transfer_id', None)
+        incoming = stream.pop('incoming', None)
+        if incoming is not None and transfer_id is not None and keep_partial:
+            # Checkpoint cuối fsync dữ liệu và nhật ký: chạy ngoài event loop để một client mất kết nối
+            # không làm các client khác phải chờ
+            await self.offload.run_local(self.suspend_transfer, transfer_id, incoming)
+            self.active_transfers.discard(transfer_id)
+            TRANSFERS.inc(role='server', status='suspended')
+            logger.info(f"Giữ transfer {transfer_id} ({incoming.filename}) để nhận tiếp")
+            return
+        if transfer_id is not None:
+            self.active_transfers.discard(transfer_id)
+        if incoming is None:
+            if transfer_id is not None:
+                self.journal.release(transfer_id)
+            return
+        incoming.abort()
+        if status is not None:
+            TRANSFERS.inc(role='server', status=status)
+        if transfer_id is not None:
+            self.journal.remove(transfer_id)
+    
+    def suspend_transfer(self, transfer_id, incoming):
+        """
+        Đóng file đang nhận, ghi checkpoint cuối vào nhật ký và nhả khóa transfer (gọi ngoài event loop)
+        Args:
+            transfer_id (str): ID transfer
+            incoming (ReceivedFileWriter): File đang nhận
+        """
+        try:
+            self.journal.checkpoint(transfer_id, *incoming.suspend())
+        finally:
+            self.journal.release(transfer_id)
     
     async def handle_receiver_ready(self, client_id, data):
         """
@@ -235,38 +1090,132 @@ class SecureFileServer:
             client_id (str): ID client
             data (dict): Dữ liệu receiver ready
         """
-        websocket = self.clients[client_id]['websocket']
-        
         # Cập nhật trạng thái
         self.clients[client_id]['state'] = 'receiver_ready'
         
-        await websocket.send(json.dumps({
+        await self.reply(client_id, {
             'type': 'receiver_status',
             'message': 'Server sẵn sàng nhận file',
             'status': 'ready'
-        }))
+        }, self.request_id(client_id, data))
         
         logger.info(f"Client {client_id} đã sẵn sàng làm receiver")
 
 
+def _unique(objects):
+    """Các đối tượng khác nhau (pool/executor có thể dùng chung giữa các server)"""
+    return list({id(obj): obj for obj in objects}.values())
+
+
+def _unique_dirs(journals):
+    """Mỗi thư mục .partial một nhật ký (các server cùng thư mục nhận đọc chung một thư mục)"""
+    return list({journal.partial_dir.resolve(): journal for journal in journals}.values())
+
+
+def _register_server_metrics():
+    """Metric đọc trạng thái các server trong process lúc xuất (không tốn gì trên đường truyền file)"""
+    registry.gauge(
+        'securefile_ws_clients', 'Số mục trong SecureFileServer.clients'
+    ).set_function(lambda: sum(len(server.clients) for server in list(_servers)))
+    registry.gauge(
+        'securefile_loop_lag_seconds', 'Độ trễ event loop của server (lớn nhất giữa các server)', ['stat'],
+        multiprocess_mode='max'
+    ).set_function(lambda: {
+        (stat,): max((server.loop_lag.stats()[stat] for server in list(_servers)), default=0.0)
+        for stat in ('last', 'p50', 'p99', 'max')
+    })
+    registry.gauge(
+        'securefile_offload_jobs', 'Tác vụ xác minh/giải mã đang chạy hoặc đang chờ', ['state']
+    ).set_function(lambda: {
+        (state,): sum(executor.stats()[state] for executor in _unique(server.offload for server in list(_servers)))
+        for state in ('in_flight', 'waiting')
+    })
+    # Các worker của server_cluster đọc chung một thư mục .partial: lấy giá trị lớn nhất thay vì cộng N lần
+    registry.gauge(
+        'securefile_resume_transfers', 'Transfer dở dang trong nhật ký (partial)', ['state'],
+        multiprocess_mode='max'
+    ).set_function(lambda: {
+        ('partial',): sum(journal.stats()['partial']
+                          for journal in _unique_dirs(server.journal for server in list(_servers)))
+    })
+    registry.gauge(
+        'securefile_resume_active_transfers', 'Transfer đang được nhận tiếp (active) trong process'
+    ).set_function(lambda: sum(len(server.active_transfers) for server in list(_servers)))
+    registry.counter(
+        'securefile_dedup_lookups_total', 'Số lần tra chỉ mục nội dung theo kết quả', ['result']
+    ).set_function(lambda: {
+        (result,): sum(server.content_index.stats()[key] for server in list(_servers))
+        for result, key in (('hit', 'hits'), ('miss', 'misses'))
+    })
+    registry.gauge(
+        'securefile_key_pool_keys', 'Khóa RSA sinh sẵn còn trong pool của server'
+    ).set_function(lambda: sum(
+        pool.stats()['depth'] for pool in _unique(server.key_pool for server in list(_servers))
+    ))
+
+
+_register_server_metrics()
+
+
+# Server đang chạy trong process (để Flask đọc thống kê)
+_active_server = None
+
+
+def get_active_server():
+    """
+    Lấy server do start_secure_server khởi chạy
+    Returns:
+        SecureFileServer: Server đang chạy, hoặc None
+    """
+    return _active_server
+
+
 # Hàm khởi chạy WebSocket server
-async def start_secure_server(host='localhost', port=8765):
+async def start_secure_server(host='localhost', port=8765, metrics_port=None, reuse_port=False, stop=None):
     """
     Khởi chạy WebSocket server
     Args:
         host (str): Địa chỉ host
         port (int): Port server
+        metrics_port (int): Nếu có, phục vụ /metrics trên port HTTP này
+            (dùng khi server chạy riêng, không qua ứng dụng Flask)
+        reuse_port (bool): Bật SO_REUSEPORT để nhiều process cùng lắng nghe port (xem server_cluster)
+        stop (asyncio.Event): Nếu có, khi event được set thì ngừng nhận kết nối mới, chờ các transfer
+            đang nhận xong (tối đa Config.SERVER_SHUTDOWN_GRACE giây) rồi đóng các kết nối còn lại
     """
+    global _active_server
     server = SecureFileServer()
+    _active_server = server
+    
+    # Sinh sẵn khóa RSA nền trước khi nhận kết nối
+    server.key_pool.start()
+    # Dọn các transfer dở dang quá hạn từ lần chạy trước
+    server.journal.collect_garbage()
+    if metrics_port is not None:
+        start_metrics_server(metrics_port, host)
     
     logger.info(f"Đang khởi chạy Secure File Transfer Server tại ws://{host}:{port}")
     
     # Khởi chạy WebSocket server
-    async with websockets.serve(server.handle_client, host, port):
+    async with websockets.serve(server.handle_client, host, port, max_size=server.max_message_size,
+                                reuse_port=reuse_port) as ws_server:
         logger.info("Server đã sẵn sàng nhận kết nối...")
-        await asyncio.Future()  # Chạy mãi mãi
+        server.loop_lag.start()
+        if stop is None:
+            await asyncio.Future()  # Chạy mãi mãi
+        await stop.wait()
+        
+        # Dừng êm: đóng socket lắng nghe, cho các transfer đang nhận chạy nốt; kết nối còn lại
+        # bị đóng khi thoát khối with (transfer có nhật ký được giữ để gửi tiếp)
+        logger.info("Đang dừng server: ngừng nhận kết nối mới, chờ các transfer đang nhận...")
+        ws_server.server.close()
+        if not await server.drain(Config.SERVER_SHUTDOWN_GRACE):
+            logger.warning("Hết thời gian chờ, đóng các transfer còn dở")
+    server.loop_lag.stop()
+    server.key_pool.shutdown()
+    logger.info("Server đã dừng")
 
 
 if __name__ == "__main__":
     # Chạy server
-    asyncio.run(start_secure_server())
+    asyncio.run(start_secure_server(metrics_port=Config.WS_METRICS_PORT))
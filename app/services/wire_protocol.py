@@ -0,0 +1,163 @@
+"""
+Định dạng message trên WebSocket giữa client và server
+- JSON (text frame): mặc định, tương thích peer cũ, dữ liệu nhị phân mã hóa Base64
+- Binary frame: header JSON có độ dài đứng trước, theo sau là ciphertext thô (không Base64)
+Hai bên thỏa thuận dùng binary frame qua trường 'features' trong bước hello
+
+Với tính năng 'credit', mỗi file đi theo luồng file_begin -> file_chunk... -> file_end:
+server cấp cho client một số chunk được gửi trước (credit) và cấp thêm khi đã ghi xong,
+nên người nhận chậm làm người gửi chậm theo thay vì để buffer hai bên phình ra
+
+Với tính năng 'mux', mỗi message mang 'request_id' và phản hồi của server mang lại đúng ID đó:
+các message của một file (file_begin, file_chunk, file_end) dùng chung một ID nên một kết nối
+chở được nhiều file song song, server xử lý các ID khác nhau đồng thời
+"""
+
+import json
+import base64
+import struct
+
+# Tính năng được thỏa thuận trong handshake: binary frame, điều khiển luồng bằng credit
+# nhận tiếp transfer bị ngắt (resume, đi kèm credit) và nhiều transfer trên một kết nối (mux)
+FEATURE_BINARY = 'binary'
+FEATURE_CREDIT = 'credit'
+FEATURE_RESUME = 'resume'
+FEATURE_MUX = 'mux'
+SUPPORTED_FEATURES = (FEATURE_BINARY, FEATURE_CREDIT, FEATURE_RESUME, FEATURE_MUX)
+# Độ dài tối đa của request_id dạng chuỗi
+MAX_REQUEST_ID_LENGTH = 64
+
+# Cấu trúc binary frame: magic (2) | version (1) | độ dài header (4, big-endian) | header JSON | payload
+FRAME_MAGIC = b'SF'
+FRAME_VERSION = 1
+FRAME_PREFIX = struct.Struct('>2sBI')
+MAX_FRAME_HEADER_SIZE = 64 * 1024
+# Dự phòng cho phần metadata của message file_chunk (index, tag, hash, codec...)
+CHUNK_MESSAGE_OVERHEAD = 4 * 1024
+
+
+class FrameError(ValueError):
+    """Binary frame không đúng định dạng"""
+
+
+def negotiate_features(requested):
+    """
+    Chọn các tính năng cả hai bên cùng hỗ trợ
+    Args:
+        requested (list): Tính năng peer đề xuất
+    Returns:
+        list: Tính năng được chấp nhận
+    """
+    if not isinstance(requested, list):
+        return []
+    return [feature for feature in SUPPORTED_FEATURES if feature in requested]
+
+
+def valid_request_id(request_id):
+    """
+    Kiểm tra request_id của message (số nguyên hoặc chuỗi ngắn)
+    Args:
+        request_id: Giá trị trường 'request_id'
+    Returns:
+        bool: True nếu hợp lệ
+    """
+    if isinstance(request_id, bool):
+        return False
+    if isinstance(request_id, int):
+        return True
+    return isinstance(request_id, str) and 0 < len(request_id) <= MAX_REQUEST_ID_LENGTH
+
+
+def max_chunk_payload(max_message_size, binary):
+    """
+    Kích thước chunk lớn nhất để message file_chunk không vượt giới hạn message của peer
+    (người gửi lưu nguyên khi nén không nhỏ hơn, nên ciphertext không vượt kích thước chunk)
+    Args:
+        max_message_size (int): Giới hạn kích thước message của peer (byte)
+        binary (bool): True nếu chunk đi bằng binary frame, False nếu JSON + Base64
+    Returns:
+        int: Kích thước chunk tối đa (byte)
+    """
+    room = max(1, max_message_size - CHUNK_MESSAGE_OVERHEAD)
+    return room if binary else max(1, room // 4 * 3)
+
+
+def encode_frame(message, payload=b''):
+    """
+    Đóng gói message thành binary frame
+    Args:
+        message (dict): Phần header (JSON)
+        payload (bytes): Dữ liệu nhị phân đi kèm
+    Returns:
+        bytes: Binary frame
+    """
+    header = json.dumps(message, separators=(',', ':')).encode('utf-8')
+    return b''.join((FRAME_PREFIX.pack(FRAME_MAGIC, FRAME_VERSION, len(header)), header, payload))
+
+
+def decode_frame(frame):
+    """
+    Tách binary frame thành header và payload (payload là memoryview, không sao chép)
+    Args:
+        frame (bytes): Binary frame
+    Returns:
+        tuple: (message dict, payload memoryview)
+    Raises:
+        FrameError: Nếu frame không hợp lệ
+    """
+    view = memoryview(frame)
+    if len(view) < FRAME_PREFIX.size:
+        raise FrameError("Binary frame quá ngắn")
+    magic, version, header_len = FRAME_PREFIX.unpack_from(view)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise FrameError("Binary frame sai magic hoặc phiên bản")
+    header_end = FRAME_PREFIX.size + header_len
+    if header_len > MAX_FRAME_HEADER_SIZE or header_end > len(view):
+        raise FrameError("Độ dài header binary frame không hợp lệ")
+    try:
+        message = json.loads(bytes(view[FRAME_PREFIX.size:header_end]))
+    except ValueError:
+        raise FrameError("Header binary frame không đúng định dạng JSON")
+    if not isinstance(message, dict):
+        raise FrameError("Header binary frame phải là object JSON")
+    return message, view[header_end:]
+
+
+def encode_chunk_message(chunk, binary, request_id=None):
+    """
+    Đóng gói chunk đã mã hóa thành message 'file_chunk'
+    Args:
+        chunk (dict): Chunk với 'cipher' và 'tag' dạng bytes
+        binary (bool): True để dùng binary frame, False để dùng JSON + Base64
+        request_id (int | str): ID transfer khi kết nối dùng mux (None nếu không)
+    Returns:
+        bytes | str: Message gửi qua WebSocket
+    """
+    meta = {key: value for key, value in chunk.items() if key != 'cipher'}
+    meta['tag'] = base64.b64encode(chunk['tag']).decode('ascii')
+    message = {'type': 'file_chunk', 'chunk': meta}
+    if request_id is not None:
+        message['request_id'] = request_id
+    if binary:
+        return encode_frame(message, chunk['cipher'])
+    meta['cipher'] = base64.b64encode(chunk['cipher']).decode('ascii')
+    return json.dumps(message)
+
+
+def decode_chunk(chunk, payload=None):
+    """
+    Chuyển chunk nhận từ message về dạng 'cipher'/'tag' là bytes
+    Args:
+        chunk (dict): Phần 'chunk' của message
+        payload (memoryview): Ciphertext thô nếu message là binary frame
+    Returns:
+        dict: Chunk dùng cho PackageDecryptor
+    Raises:
+        ValueError: Nếu chunk không đúng định dạng
+    """
+    if not isinstance(chunk, dict):
+        raise ValueError("Chunk không đúng định dạng")
+    decoded = dict(chunk)
+    decoded['tag'] = base64.b64decode(chunk['tag'])
+    decoded['cipher'] = payload if payload is not None else base64.b64decode(chunk['cipher'])
+    return decoded
@@ -3,10 +3,16 @@ from flask import request
 import logging
 from . import socketio
 from app.models import db, UserSession
+from app.services.metrics import SOCKETIO_CONNECTIONS, registry
 from datetime import datetime, timedelta
 
 # Lưu mapping username <-> sid
 user_sid_map = {}
+registry.gauge('securefile_socketio_users', 'Số user trong user_sid_map').set_function(lambda: len(user_sid_map))
+
+@socketio.on('connect')
+def on_connect(auth=None):
+    SOCKETIO_CONNECTIONS.inc()
 
 @socketio.on('register_username')
 def register_username(data):
@@ -25,6 +31,7 @@ def register_username(data):
 
 @socketio.on('disconnect')
 def on_disconnect():
+    SOCKETIO_CONNECTIONS.dec()
     # Xóa user khỏi map khi disconnect
     for user, sid in list(user_sid_map.items()):
         if sid == request.sid:
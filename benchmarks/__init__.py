@@ -0,0 +1 @@
+"""Benchmark hiệu năng các primitive mã hóa và luồng gửi/nhận file"""
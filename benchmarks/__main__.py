@@ -0,0 +1,5 @@
+import sys
+
+from benchmarks.crypto_bench import main
+
+sys.exit(main())
@@ -0,0 +1,421 @@
+"""
+Microbenchmark các hàm của CryptoService và vòng gửi/nhận gói tin đầy đủ
+(prepare_file_package -> verify_and_decrypt_package)
+
+Chạy từ thư mục gốc project:
+    python -m benchmarks                              # kích thước mặc định, in JSON ra stdout
+    python -m benchmarks --sizes 1K,1M,1G -o out.json # chọn kích thước
+    python -m benchmarks --save-baseline              # lưu baseline cho máy hiện tại
+    python -m benchmarks --check                      # so với baseline, exit 1 nếu chậm đi
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from app.config import Config
+from app.services.crypto_backends import selected_backends
+from app.services.crypto_service import CryptoService, SecureFileTransfer
+
+DATA_KINDS = ('compressible', 'incompressible')
+DEFAULT_SIZES = '1K,64K,1M,16M'
+FULL_SIZES = '1K,64K,1M,16M,256M,1G'
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+# Ngưỡng chậm đi tối đa so với baseline (tỷ lệ) và chênh lệch tuyệt đối tối thiểu để bỏ qua nhiễu
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_SECONDS = 0.0001
+# Dữ liệu từ kích thước này trở lên không chạy lần khởi động (một lần chạy đã đủ lâu)
+WARMUP_LIMIT = 64 * 1024 ** 2
+
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    """
+    Đổi chuỗi kích thước (vd: 64K, 1M, 1G) sang số byte
+    Args:
+        text (str): Kích thước
+    Returns:
+        int: Số byte
+    """
+    match = re.fullmatch(r'(\d+)([KMG]?)B?', text.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Kích thước không hợp lệ: {text}")
+    return int(match.group(1)) * _UNITS[match.group(2)]
+
+
+def format_size(size):
+    """Đổi số byte sang dạng ngắn (1K, 16M, 1G)"""
+    for unit in ('G', 'M', 'K'):
+        if size >= _UNITS[unit] and size % _UNITS[unit] == 0:
+            return f'{size // _UNITS[unit]}{unit}'
+    return str(size)
+
+
+def make_payload(size, kind):
+    """
+    Sinh dữ liệu thử nghiệm
+    Args:
+        size (int): Kích thước (byte)
+        kind (str): 'compressible' (văn bản báo cáo lặp lại) hoặc 'incompressible' (ngẫu nhiên)
+    Returns:
+        bytes: Dữ liệu
+    """
+    if kind == 'incompressible':
+        return os.urandom(size)
+    block = b''.join(
+        f'{i:06d};2024-03-{i % 28 + 1:02d};Chuyen khoan noi bo;{i * 137 % 100000:>8},000 VND\n'.encode()
+        for i in range(1024)
+    )
+    return (block * (size // len(block) + 1))[:size]
+
+
+class BenchmarkCase:
+    """Một phép đo: setup(crypto, payload) trả về hàm được đo thời gian"""
+
+    def __init__(self, name, setup, sized=True):
+        """
+        Args:
+            name (str): Tên phép đo (thường là tên hàm CryptoService)
+            setup: Hàm (crypto, payload) -> callable không tham số
+            sized (bool): False nếu phép đo không phụ thuộc dữ liệu (chỉ chạy một lần)
+        """
+        self.name = name
+        self.setup = setup
+        self.sized = sized
+
+
+def _sealed_chunk(crypto, payload):
+    key, nonce = crypto.generate_aes_key(), os.urandom(crypto.nonce_size)
+    return key, nonce, crypto.encrypt_and_hash_chunk(payload, key, nonce, 0, True, 'store')
+
+
+def _rsa_fixture(crypto):
+    private_key, public_key = crypto.generate_rsa_keypair()
+    return private_key, public_key, crypto.generate_aes_key()
+
+
+def _setup_encrypt_aes_gcm(crypto, payload):
+    key = crypto.generate_aes_key()
+    return lambda: crypto.encrypt_aes_gcm(payload, key)
+
+
+def _setup_encrypt_chunk(crypto, payload):
+    key, nonce = crypto.generate_aes_key(), os.urandom(crypto.nonce_size)
+    return lambda: crypto.encrypt_chunk(payload, key, nonce, 0, True, 'store')
+
+
+def _setup_encrypt_and_hash_chunk(crypto, payload):
+    key, nonce = crypto.generate_aes_key(), os.urandom(crypto.nonce_size)
+    return lambda: crypto.encrypt_and_hash_chunk(payload, key, nonce, 0, True, 'store')
+
+
+def _setup_derive_file_key(crypto, payload):
+    secret, metadata = os.urandom(32), crypto.create_metadata('finance.txt')
+    return lambda: crypto.derive_file_key(secret, 7, metadata)
+
+
+def _setup_metadata_mac(crypto, payload):
+    secret, metadata = os.urandom(32), crypto.create_metadata('finance.txt')
+    return lambda: crypto.metadata_mac(secret, 7, metadata)
+
+
+def _setup_decrypt_aes_gcm(crypto, payload):
+    key = crypto.generate_aes_key()
+    nonce, ciphertext, tag = crypto.encrypt_aes_gcm(payload, key)
+    return lambda: crypto.decrypt_aes_gcm(nonce, ciphertext, tag, key)
+
+
+def _setup_decrypt_chunk(crypto, payload):
+    key, nonce = crypto.generate_aes_key(), os.urandom(crypto.nonce_size)
+    _, ciphertext, tag = crypto.encrypt_chunk(payload, key, nonce, 0, True, 'store')
+    return lambda: crypto.decrypt_chunk(ciphertext, tag, key, nonce, 0, True, 'store')
+
+
+def _setup_decrypt_and_hash_chunk(crypto, payload):
+    key, nonce, (_, ciphertext, tag, chunk_hash) = _sealed_chunk(crypto, payload)
+    return lambda: crypto.decrypt_and_hash_chunk(ciphertext, tag, chunk_hash, key, nonce, 0, True, 'store')
+
+
+def _setup_rsa_decrypt(crypto, payload):
+    private_key, public_key, secret = _rsa_fixture(crypto)
+    encrypted = crypto.rsa_encrypt(secret, public_key)
+    return lambda: crypto.rsa_decrypt(encrypted, private_key)
+
+
+def _setup_rsa_encrypt(crypto, payload):
+    _, public_key, secret = _rsa_fixture(crypto)
+    return lambda: crypto.rsa_encrypt(secret, public_key)
+
+
+def _setup_sign_data(crypto, payload):
+    private_key, _, _ = _rsa_fixture(crypto)
+    return lambda: crypto.sign_data(payload, private_key)
+
+
+def _setup_verify_signature(crypto, payload):
+    private_key, public_key, _ = _rsa_fixture(crypto)
+    signature = crypto.sign_data(payload, private_key)
+    return lambda: crypto.verify_signature(payload, signature, public_key)
+
+
+def _setup_decompress_data(crypto, payload):
+    compressed = crypto.compress_data(payload)
+    return lambda: crypto.decompress_data(compressed)
+
+
+def _setup_decode_base64(crypto, payload):
+    encoded = crypto.encode_base64(payload)
+    return lambda: crypto.decode_base64(encoded)
+
+
+CASES = [
+    BenchmarkCase('generate_rsa_keypair', lambda c, p: c.generate_rsa_keypair, sized=False),
+    BenchmarkCase('generate_aes_key', lambda c, p: c.generate_aes_key, sized=False),
+    BenchmarkCase('compress_data', lambda c, p: lambda: c.compress_data(p)),
+    BenchmarkCase('decompress_data', _setup_decompress_data),
+    BenchmarkCase('select_codec', lambda c, p: lambda: c.select_codec(p)),
+    BenchmarkCase('encrypt_aes_gcm', _setup_encrypt_aes_gcm),
+    BenchmarkCase('decrypt_aes_gcm', _setup_decrypt_aes_gcm),
+    BenchmarkCase('derive_chunk_nonce', lambda c, p: lambda: c.derive_chunk_nonce(bytes(16), 12345), sized=False),
+    BenchmarkCase('chunk_aad', lambda c, p: lambda: c.chunk_aad(12345, True), sized=False),
+    BenchmarkCase('encrypt_chunk', _setup_encrypt_chunk),
+    BenchmarkCase('decrypt_chunk', _setup_decrypt_chunk),
+    BenchmarkCase('encrypt_and_hash_chunk', _setup_encrypt_and_hash_chunk),
+    BenchmarkCase('decrypt_and_hash_chunk', _setup_decrypt_and_hash_chunk),
+    BenchmarkCase('derive_file_key', _setup_derive_file_key, sized=False),
+    BenchmarkCase('metadata_mac', _setup_metadata_mac, sized=False),
+    BenchmarkCase('rsa_encrypt', _setup_rsa_encrypt, sized=False),
+    BenchmarkCase('rsa_decrypt', _setup_rsa_decrypt, sized=False),
+    BenchmarkCase('sign_data', _setup_sign_data),
+    BenchmarkCase('verify_signature', _setup_verify_signature),
+    BenchmarkCase('calculate_sha512_hash', lambda c, p: lambda: c.calculate_sha512_hash(p)),
+    BenchmarkCase('create_metadata', lambda c, p: lambda: c.create_metadata('finance.txt'), sized=False),
+    BenchmarkCase('encode_base64', lambda c, p: lambda: c.encode_base64(p)),
+    BenchmarkCase('decode_base64', _setup_decode_base64),
+]
+
+# Vòng gửi/nhận đầy đủ qua file trên đĩa
+ROUND_TRIP = 'package_round_trip'
+
+
+def _setup_round_trip(workdir, payload):
+    """Chuẩn bị cặp người gửi/nhận và file nguồn; hàm trả về chạy một vòng gửi -> nhận"""
+    sender, receiver = SecureFileTransfer(), SecureFileTransfer()
+    sender_pem = sender.initialize_sender()
+    sender.set_receiver_public_key(receiver.initialize_receiver())
+    source = Path(workdir) / 'finance.bin'
+    source.write_bytes(payload)
+    expected = hashlib.sha512(payload).digest()
+
+    def run():
+        # Hai generator nối trực tiếp nên bộ nhớ không phụ thuộc kích thước file
+        hasher = hashlib.sha512()
+        for data in receiver.verify_and_decrypt_package(sender.prepare_file_package(str(source)), sender_pem):
+            hasher.update(data)
+        if hasher.digest() != expected:
+            raise RuntimeError("Dữ liệu sau khi giải mã không khớp")
+    return run
+
+
+def measure(func, min_time, max_rounds, warmup=True):
+    """
+    Đo thời gian chạy: lặp tới khi đủ min_time giây hoặc max_rounds lần (ít nhất 1 lần)
+    Args:
+        func: Hàm cần đo
+        min_time (float): Thời gian đo tối thiểu (giây)
+        max_rounds (int): Số lần đo tối đa
+        warmup (bool): Chạy một lần không tính giờ trước (khởi tạo cache, backend...)
+    Returns:
+        dict: rounds, best_s, median_s
+    """
+    if warmup:
+        func()
+    timings = []
+    started = time.perf_counter()
+    while True:
+        begin = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - begin)
+        if len(timings) >= max_rounds or time.perf_counter() - started >= min_time:
+            break
+    return {
+        'rounds': len(timings),
+        'best_s': min(timings),
+        'median_s': statistics.median(timings),
+    }
+
+
+def case_key(result):
+    """Khóa định danh một kết quả (dùng để so với baseline)"""
+    if result['size'] is None:
+        return result['name']
+    return f"{result['name']}[{format_size(result['size'])},{result['data']}]"
+
+
+def run_suite(sizes, kinds=DATA_KINDS, only=None, min_time=0.2, max_rounds=50, log=None):
+    """
+    Chạy toàn bộ benchmark
+    Args:
+        sizes (list): Các kích thước dữ liệu (byte)
+        kinds (tuple): Loại dữ liệu
+        only (str): Chỉ chạy phép đo có tên chứa chuỗi này
+        min_time (float): Thời gian đo tối thiểu mỗi phép đo (giây)
+        max_rounds (int): Số lần đo tối đa mỗi phép đo
+        log: Hàm in tiến độ (None: không in)
+    Returns:
+        list: Kết quả từng phép đo
+    """
+    crypto = CryptoService()
+    results = []
+
+    def record(name, size, kind, func):
+        stats = measure(func, min_time, max_rounds, warmup=(size or 0) < WARMUP_LIMIT)
+        result = {'name': name, 'size': size, 'data': kind, **stats}
+        if size:
+            result['mb_per_s'] = size / stats['best_s'] / 1024 ** 2 if stats['best_s'] else None
+        results.append(result)
+        if log:
+            log(f"{case_key(result)}: {stats['best_s'] * 1000:.3f} ms ({stats['rounds']} lần)")
+
+    selected = [case for case in CASES if not only or only in case.name]
+    for case in selected:
+        if not case.sized:
+            record(case.name, None, None, case.setup(crypto, b''))
+
+    for size in sizes:
+        for kind in kinds:
+            payload = make_payload(size, kind)
+            for case in selected:
+                if case.sized:
+                    record(case.name, size, kind, case.setup(crypto, payload))
+            if not only or only in ROUND_TRIP:
+                workdir = tempfile.mkdtemp(prefix='crypto-bench-')
+                try:
+                    record(ROUND_TRIP, size, kind, _setup_round_trip(workdir, payload))
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            del payload
+    return results
+
+
+def host_info():
+    """Thông tin máy chạy benchmark"""
+    return {
+        'node': platform.node(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def host_key():
+    """Tên file baseline của máy hiện tại (baseline chỉ có nghĩa trên cùng một máy)"""
+    raw = f"{platform.node()}-{platform.machine()}-py{sys.version_info[0]}{sys.version_info[1]}"
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', raw)
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE, min_delta=MIN_REGRESSION_SECONDS):
+    """
+    So kết quả với baseline
+    Args:
+        results (list): Kết quả lần chạy hiện tại
+        baseline (dict): Nội dung file baseline
+        tolerance (float): Tỷ lệ chậm đi tối đa cho phép
+        min_delta (float): Bỏ qua chênh lệch tuyệt đối nhỏ hơn giá trị này (giây)
+    Returns:
+        list: Các phép đo bị chậm đi (key, baseline_s, current_s, ratio)
+    """
+    reference = {case_key(result): result['best_s'] for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        key = case_key(result)
+        before = reference.get(key)
+        if before is None:
+            continue
+        current = result['best_s']
+        if current > before * (1 + tolerance) and current - before > min_delta:
+            regressions.append({
+                'case': key,
+                'baseline_s': before,
+                'current_s': current,
+                'ratio': current / before if before else None,
+            })
+    return regressions
+
+
+def build_report(results):
+    """Báo cáo JSON của một lần chạy"""
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'host': host_info(),
+        'config': {
+            'crypto_backend': Config.CRYPTO_BACKEND,
+            'selected_backends': selected_backends(),
+            'crypto_workers': Config.CRYPTO_WORKERS,
+            'crypto_executor': Config.CRYPTO_EXECUTOR,
+            'compression_codec': Config.COMPRESSION_CODEC,
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark CryptoService')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f'Các kích thước dữ liệu, phân tách bằng dấu phẩy (mặc định {DEFAULT_SIZES})')
+    parser.add_argument('--full', action='store_true', help=f'Chạy đủ dải kích thước {FULL_SIZES}')
+    parser.add_argument('--data', choices=DATA_KINDS, action='append', help='Chỉ chạy loại dữ liệu này')
+    parser.add_argument('--only', help='Chỉ chạy phép đo có tên chứa chuỗi này')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Thời gian đo tối thiểu mỗi phép đo (giây)')
+    parser.add_argument('--max-rounds', type=int, default=50, help='Số lần đo tối đa mỗi phép đo')
+    parser.add_argument('-o', '--output', help='Ghi báo cáo JSON ra file (mặc định stdout)')
+    parser.add_argument('--baseline', help='File baseline (mặc định benchmarks/baselines/<máy>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Lưu kết quả làm baseline của máy')
+    parser.add_argument('--check', action='store_true', help='Exit 1 nếu chậm hơn baseline quá ngưỡng')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Tỷ lệ chậm đi tối đa cho phép (mặc định {DEFAULT_TOLERANCE})')
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in (FULL_SIZES if args.full else args.sizes).split(',')]
+    log = lambda message: print(message, file=sys.stderr)
+    results = run_suite(sizes, tuple(args.data or DATA_KINDS), args.only, args.min_time, args.max_rounds, log)
+    report = build_report(results)
+
+    baseline_path = Path(args.baseline) if args.baseline else BASELINE_DIR / f'{host_key()}.json'
+    exit_code = 0
+    if args.check:
+        if not baseline_path.exists():
+            log(f"Chưa có baseline: {baseline_path} (chạy với --save-baseline)")
+            exit_code = 2
+        else:
+            regressions = compare_to_baseline(results, json.loads(baseline_path.read_text()), args.tolerance)
+            report['regressions'] = regressions
+            for regression in regressions:
+                log(f"CHẬM ĐI {regression['case']}: {regression['baseline_s'] * 1000:.3f} ms -> "
+                    f"{regression['current_s'] * 1000:.3f} ms (x{regression['ratio']:.2f})")
+            exit_code = 1 if regressions else 0
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(text, encoding='utf-8')
+    else:
+        print(text)
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(text, encoding='utf-8')
+        log(f"Đã lưu baseline: {baseline_path}")
+    return exit_code
@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import websockets
+
+from app.config import Config
+from app.services.admission import AdmissionLimiter
+from app.services.key_pool import RSAKeyPool
+from app.services.offload import OffloadExecutor
+from app.services.websocket_client import SecureFileClient
+from app.services.websocket_server import SecureFileServer
+
+
+def test_limiter_admits_in_arrival_order():
+    limiter = AdmissionLimiter('test_bytes', 10)
+    order = []
+
+    async def request(name, weight):
+        assert await limiter.acquire(weight)
+        order.append(name)
+
+    async def scenario():
+        assert await limiter.acquire(8)
+        # 'large' đứng đầu hàng nên 'small' phải chờ dù vừa chỗ trống hiện tại
+        tasks = [asyncio.create_task(request('large', 6)), asyncio.create_task(request('small', 2))]
+        await asyncio.sleep(0.01)
+        assert order == [] and limiter.waiting == 2
+        limiter.release(8)
+        await asyncio.gather(*tasks)
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert order == ['large', 'small']
+    assert stats['in_use'] == 8 and stats['admitted'] == 3
+
+
+def test_limiter_timeout_and_cancel_leave_no_waiters():
+    limiter = AdmissionLimiter('test_slots', 1)
+
+    async def scenario():
+        assert await limiter.acquire()
+        assert not await limiter.acquire(timeout=0.01)
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['in_use'] == 0 and stats['waiting'] == 0 and stats['rejected'] == 1
+
+
+def test_client_retries_after_busy(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'BUSY_RETRY_AFTER', 0.05)
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    server = SecureFileServer(key_pool=key_pool, received_dir=tmp_path / 'received',
+                              offload=OffloadExecutor(workers=1, executor='inline'),
+                              max_connections=1, admission_timeout=0.1)
+    source = tmp_path / 'report.bin'
+    source.write_bytes(os.urandom(50 * 1024))
+
+    async def scenario():
+        async with websockets.serve(server.handle_client, 'localhost', 0) as ws_server:
+            uri = f'ws://localhost:{ws_server.sockets[0].getsockname()[1]}'
+            # Kết nối đầu giữ chỗ duy nhất nên client gửi file nhận 'busy' tới khi nó đóng
+            holder = await websockets.connect(uri)
+            client = SecureFileClient(uri, key_pool=key_pool)
+            sending = asyncio.create_task(client.send_file_secure(str(source)))
+            while server.connection_limiter.rejected == 0:
+                await asyncio.sleep(0.01)
+            await holder.close()
+            return await sending
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        key_pool.shutdown()
+    assert (tmp_path / 'received' / 'report.bin').read_bytes() == source.read_bytes()
+    assert server.connection_limiter.stats()['in_use'] == 0
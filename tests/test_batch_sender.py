@@ -0,0 +1,71 @@
+import json
+import os
+
+from app.services import batch_sender
+from app.services.batch_sender import BatchSender, backoff_delay, collect_files
+from app.services.client_pool import SecureClientPool
+from app.services.key_pool import RSAKeyPool
+from app.services.offload import OffloadExecutor
+from app.services.websocket_server import SecureFileServer
+from tests.test_client_pool import run_server
+
+
+class FlakyPool(SecureClientPool):
+    """Pool làm lỗi lần gửi đầu tiên của các file được chỉ định"""
+
+    def __init__(self, *args, flaky=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flaky = set(flaky)
+
+    async def send_file_async(self, file_path, progress=None):
+        if file_path in self.flaky:
+            self.flaky.discard(file_path)
+            raise ConnectionError('mất kết nối')
+        return await super().send_file_async(file_path, progress)
+
+
+def test_collect_files_from_directory_or_glob(tmp_path):
+    for name in ('b.csv', 'a.csv', 'notes.txt', '.a.csv.part'):
+        (tmp_path / name).write_text(name)
+    (tmp_path / 'nested').mkdir()
+    (tmp_path / 'nested' / 'c.csv').write_text('c')
+
+    assert collect_files(str(tmp_path)) == [str(tmp_path / name) for name in ('a.csv', 'b.csv', 'notes.txt')]
+    assert collect_files(str(tmp_path / '*.csv')) == [str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')]
+    assert str(tmp_path / 'nested' / 'c.csv') in collect_files(str(tmp_path), recursive=True)
+
+
+def test_backoff_grows_exponentially_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(batch_sender.random, 'uniform', lambda low, high: high)
+    assert [backoff_delay(attempt, 0.5, 3.0) for attempt in range(1, 5)] == [0.5, 1.0, 2.0, 3.0]
+
+
+def test_batch_retries_failures_and_summarizes(tmp_path, capsys):
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    server = SecureFileServer(key_pool=key_pool, received_dir=tmp_path / 'received',
+                              offload=OffloadExecutor(workers=1, executor='inline'))
+    loop, port, stop_server = run_server(server)
+    outbox = tmp_path / 'outbox'
+    outbox.mkdir()
+    for index in range(5):
+        (outbox / f'batch{index}.bin').write_bytes(os.urandom(10000 + index))
+    files = collect_files(str(outbox))
+    pool = FlakyPool(f'ws://localhost:{port}', size=2, key_pool=key_pool, flaky=[files[1]])
+
+    try:
+        summary = BatchSender(concurrency=2, attempts=2, base_delay=0.01, pool=pool).send(files)
+        stats = pool.stats()
+    finally:
+        pool.close()
+        stop_server()
+        key_pool.shutdown()
+
+    assert summary['files'] == summary['succeeded'] == 5 and summary['failed'] == 0
+    assert summary['bytes'] == sum(os.path.getsize(path) for path in files)
+    assert summary['mb_per_s'] > 0 and summary['latency']['max'] >= summary['latency']['p50']
+    assert [result['attempts'] for result in summary['results']] == [1, 2, 1, 1, 1]
+    # Các file dùng chung 2 phiên của pool
+    assert stats['opened'] <= 2
+    for path in files:
+        assert (tmp_path / 'received' / os.path.basename(path)).read_bytes() == open(path, 'rb').read()
+    json.dumps(summary)
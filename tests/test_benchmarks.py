@@ -0,0 +1,32 @@
+import json
+
+from app.services.crypto_service import CryptoService
+from benchmarks import crypto_bench
+
+
+def test_every_crypto_service_method_is_benchmarked():
+    public_methods = {
+        name for name in vars(CryptoService)
+        if not name.startswith('_') and callable(getattr(CryptoService, name))
+    }
+    assert public_methods <= {case.name for case in crypto_bench.CASES}
+
+
+def test_suite_runs_and_detects_regressions(tmp_path):
+    results = crypto_bench.run_suite([1024], min_time=0, max_rounds=1)
+    names = {result['name'] for result in results}
+    assert crypto_bench.ROUND_TRIP in names
+    assert {result['data'] for result in results if result['size']} == set(crypto_bench.DATA_KINDS)
+
+    baseline = json.loads(json.dumps(crypto_bench.build_report(results)))
+    assert crypto_bench.compare_to_baseline(results, baseline) == []
+
+    slower = [dict(result, best_s=result['best_s'] * 2 + 1) for result in results]
+    regressions = crypto_bench.compare_to_baseline(slower, baseline)
+    assert len(regressions) == len(results)
+
+
+def test_size_parsing():
+    assert crypto_bench.parse_size('1K') == 1024
+    assert crypto_bench.parse_size('1g') == 1024 ** 3
+    assert crypto_bench.format_size(16 * 1024 ** 2) == '16M'
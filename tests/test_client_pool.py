@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+import time
+
+import websockets
+
+from app.services.client_pool import SecureClientPool
+from app.services.key_pool import RSAKeyPool
+from app.services.offload import OffloadExecutor
+from app.services.websocket_server import SecureFileServer
+
+
+class CountingServer(SecureFileServer):
+    """Server đếm số kết nối đã nhận"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.connections = 0
+
+    async def handle_client(self, websocket):
+        self.connections += 1
+        await super().handle_client(websocket)
+
+
+def run_server(server):
+    """Chạy server trên event loop ở thread riêng (pool có event loop nền của nó)"""
+    state = {'ready': threading.Event()}
+
+    async def serve():
+        state['loop'], state['stop'] = asyncio.get_running_loop(), asyncio.Event()
+        async with websockets.serve(server.handle_client, 'localhost', 0) as ws_server:
+            state['port'] = ws_server.sockets[0].getsockname()[1]
+            state['ready'].set()
+            await state['stop'].wait()
+        server.loop_lag.stop()
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    state['ready'].wait(10)
+
+    def stop():
+        state['loop'].call_soon_threadsafe(state['stop'].set)
+        thread.join(10)
+    return state['loop'], state['port'], stop
+
+
+def test_pool_reuses_keyed_connections_and_replaces_stale_ones(tmp_path):
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    server = CountingServer(key_pool=key_pool, received_dir=tmp_path / 'received',
+                            offload=OffloadExecutor(workers=1, executor='inline'))
+    loop, port, stop_server = run_server(server)
+    pool = SecureClientPool(f'ws://localhost:{port}', size=2, key_pool=key_pool)
+    sources = []
+    for index in range(4):
+        source = tmp_path / f'invoice{index}.bin'
+        source.write_bytes(os.urandom(20000))
+        sources.append(source)
+
+    async def drop_connections():
+        for info in list(server.clients.values()):
+            await info['websocket'].close()
+
+    try:
+        for source in sources[:3]:
+            assert pool.send_file(str(source), timeout=30)
+        assert pool.stats()['opened'] == 1 and pool.stats()['reused'] == 2
+        assert server.connections == 1
+
+        # Server đóng kết nối (vd: khởi động lại): kết nối hỏng bị bỏ, file đi qua kết nối mới
+        asyncio.run_coroutine_threadsafe(drop_connections(), loop).result(10)
+        time.sleep(0.2)
+        assert pool.send_file(str(sources[3]), timeout=30)
+        stats = pool.stats()
+        assert stats['opened'] == 2 and stats['stale'] == 1
+        assert stats['idle'] == 1 and stats['busy'] == 0
+    finally:
+        pool.close()
+        stop_server()
+        key_pool.shutdown()
+    for source in sources:
+        assert (tmp_path / 'received' / source.name).read_bytes() == source.read_bytes()
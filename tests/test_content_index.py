@@ -0,0 +1,47 @@
+import hashlib
+
+from app.services.content_index import ContentIndex
+
+
+def digest(data):
+    return hashlib.sha512(data).hexdigest()
+
+
+def test_link_and_lookup_survive_reload(tmp_path):
+    index = ContentIndex(tmp_path)
+    original = tmp_path / 'report.txt'
+    original.write_bytes(b'Bao cao quy 1')
+    index.add(digest(b'Bao cao quy 1'), original)
+
+    reloaded = ContentIndex(tmp_path)
+    source = reloaded.lookup(digest(b'Bao cao quy 1'))
+    assert source == original
+    copy = reloaded.link(digest(b'Bao cao quy 1'), source, tmp_path / 'report-copy.txt')
+    assert copy.read_bytes() == b'Bao cao quy 1'
+    assert reloaded.lookup(digest(b'missing')) is None
+    assert reloaded.stats() == {'entries': 1, 'hits': 1, 'misses': 1}
+
+
+def test_overwritten_file_is_not_a_hit(tmp_path):
+    index = ContentIndex(tmp_path)
+    path = tmp_path / 'report.txt'
+    path.write_bytes(b'old content')
+    index.add(digest(b'old content'), path)
+
+    replacement = tmp_path / 'new.txt'
+    replacement.write_bytes(b'new content!')
+    replacement.replace(path)
+    assert index.lookup(digest(b'old content')) is None
+
+
+def test_instances_sharing_a_directory_see_each_others_entries(tmp_path):
+    # Hai worker của server_cluster: mỗi bên ghi một mục, không bên nào làm mất mục của bên kia
+    first, second = ContentIndex(tmp_path), ContentIndex(tmp_path)
+    (tmp_path / 'a.txt').write_bytes(b'worker a')
+    (tmp_path / 'b.txt').write_bytes(b'worker b')
+    assert first.lookup(digest(b'worker b')) is None
+    first.add(digest(b'worker a'), tmp_path / 'a.txt')
+    second.add(digest(b'worker b'), tmp_path / 'b.txt')
+
+    assert first.lookup(digest(b'worker b')) == tmp_path / 'b.txt'
+    assert ContentIndex(tmp_path).stats()['entries'] == 2
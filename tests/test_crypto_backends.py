@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from Crypto.PublicKey import RSA
+
+from app.config import Config
+from app.services import crypto_backends
+from app.services.crypto_backends import BACKENDS, get_backend, reset_backends
+from app.services.crypto_service import chunk_crypto, open_chunk, seal_chunk
+
+
+@pytest.fixture
+def backend_choice(monkeypatch):
+    def choose(name):
+        monkeypatch.setattr(Config, 'CRYPTO_BACKEND', name)
+        reset_backends()
+    yield choose
+    reset_backends()
+
+
+def test_backends_interoperate():
+    pycryptodome, openssl = BACKENDS['pycryptodome'], BACKENDS['openssl']
+    key, nonce, aad, data = os.urandom(32), os.urandom(16), b'aad', os.urandom(100000)
+
+    sealed = pycryptodome.gcm_encrypt(key, nonce, data, aad)
+    assert openssl.gcm_encrypt(key, nonce, data, aad) == sealed
+    assert openssl.gcm_decrypt(key, nonce, *sealed, aad) == data
+    with pytest.raises(ValueError):
+        openssl.gcm_decrypt(key, nonce, sealed[0], bytes(16), aad)
+
+    private_key = RSA.generate(1024)
+    public_key = private_key.publickey()
+    for signer, verifier in ((pycryptodome, openssl), (openssl, pycryptodome)):
+        signature = signer.rsa_sign(private_key, data)
+        assert verifier.rsa_verify(public_key, data, signature)
+        assert not verifier.rsa_verify(public_key, data + b'x', signature)
+        assert verifier.rsa_decrypt(private_key, signer.rsa_encrypt(public_key, key)) == key
+        assert signer.sha512(data).digest() == verifier.sha512(data).digest()
+
+
+@pytest.mark.parametrize('name', ['pycryptodome', 'openssl'])
+def test_config_override_skips_benchmark(backend_choice, monkeypatch, name):
+    monkeypatch.setattr(crypto_backends, 'benchmark_primitive', lambda primitive: pytest.fail('benchmark ran'))
+    backend_choice(name)
+    assert all(get_backend(primitive).name == name for primitive in crypto_backends.PRIMITIVES)
+
+
+def test_auto_picks_fastest_backend(backend_choice, monkeypatch):
+    monkeypatch.setattr(crypto_backends, 'benchmark_primitive',
+                        lambda primitive: {'pycryptodome': 2.0, 'openssl': 1.0})
+    backend_choice('auto')
+    assert get_backend('aes_gcm').name == 'openssl'
+    assert crypto_backends.selected_backends() == {'aes_gcm': 'openssl'}
+
+
+def test_chunk_functions_share_one_crypto_service(backend_choice):
+    backend_choice('pycryptodome')
+    crypto = chunk_crypto()
+    key, nonce = os.urandom(32), os.urandom(16)
+    chunk = seal_chunk(key, nonce, 0, b'ledger ' * 100, True)
+    assert open_chunk(key, nonce, 1024, chunk) == b'ledger ' * 100
+    assert chunk_crypto() is crypto
+    # Chọn lại backend thì instance dùng chung cũng đổi theo
+    backend_choice('openssl')
+    assert chunk_crypto().aes_backend.name == 'openssl'
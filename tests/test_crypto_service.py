@@ -0,0 +1,191 @@
+import pytest
+
+from app.services.crypto_service import SecureFileTransfer, PackageVerificationError
+from app.services.received_file import ReceivedFileWriter
+
+
+@pytest.fixture(scope='module')
+def transfer_pair():
+    sender = SecureFileTransfer()
+    receiver = SecureFileTransfer()
+    sender_public_pem = sender.initialize_sender()
+    receiver_public_pem = receiver.initialize_receiver()
+    sender.set_receiver_public_key(receiver_public_pem)
+    return sender, receiver, sender_public_pem
+
+
+def write_file(tmp_path, content, name='finance.txt'):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+def test_stream_round_trip(tmp_path, transfer_pair):
+    sender, receiver, sender_pem = transfer_pair
+    content = b'So du tai khoan: 1,250,000,000 VND\n' * 5000 + b'tail'
+    parts = list(sender.prepare_file_package(write_file(tmp_path, content), chunk_size=4096))
+
+    assert len(parts) > 2
+    assert parts[-1]['final'] and not any(p['final'] for p in parts[1:-1])
+    result = b''.join(receiver.verify_and_decrypt_package(parts, sender_pem))
+    assert result == content
+
+
+def test_empty_file_round_trip(tmp_path, transfer_pair):
+    sender, receiver, sender_pem = transfer_pair
+    parts = list(sender.prepare_file_package(write_file(tmp_path, b'')))
+    assert b''.join(receiver.verify_and_decrypt_package(parts, sender_pem)) == b''
+
+
+def test_tampered_chunk_rejected_on_arrival(tmp_path, transfer_pair):
+    sender, receiver, sender_pem = transfer_pair
+    parts = list(sender.prepare_file_package(write_file(tmp_path, b'x' * 20000), chunk_size=4096))
+    parts[2]['tag'] = parts[3]['tag']
+
+    received = []
+    with pytest.raises(PackageVerificationError):
+        for data in receiver.verify_and_decrypt_package(parts, sender_pem):
+            received.append(data)
+    assert len(received) == 1
+
+
+def test_reordered_and_truncated_streams_rejected(tmp_path, transfer_pair):
+    sender, receiver, sender_pem = transfer_pair
+    parts = list(sender.prepare_file_package(write_file(tmp_path, b'y' * 20000), chunk_size=4096))
+
+    with pytest.raises(PackageVerificationError):
+        list(receiver.verify_and_decrypt_package([parts[0], parts[2], parts[1]], sender_pem))
+    with pytest.raises(PackageVerificationError):
+        list(receiver.verify_and_decrypt_package(parts[:-1], sender_pem))
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_parallel_engine_preserves_chunk_order(tmp_path, transfer_pair, executor):
+    from app.services.chunk_engine import ChunkEngine
+
+    sender, receiver, sender_pem = transfer_pair
+    engine = ChunkEngine(workers=3, executor=executor)
+    sender.engine = receiver.engine = engine
+    try:
+        content = bytes(range(256)) * 2000
+        parts = list(sender.prepare_file_package(write_file(tmp_path, content), chunk_size=1024))
+        assert [p['index'] for p in parts[1:]] == list(range(len(parts) - 1))
+        assert b''.join(receiver.verify_and_decrypt_package(parts, sender_pem)) == content
+    finally:
+        engine.shutdown()
+
+
+@pytest.mark.parametrize('codec', ['store', 'zlib-1', 'zlib-9', 'bz2', 'lzma'])
+def test_codec_round_trip(tmp_path, transfer_pair, codec):
+    sender, receiver, sender_pem = transfer_pair
+    content = b'Thu: 500,000,000 VND; Chi: 300,000,000 VND\n' * 3000
+    parts = list(sender.prepare_file_package(write_file(tmp_path, content), chunk_size=8192, codec=codec))
+    assert parts[0]['codec'] == codec
+    assert b''.join(receiver.verify_and_decrypt_package(parts, sender_pem)) == content
+
+
+def test_auto_codec_skips_incompressible_data(tmp_path, transfer_pair):
+    import os
+
+    sender, receiver, sender_pem = transfer_pair
+    content = os.urandom(50000)
+    parts = list(sender.prepare_file_package(write_file(tmp_path, content), codec='auto'))
+    assert parts[0]['codec'] == 'store'
+    assert b''.join(receiver.verify_and_decrypt_package(parts, sender_pem)) == content
+
+
+def test_tampered_codec_rejected(tmp_path, transfer_pair):
+    sender, receiver, sender_pem = transfer_pair
+    parts = list(sender.prepare_file_package(write_file(tmp_path, b'z' * 5000), codec='zlib'))
+    parts[1]['codec'] = 'store'
+    with pytest.raises(PackageVerificationError):
+        list(receiver.verify_and_decrypt_package(parts, sender_pem))
+
+
+def test_session_mode_derives_per_file_keys_and_rejects_replay(tmp_path):
+    sender, receiver = SecureFileTransfer(), SecureFileTransfer()
+    sender_pem = sender.initialize_sender()
+    sender.set_receiver_public_key(receiver.initialize_receiver())
+    receiver.accept_session(*sender.create_session(), sender_pem)
+
+    packages = []
+    for i in range(3):
+        content = f'bao cao ngay {i}\n'.encode() * 100
+        parts = list(sender.prepare_file_package(write_file(tmp_path, content, f'r{i}.txt')))
+        assert parts[0]['key_mode'] == 'session' and 'encrypted_session_key' not in parts[0]
+        assert b''.join(receiver.verify_and_decrypt_package(parts, sender_pem)) == content
+        packages.append(parts)
+
+    with pytest.raises(PackageVerificationError):
+        list(receiver.verify_and_decrypt_package(packages[1], sender_pem))
+
+
+def test_session_mode_binds_metadata(tmp_path):
+    sender, receiver = SecureFileTransfer(), SecureFileTransfer()
+    sender_pem = sender.initialize_sender()
+    sender.set_receiver_public_key(receiver.initialize_receiver())
+    receiver.accept_session(*sender.create_session(), sender_pem)
+
+    parts = list(sender.prepare_file_package(write_file(tmp_path, b'data')))
+    parts[0]['metadata'] = parts[0]['metadata'].replace('finance.txt', 'other.txt')
+    with pytest.raises(PackageVerificationError):
+        list(receiver.verify_and_decrypt_package(parts, sender_pem))
+
+
+@pytest.mark.parametrize('codec', ['store', 'zlib', 'bz2', 'lzma'])
+def test_received_file_writer_streams_to_disk(tmp_path, transfer_pair, codec):
+    sender, receiver, sender_pem = transfer_pair
+    content = b'Bao cao thu chi quy 3\n' * 20000
+    header, *chunks = sender.prepare_file_package(write_file(tmp_path, content), chunk_size=65536, codec=codec)
+
+    out_dir = tmp_path / 'received'
+    out_dir.mkdir()
+    writer = ReceivedFileWriter(out_dir, 'finance.txt', receiver.open_package(header, sender_pem))
+    for chunk in chunks:
+        writer.write_chunk(chunk)
+    assert writer.complete
+    assert writer.commit().read_bytes() == content
+    assert [p.name for p in out_dir.iterdir()] == ['finance.txt']
+
+
+def test_received_file_writer_abort_removes_temp_file(tmp_path, transfer_pair):
+    sender, receiver, sender_pem = transfer_pair
+    header, *chunks = sender.prepare_file_package(write_file(tmp_path, b'z' * 20000), chunk_size=4096)
+    chunks[1]['hash'] = chunks[0]['hash']
+
+    writer = ReceivedFileWriter(tmp_path, 'out.txt', receiver.open_package(header, sender_pem))
+    writer.write_chunk(chunks[0])
+    with pytest.raises(PackageVerificationError):
+        writer.write_chunk(chunks[1])
+    writer.abort()
+    assert not (tmp_path / 'out.txt').exists()
+    assert not list(tmp_path.glob('*.part'))
+
+
+def test_received_file_writer_rejects_wrong_content_digest(tmp_path, transfer_pair):
+    sender, receiver, sender_pem = transfer_pair
+    header, *chunks = sender.prepare_file_package(
+        write_file(tmp_path, b'real content'), content_digest='00' * 64
+    )
+
+    writer = ReceivedFileWriter(tmp_path, 'out.txt', receiver.open_package(header, sender_pem), '00' * 64)
+    for chunk in chunks:
+        writer.write_chunk(chunk)
+    with pytest.raises(PackageVerificationError):
+        writer.commit()
+    writer.abort()
+    assert not (tmp_path / 'out.txt').exists()
+
+
+def test_session_counters_may_arrive_out_of_order_but_only_once(tmp_path):
+    sender, receiver = SecureFileTransfer(), SecureFileTransfer()
+    sender_pem = sender.initialize_sender()
+    sender.set_receiver_public_key(receiver.initialize_receiver())
+    receiver.accept_session(*sender.create_session(), sender_pem)
+
+    headers = [next(sender.prepare_file_package(write_file(tmp_path, b'data', f'r{i}.txt'))) for i in range(3)]
+    # Các file gửi song song trên một kết nối có thể được mở khác thứ tự gửi
+    for index in (2, 0, 1):
+        receiver.open_package(headers[index], sender_pem)
+    with pytest.raises(PackageVerificationError):
+        receiver.open_package(headers[0], sender_pem)
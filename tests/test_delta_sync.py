@@ -0,0 +1,89 @@
+import io
+import os
+import random
+
+import pytest
+
+from app.services.delta_sync import (
+    BlockSignature, DeltaError, DeltaPatcher, compute_delta, compute_signature
+)
+
+
+def ledger(lines):
+    rnd = random.Random(7)
+    return [f"{i},ACC{rnd.randrange(10 ** 8)},{rnd.randrange(10 ** 6) / 100:.2f}\n".encode()
+            for i in range(lines)]
+
+
+def rebuild(basis_path, signature, plan, target_path, piece=1000):
+    with open(target_path, 'rb') as target:
+        stream = plan.open_reader(target).read(os.path.getsize(target_path) * 2)
+    output = io.BytesIO()
+    with open(basis_path, 'rb') as basis:
+        patcher = DeltaPatcher(basis, signature, output.write, os.path.getsize(target_path))
+        # Chuỗi lệnh đến theo từng phần nhỏ, cắt ngang cả phần đầu lệnh
+        for start in range(0, len(stream), piece):
+            patcher.feed(stream[start:start + piece])
+        patcher.finish()
+    return stream, output.getvalue()
+
+
+def test_signature_message_round_trip(tmp_path):
+    path = tmp_path / 'basis.csv'
+    path.write_bytes(b''.join(ledger(5000)))
+    with open(path, 'rb') as f:
+        signature = compute_signature(f)
+    restored = BlockSignature.from_message(signature.to_message())
+    assert restored.entries == signature.entries
+    assert restored.basis_digest == signature.basis_digest
+
+    broken = dict(signature.to_message(), basis_size=signature.basis_size * 2)
+    with pytest.raises(DeltaError):
+        BlockSignature.from_message(broken)
+
+
+def test_edits_rebuild_from_small_delta(tmp_path):
+    lines = ledger(20000)
+    basis_path, target_path = tmp_path / 'old.csv', tmp_path / 'new.csv'
+    basis_path.write_bytes(b''.join(lines))
+    lines[10] = b'10,EDITED,0.00\n'
+    lines.insert(9000, b'inserted line\n')
+    del lines[15000:15003]
+    lines.append(b'tail\n')
+    target_path.write_bytes(b''.join(lines))
+
+    with open(basis_path, 'rb') as f:
+        signature = compute_signature(f)
+    with open(target_path, 'rb') as f:
+        plan = compute_delta(f, signature)
+    assert plan is not None
+    assert plan.literal_bytes < 5 * signature.block_size
+
+    stream, rebuilt = rebuild(basis_path, signature, plan, target_path)
+    assert rebuilt == target_path.read_bytes()
+    assert len(stream) < os.path.getsize(target_path) // 10
+
+
+def test_unrelated_content_falls_back_to_full_file(tmp_path):
+    basis_path, target_path = tmp_path / 'old.bin', tmp_path / 'new.bin'
+    basis_path.write_bytes(os.urandom(200000))
+    target_path.write_bytes(os.urandom(200000))
+    with open(basis_path, 'rb') as f:
+        signature = compute_signature(f)
+    with open(target_path, 'rb') as f:
+        assert compute_delta(f, signature) is None
+
+
+def test_patcher_rejects_out_of_range_and_truncated_streams(tmp_path):
+    basis_path = tmp_path / 'old.bin'
+    basis_path.write_bytes(b'x' * 10000)
+    with open(basis_path, 'rb') as basis:
+        signature = compute_signature(basis)
+        patcher = DeltaPatcher(basis, signature, lambda data: None, 10 ** 6)
+        with pytest.raises(DeltaError):
+            patcher.feed(b'C' + (10 ** 6).to_bytes(8, 'big') + (1).to_bytes(4, 'big'))
+
+        patcher = DeltaPatcher(basis, signature, lambda data: None, 10 ** 6)
+        patcher.feed(b'L' + (100).to_bytes(4, 'big') + b'abc')
+        with pytest.raises(DeltaError):
+            patcher.finish()
@@ -0,0 +1,63 @@
+import asyncio
+import os
+
+import websockets
+
+from app.services.key_pool import RSAKeyPool
+from app.services.offload import OffloadExecutor
+from app.services.websocket_client import SecureFileClient
+from app.services.websocket_server import SecureFileServer
+
+
+class SlowServer(SecureFileServer):
+    """Server ghi chunk chậm để người gửi phải chờ credit"""
+
+    def __init__(self, counters, **kwargs):
+        super().__init__(**kwargs)
+        self.counters = counters
+
+    async def write_chunk(self, incoming, chunk):
+        await asyncio.sleep(0.005)
+        await super().write_chunk(incoming, chunk)
+        self.counters['written'] += 1
+
+
+def test_slow_receiver_throttles_sender(tmp_path):
+    counters = {'sent': 0, 'written': 0, 'max_outstanding': 0}
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    server = SlowServer(counters, key_pool=key_pool, received_dir=tmp_path / 'received',
+                        offload=OffloadExecutor(workers=1, executor='inline'), credit_window=4)
+    source = tmp_path / 'report.bin'
+    source.write_bytes(os.urandom(100 * 1024))
+
+    async def scenario():
+        async with websockets.serve(server.handle_client, 'localhost', 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            client = SecureFileClient(f'ws://localhost:{port}', key_pool=key_pool)
+            client.transfer_service.crypto.chunk_size = 4096
+
+            connect = client.connect
+
+            async def counting_connect():
+                connected = await connect()
+                send = client.websocket.send
+
+                async def counting_send(message):
+                    if isinstance(message, bytes):
+                        counters['sent'] += 1
+                        counters['max_outstanding'] = max(
+                            counters['max_outstanding'], counters['sent'] - counters['written'])
+                    await send(message)
+                client.websocket.send = counting_send
+                return connected
+
+            client.connect = counting_connect
+            return await client.send_file_secure(str(source))
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        key_pool.shutdown()
+    assert (tmp_path / 'received' / 'report.bin').read_bytes() == source.read_bytes()
+    assert counters['sent'] == 25
+    assert counters['max_outstanding'] <= 4
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+from app.services.key_pool import RSAKeyPool
+
+
+def wait_for_depth(pool, depth, timeout=30):
+    deadline = time.time() + timeout
+    while pool.stats()['depth'] < depth and time.time() < deadline:
+        time.sleep(0.05)
+    return pool.stats()['depth']
+
+
+def test_pool_serves_ready_keys_and_refills():
+    pool = RSAKeyPool(size=2, key_size=1024, executor='thread')
+    try:
+        pool.start()
+        assert wait_for_depth(pool, 2) == 2
+
+        private_key, public_key = pool.acquire()
+        assert private_key.has_private() and public_key.n == private_key.n
+        assert pool.stats()['hits'] == 1
+
+        assert wait_for_depth(pool, 2) == 2
+    finally:
+        pool.shutdown()
+
+
+def test_pool_miss_is_counted_and_still_returns_key():
+    pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    try:
+        private_key, _ = asyncio.run(pool.acquire_async())
+        assert private_key.size_in_bits() == 1024
+        assert pool.stats()['misses'] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,31 @@
+from Crypto.PublicKey import RSA
+
+from app.services.key_registry import PublicKeyRegistry, key_fingerprint
+
+
+def make_pem():
+    return RSA.generate(1024).publickey().export_key().decode('utf-8')
+
+
+def test_registry_reuses_parsed_keys_and_evicts_lru():
+    registry = PublicKeyRegistry(maxsize=2)
+    pem_a, pem_b, pem_c = make_pem(), make_pem(), make_pem()
+
+    entry = registry.get(pem_a)
+    assert registry.get(pem_a.replace('\n', '\r\n') + '\n') is entry
+    registry.get(pem_b)
+    registry.get(pem_a)
+    registry.get(pem_c)
+
+    assert registry.stats()['size'] == 2
+    assert registry.get(pem_a) is entry
+    assert registry.stats()['misses'] == 3
+
+
+def test_invalidate_drops_entry():
+    registry = PublicKeyRegistry()
+    pem = make_pem()
+    entry = registry.get(pem)
+    registry.invalidate(pem)
+    assert registry.get(pem) is not entry
+    assert entry.fingerprint == key_fingerprint(pem)
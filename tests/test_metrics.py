@@ -0,0 +1,89 @@
+import os
+import urllib.request
+
+import pytest
+
+from app.services.crypto_service import open_chunk, seal_chunk
+from app.services.metrics import (
+    CRYPTO_STAGE_SECONDS, MetricsRegistry, merge_families, render_families, start_metrics_server
+)
+
+
+def test_render_text_exposition():
+    registry = MetricsRegistry()
+    transfers = registry.counter('demo_transfers_total', 'Transfers', ['status'])
+    transfers.inc(status='saved')
+    transfers.inc(2, status='saved')
+    transfers.inc(status='quote"d')
+    latency = registry.histogram('demo_seconds', 'Latency', buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+    registry.gauge('demo_open', 'Open').set_function(lambda: 7)
+
+    lines = registry.render().splitlines()
+    assert '# TYPE demo_transfers_total counter' in lines
+    assert 'demo_transfers_total{status="saved"} 3' in lines
+    assert 'demo_transfers_total{status="quote\\"d"} 1' in lines
+    # Bucket là số tích lũy, +Inf bằng tổng số lần đo
+    assert 'demo_seconds_bucket{le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'demo_seconds_sum 3.55' in lines
+    assert 'demo_seconds_count 3' in lines
+    assert 'demo_open 7' in lines
+
+
+def test_labels_and_types_are_checked():
+    registry = MetricsRegistry()
+    counter = registry.counter('demo_total', 'Demo', ['role'])
+    assert registry.counter('demo_total', 'Demo', ['role']) is counter
+    with pytest.raises(ValueError):
+        counter.inc(status='saved')
+    with pytest.raises(ValueError):
+        counter.inc(-1, role='server')
+    with pytest.raises(ValueError):
+        registry.gauge('demo_total', 'Demo', ['role'])
+
+
+def test_crypto_stages_are_timed():
+    before = {stage: CRYPTO_STAGE_SECONDS.count(stage=stage) for stage in ('compress', 'encrypt', 'decrypt')}
+    key, nonce = os.urandom(32), os.urandom(12)
+    chunk = seal_chunk(key, nonce, 0, b'finance ' * 100, True)
+    assert open_chunk(key, nonce, 1024, chunk) == b'finance ' * 100
+    for stage, count in before.items():
+        assert CRYPTO_STAGE_SECONDS.count(stage=stage) == count + 1
+
+
+def test_standalone_metrics_endpoint():
+    registry = MetricsRegistry()
+    registry.counter('demo_bytes_total', 'Bytes').inc(42)
+    server = start_metrics_server(0, metrics_registry=registry)
+    try:
+        url = f'http://localhost:{server.server_address[1]}'
+        with urllib.request.urlopen(f'{url}/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert 'demo_bytes_total 42' in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'{url}/other')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_merge_families_across_processes():
+    snapshots = []
+    for lag, saved in ((0.2, 1), (0.5, 2)):
+        registry = MetricsRegistry()
+        registry.counter('demo_saved_total', 'Saved').inc(saved)
+        registry.gauge('demo_open', 'Open').inc()
+        registry.gauge('demo_lag', 'Lag', multiprocess_mode='max').set(lag)
+        registry.histogram('demo_seconds', 'Latency', buckets=(1.0,)).observe(lag)
+        snapshots.append(registry.collect())
+
+    lines = render_families(merge_families(snapshots)).splitlines()
+    assert 'demo_saved_total 3' in lines
+    assert 'demo_open 2' in lines
+    assert 'demo_lag 0.5' in lines
+    assert 'demo_seconds_bucket{le="1.0"} 2' in lines
+    assert 'demo_seconds_count 2' in lines
@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+import websockets
+
+from app.services import websocket_client
+from app.services.key_pool import RSAKeyPool
+from app.services.offload import OffloadExecutor
+from app.services.websocket_client import SecureFileClient
+from app.services.websocket_server import SecureFileServer
+
+
+class OverlapServer(SecureFileServer):
+    """Server ghi chunk chậm và đếm số transfer được ghi cùng lúc, số kết nối đã nhận"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writing = set()
+        self.max_overlap = 0
+        self.connections = 0
+
+    async def handle_client(self, websocket):
+        self.connections += 1
+        await super().handle_client(websocket)
+
+    async def write_chunk(self, incoming, chunk):
+        self.writing.add(incoming)
+        self.max_overlap = max(self.max_overlap, len(self.writing))
+        try:
+            await asyncio.sleep(0.01)
+            await super().write_chunk(incoming, chunk)
+        finally:
+            self.writing.discard(incoming)
+
+
+def send_files(tmp_path, count, **client_options):
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    server = OverlapServer(key_pool=key_pool, received_dir=tmp_path / 'received',
+                           offload=OffloadExecutor(workers=2, executor='thread'), credit_window=2)
+    sources = []
+    for index in range(count):
+        source = tmp_path / f'statement{index}.bin'
+        source.write_bytes(os.urandom(8 * 4096 + index))
+        sources.append(source)
+
+    async def scenario():
+        async with websockets.serve(server.handle_client, 'localhost', 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            client = SecureFileClient(f'ws://localhost:{port}', key_pool=key_pool)
+            client.transfer_service.crypto.chunk_size = 4096
+            return await client.send_files([str(source) for source in sources], **client_options)
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        key_pool.shutdown()
+    assert list(results.values()) == [True] * count
+    for source in sources:
+        assert (tmp_path / 'received' / source.name).read_bytes() == source.read_bytes()
+    return server
+
+
+def test_one_connection_carries_concurrent_transfers(tmp_path):
+    server = send_files(tmp_path, 6, concurrency=4)
+    assert server.connections == 1
+    # Chunk của nhiều file được ghi xen kẽ trên cùng một kết nối
+    assert 1 < server.max_overlap <= 4
+
+
+def test_peer_without_mux_sends_one_file_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(websocket_client, 'SUPPORTED_FEATURES', ('binary', 'credit', 'resume'))
+    server = send_files(tmp_path, 3)
+    assert server.connections == 1
+    assert server.max_overlap == 1
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.offload import LoopLagMonitor, OffloadExecutor
+
+
+def test_run_is_bounded_by_max_pending():
+    offload = OffloadExecutor(workers=4, executor='thread', max_pending=2)
+    release = threading.Event()
+
+    async def scenario():
+        tasks = [asyncio.create_task(offload.run(release.wait)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        busy = (offload.in_flight, offload.waiting)
+        release.set()
+        await asyncio.gather(*tasks)
+        return busy
+
+    try:
+        assert asyncio.run(scenario()) == (2, 3)
+        assert offload.stats()['completed'] == 5
+    finally:
+        offload.shutdown()
+
+
+def test_run_local_propagates_errors():
+    offload = OffloadExecutor(workers=1, executor='process')
+
+    def fail():
+        raise ValueError('boom')
+
+    try:
+        with pytest.raises(ValueError):
+            asyncio.run(offload.run_local(fail))
+        # run_local không cần process pool nên hàm cục bộ (không pickle được) vẫn chạy
+        assert asyncio.run(offload.run_local(lambda: threading.current_thread().name)).startswith('offload-worker')
+    finally:
+        offload.shutdown()
+
+
+def test_loop_lag_monitor_sees_blocking_call():
+    monitor = LoopLagMonitor(interval=0.01, warn_threshold=10)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)  # Chặn event loop
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(scenario())
+    stats = monitor.stats()
+    assert stats['samples'] >= 3
+    assert stats['max'] >= 0.15
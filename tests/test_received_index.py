@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+from app.services.received_index import InvalidCursor, ReceivedFilesIndex
+
+
+def write(directory, name, size, mtime):
+    path = directory / name
+    path.write_bytes(b'x' * size)
+    os.utime(path, ns=(mtime, mtime))
+    return path
+
+
+def all_pages(index, **options):
+    names, cursor = [], None
+    while True:
+        files, cursor = index.page(cursor=cursor, **options)
+        names += [file['name'] for file in files]
+        if cursor is None:
+            return names
+
+
+def test_keyset_pages_sorting_and_prefix(tmp_path):
+    for number in range(7):
+        write(tmp_path, f'invoice{number}.pdf', size=(number * 3) % 7, mtime=10**18 + number)
+    write(tmp_path, 'report.csv', size=100, mtime=1)
+    (tmp_path / '.report.csv.abc.part').write_bytes(b'partial')
+    index = ReceivedFilesIndex(tmp_path)
+
+    newest = [f'invoice{number}.pdf' for number in range(6, -1, -1)] + ['report.csv']
+    assert all_pages(index, limit=3) == newest
+    assert all_pages(index, descending=False, limit=2) == newest[::-1]
+    by_size = all_pages(index, sort='size', descending=False, limit=3)
+    assert by_size[-1] == 'report.csv' and by_size[0] == 'invoice0.pdf'
+    assert all_pages(index, sort='name', prefix='invoice', limit=4) == sorted(newest[:-1], reverse=True)
+    assert all_pages(index, prefix='rep', limit=1) == ['report.csv']
+
+    files, cursor = index.page(limit=2)
+    assert [file['name'] for file in files] == newest[:2] and files[0]['size'] == 4
+    # Có file mới chen vào đầu danh sách: trang sau vẫn tiếp đúng chỗ, không lặp lại file
+    write(tmp_path, 'invoice9.pdf', size=1, mtime=10**18 + 100)
+    files, _ = index.page(limit=2, cursor=cursor)
+    assert [file['name'] for file in files] == newest[2:4]
+
+    with pytest.raises(InvalidCursor):
+        index.page(cursor='not-a-cursor')
+    with pytest.raises(InvalidCursor):
+        index.page(sort='name', cursor=cursor)
+
+
+def test_directory_is_rescanned_only_when_it_changes(tmp_path):
+    def touch_directory(mtime):
+        # mtime cũ và khác nhau giữa các lần đổi (đồng hồ kernel có thể cho cùng mtime trong một tick)
+        os.utime(tmp_path, ns=(mtime, mtime))
+
+    write(tmp_path, 'a.txt', size=1, mtime=1)
+    touch_directory(10**9)
+    index = ReceivedFilesIndex(tmp_path)
+    version = index.refresh()
+    assert index.refresh() == version and index.stats()['rescans'] == 1
+
+    # File bị thay bằng đổi tên nguyên tử (như khi server lưu): inode mới nên được stat lại
+    write(tmp_path, '.b.tmp', size=5, mtime=2)
+    os.replace(tmp_path / '.b.tmp', tmp_path / 'a.txt')
+    touch_directory(2 * 10**9)
+    assert index.refresh() != version
+    assert index.page()[0] == [{'name': 'a.txt', 'size': 5, 'mtime': 2e-9}]
+
+    # Server cùng process báo file vừa lưu
+    saved = write(tmp_path, 'c.txt', size=2, mtime=3)
+    index.record(saved)
+    assert [file['name'] for file in index.page()[0]] == ['c.txt', 'a.txt']
+    (tmp_path / 'a.txt').unlink()
+    touch_directory(3 * 10**9)
+    assert [file['name'] for file in index.page()[0]] == ['c.txt']
+
+
+def test_page_without_limit_returns_every_file(tmp_path):
+    for number in range(150):
+        write(tmp_path, f'statement{number:03}.txt', size=1, mtime=10**9 + number)
+    files, cursor = ReceivedFilesIndex(tmp_path).page(limit=None)
+    assert len(files) == 150 and cursor is None
@@ -0,0 +1,145 @@
+import asyncio
+import base64
+import os
+import time
+
+import pytest
+import websockets
+
+from app.config import Config
+from app.services.key_pool import RSAKeyPool
+from app.services import transfer_journal
+from app.services.offload import OffloadExecutor
+from app.services.transfer_journal import TransferJournal
+from app.services.websocket_client import SecureFileClient
+from app.services.websocket_server import SecureFileServer
+
+
+class DroppingServer(SecureFileServer):
+    """Server ngắt kết nối sau một số chunk, giống mạng bị rớt giữa chừng"""
+
+    def __init__(self, drop_after, **kwargs):
+        super().__init__(**kwargs)
+        self.drop_after = drop_after
+        self.chunks = 0
+        self.first_index = None
+
+    async def write_chunk(self, incoming, chunk):
+        await super().write_chunk(incoming, chunk)
+        if self.first_index is None:
+            self.first_index = chunk['index']
+        self.chunks += 1
+        if self.chunks == self.drop_after:
+            websocket = next(info['websocket'] for info in self.clients.values()
+                             if any(stream.get('incoming') is incoming for stream in info['streams'].values()))
+            await websocket.close()
+
+
+def test_dropped_upload_resumes_on_restarted_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'RESUME_RETRY_DELAY', 0.05)
+    monkeypatch.setattr(Config, 'RESUME_CHECKPOINT_INTERVAL', 1)
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    options = dict(key_pool=key_pool, received_dir=tmp_path / 'received',
+                   offload=OffloadExecutor(workers=1, executor='inline'), credit_window=2)
+    first = DroppingServer(10, **options)
+    # Server "khởi động lại": instance mới, chỉ còn nhật ký trên đĩa
+    restarted = DroppingServer(0, **options)
+    servers = [first]
+    source = tmp_path / 'ledger.bin'
+    source.write_bytes(os.urandom(30 * 4096))
+
+    async def handler(websocket):
+        server = servers[-1]
+        if server is first and first.chunks >= first.drop_after:
+            servers.append(restarted)
+            server = restarted
+        await server.handle_client(websocket)
+
+    async def scenario():
+        async with websockets.serve(handler, 'localhost', 0) as ws_server:
+            port = ws_server.sockets[0].getsockname()[1]
+            client = SecureFileClient(f'ws://localhost:{port}', key_pool=key_pool)
+            client.transfer_service.crypto.chunk_size = 4096
+            return await client.send_file_secure(str(source))
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        key_pool.shutdown()
+    assert (tmp_path / 'received' / 'ledger.bin').read_bytes() == source.read_bytes()
+    # Chỉ các chunk còn thiếu được gửi lại. Client có thể đã gửi thêm chunk trước khi thấy kết nối đóng,
+    # nên server đầu ghi từ 10 chunk trở lên và server mới nhận tiếp đúng từ chunk đó
+    assert first.chunks >= 10 and restarted.first_index == first.chunks
+    assert first.chunks + restarted.chunks == 30
+    assert restarted.journal.stats() == {'partial': 0}
+
+
+def test_journal_expires_idle_transfers(tmp_path):
+    journal = TransferJournal(tmp_path, ttl=60)
+    transfer_id = 'ab' * 16
+    journal.create(transfer_id, {'filename': 'report.txt'})
+    journal.data_path(transfer_id).write_bytes(b'partial data')
+    journal.checkpoint(transfer_id, 3, 12)
+    assert journal.load(transfer_id)['next_index'] == 3
+
+    assert journal.collect_garbage() == 0
+    old = time.time() - 120
+    for path in journal.partial_dir.iterdir():
+        os.utime(path, (old, old))
+    assert journal.collect_garbage(active=[transfer_id]) == 0
+    assert journal.collect_garbage() == 1
+    assert journal.load(transfer_id) is None
+    assert list(journal.partial_dir.iterdir()) == []
+    assert journal.load('../../etc/passwd') is None
+
+
+@pytest.mark.skipif(transfer_journal.fcntl is None, reason='flock không có trên Windows')
+def test_only_one_worker_can_claim_a_transfer(tmp_path):
+    # Hai nhật ký trên cùng thư mục như hai worker của server_cluster
+    first, second = TransferJournal(tmp_path, ttl=60), TransferJournal(tmp_path, ttl=60)
+    transfer_id = 'cd' * 16
+    first.create(transfer_id, {'filename': 'ledger.csv'})
+    assert first.claim(transfer_id)
+    assert not second.claim(transfer_id)
+    first.checkpoint(transfer_id, 1, 10)
+    first.release(transfer_id)
+    assert second.claim(transfer_id)
+    second.remove(transfer_id)
+    assert list(second.partial_dir.iterdir()) == []
+
+
+def test_journal_stores_session_key_wrapped(tmp_path):
+    journal = TransferJournal(tmp_path, ttl=60, secret='journal secret')
+    transfer_id, session_key = 'ef' * 16, os.urandom(32)
+    journal.create(transfer_id, {'filename': 'payroll.csv', 'session_key': journal.wrap_key(transfer_id, session_key)})
+    journal.data_path(transfer_id).write_bytes(b'')
+    record_path = journal.partial_dir / f'{transfer_id}.json'
+    stored = record_path.read_text()
+    assert session_key.hex() not in stored and base64.b64encode(session_key).decode() not in stored
+    assert record_path.stat().st_mode & 0o777 == 0o600
+
+    wrapped = journal.load(transfer_id)['session_key']
+    assert TransferJournal(tmp_path, ttl=60, secret='journal secret').unwrap_key(transfer_id, wrapped) == session_key
+    with pytest.raises(ValueError):
+        TransferJournal(tmp_path, ttl=60, secret='another secret').unwrap_key(transfer_id, wrapped)
+    with pytest.raises(ValueError):
+        journal.unwrap_key('01' * 16, wrapped)
+
+
+def test_each_interrupted_file_is_resumed():
+    client = SecureFileClient('ws://localhost:1', key_pool=RSAKeyPool(size=0, key_size=1024, executor='thread'))
+    client.pending_transfers = {'a' * 32: {}, 'b' * 32: {}, 'c' * 32: {}}
+    # ACK của một file (mux: nhiều file cùng kết nối) chỉ bỏ mục của file đó
+    assert client._handle_transfer_response({'type': 'ack'}, 'a' * 32)
+    assert list(client.pending_transfers) == ['b' * 32, 'c' * 32]
+
+    resumed = []
+
+    async def resume_transfer(transfer_id):
+        resumed.append(transfer_id)
+        del client.pending_transfers[transfer_id]
+        return True
+
+    client.resume_transfer = resume_transfer
+    assert asyncio.run(client.resume_file())
+    assert resumed == ['b' * 32, 'c' * 32] and client.pending_transfers == {}
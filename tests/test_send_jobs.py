@@ -0,0 +1,64 @@
+import os
+import threading
+
+import pytest
+
+from app.services.client_pool import SecureClientPool
+from app.services.key_pool import RSAKeyPool
+from app.services.offload import OffloadExecutor
+from app.services.send_jobs import JOB_FAILED, JOB_SUCCEEDED, JobQueueFull, SendJob, SendJobQueue
+from app.services.websocket_server import SecureFileServer
+from tests.test_client_pool import run_server
+
+
+def test_jobs_report_progress_and_notify_when_done(tmp_path):
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    server = SecureFileServer(key_pool=key_pool, received_dir=tmp_path / 'received',
+                              offload=OffloadExecutor(workers=1, executor='inline'))
+    loop, port, stop_server = run_server(server)
+    pool = SecureClientPool(f'ws://localhost:{port}', size=2, key_pool=key_pool)
+    finished = []
+    all_done = threading.Event()
+
+    def on_finish(job):
+        finished.append(job)
+        if len(finished) == 3:
+            all_done.set()
+
+    queue = SendJobQueue(pool, workers=2, max_queued=8, on_finish=on_finish)
+    sources = []
+    for index in range(2):
+        source = tmp_path / f'ledger{index}.bin'
+        source.write_bytes(os.urandom(3 * 4096 + index))
+        sources.append(source)
+
+    try:
+        jobs = [queue.submit(str(source), notify_room='sid-1') for source in sources]
+        jobs.append(queue.submit(str(tmp_path / 'missing.bin')))
+        assert all_done.wait(30)
+    finally:
+        queue.close()
+        pool.close()
+        stop_server()
+        key_pool.shutdown()
+
+    assert queue.get(jobs[0].id) is jobs[0]
+    for job, source in zip(jobs, sources):
+        state = job.to_dict()
+        assert state['status'] == JOB_SUCCEEDED and state['progress'] == 1.0
+        assert state['chunks_total'] and state['chunks_sent'] == state['chunks_total']
+        assert state['started'] >= state['created'] and state['finished'] >= state['started']
+        assert (tmp_path / 'received' / source.name).read_bytes() == source.read_bytes()
+    assert jobs[2].status == JOB_FAILED and jobs[2].error
+    assert queue.stats()['succeeded'] == 2 and queue.stats()['failed'] == 1
+
+
+def test_full_queue_refuses_new_jobs(tmp_path):
+    queue = SendJobQueue(SecureClientPool('ws://localhost:1', size=1), workers=1, max_queued=1)
+    # Job đang chờ (worker chưa nhận) chiếm chỗ duy nhất trong hàng đợi
+    waiting = SendJob(str(tmp_path / 'a.bin'))
+    queue._jobs[waiting.id] = waiting
+    with pytest.raises(JobQueueFull):
+        queue.submit(str(tmp_path / 'b.bin'))
+    assert queue.stats()['queued'] == 1
+    assert queue.get('unknown') is None
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import socket
+import time
+
+import pytest
+
+from app.services.key_pool import RSAKeyPool
+from app.services.metrics import TRANSFERS
+from app.services.server_cluster import ServerCluster, reuse_port_supported
+from app.services.websocket_client import SecureFileClient
+
+pytestmark = pytest.mark.skipif(not reuse_port_supported(), reason='cần SO_REUSEPORT')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f'port {port} chưa mở')
+
+
+def test_workers_share_port_and_metrics_are_merged(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    port = free_port()
+    cluster = ServerCluster(workers=2, port=port, shutdown_grace=5)
+    key_pool = RSAKeyPool(size=0, key_size=1024, executor='thread')
+    sources = []
+    for index in range(2):
+        source = tmp_path / f'report{index}.bin'
+        source.write_bytes(os.urandom(64 * 1024))
+        sources.append(source)
+
+    async def send_all():
+        clients = [SecureFileClient(f'ws://localhost:{port}', key_pool=key_pool) for _ in sources]
+        return await asyncio.gather(*(
+            client.send_file_secure(str(source)) for client, source in zip(clients, sources)
+        ))
+
+    # Process chạy test cũng có số liệu (từ các test khác) và được gộp cùng các worker
+    saved_here = TRANSFERS.value(role='server', status='saved')
+    cluster.start()
+    try:
+        wait_until_listening(port)
+        assert asyncio.run(send_all()) == [True] * len(sources)
+        families = {family['name']: family for family in cluster.collect()}
+        transfers = families['securefile_transfers_total']['samples']
+        assert transfers[('server', 'saved')] == saved_here + len(sources)
+        assert families['securefile_cluster_workers']['samples'][()] == 2
+        assert '# TYPE securefile_transfers_total counter' in cluster.render()
+    finally:
+        cluster.stop()
+        key_pool.shutdown()
+    assert cluster.alive() == 0
+    for source in sources:
+        assert (tmp_path / 'received_files' / source.name).read_bytes() == source.read_bytes()
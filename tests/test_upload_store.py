@@ -0,0 +1,79 @@
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+
+from app.services.upload_store import (UploadConflict, UploadNotFound, UploadStore, UploadTooLarge,
+                                       parse_metadata)
+
+
+class DroppedStream(io.BytesIO):
+    """Stream của request bị client ngắt sau khi gửi một phần"""
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data:
+            raise ConnectionResetError('client ngắt kết nối')
+        return data
+
+
+def test_resumable_upload_hashes_on_the_fly_and_renames_atomically(tmp_path):
+    store = UploadStore(tmp_path / 'uploads', max_size=1 << 20, ttl=3600)
+    content = os.urandom(300000)
+    upload = store.create(len(content), '../report.pdf')
+    assert upload['filename'] == 'report.pdf' and upload['offset'] == 0
+
+    # Request đầu bị ngắt giữa chừng: phần đã nhận được giữ, client hỏi offset rồi gửi tiếp
+    with pytest.raises(ConnectionResetError):
+        store.write(upload['id'], 0, DroppedStream(content[:120000]))
+    offset = store.get(upload['id'])['offset']
+    assert offset == 120000
+    with pytest.raises(UploadConflict):
+        store.write(upload['id'], 0, io.BytesIO(content))
+
+    # Process mới (vd: server khởi động lại) hash lại phần đã nhận từ file
+    store = UploadStore(tmp_path / 'uploads', max_size=1 << 20, ttl=3600)
+    done = store.write(upload['id'], offset, io.BytesIO(content[offset:]))
+    assert done['offset'] == len(content)
+    assert done['sha512'] == hashlib.sha512(content).hexdigest()
+    assert open(done['path'], 'rb').read() == content
+    assert store.digest_of(done['path']) == done['sha512']
+    with pytest.raises(UploadConflict):
+        store.write(upload['id'], len(content), io.BytesIO(b'x'))
+
+    # Upload trùng tên không ghi đè nhau; file bị sửa sau upload thì digest không còn dùng được
+    other = store.create(3, 'report.pdf')
+    other = store.write(other['id'], 0, io.BytesIO(b'abc'))
+    assert other['path'] != done['path'] and open(done['path'], 'rb').read() == content
+    with open(other['path'], 'ab') as f:
+        f.write(b'd')
+    assert store.digest_of(other['path']) is None
+
+
+def test_size_limits(tmp_path):
+    store = UploadStore(tmp_path, max_size=10, ttl=3600)
+    with pytest.raises(UploadTooLarge):
+        store.create(11, 'big.bin')
+    upload = store.create(4, 'small.bin')
+    with pytest.raises(UploadTooLarge):
+        store.write(upload['id'], 0, io.BytesIO(b'12345'))
+    assert store.get(upload['id'])['offset'] == 0
+    assert store.write(upload['id'], 0, io.BytesIO(b'1234'))['sha512'] == hashlib.sha512(b'1234').hexdigest()
+
+
+def test_parse_metadata():
+    encoded = base64.b64encode('báo cáo.pdf'.encode()).decode()
+    assert parse_metadata(f'filename {encoded},is_confidential') == {'filename': 'báo cáo.pdf', 'is_confidential': ''}
+
+
+def test_garbage_collection_skips_files_that_are_not_uploads(tmp_path):
+    store = UploadStore(tmp_path, max_size=10, ttl=0)
+    stale = store.create(4, 'stale.bin')
+    (store.state_dir / 'notes.json').write_text('{}')
+    assert store.collect_garbage() == 1
+    assert (store.state_dir / 'notes.json').exists()
+    with pytest.raises(UploadNotFound):
+        store.get(stale['id'])
+    store.create(4, 'fresh.bin')
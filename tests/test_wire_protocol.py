@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from app.services.wire_protocol import (
+    FrameError, decode_chunk, decode_frame, encode_chunk_message, encode_frame, max_chunk_payload,
+    negotiate_features
+)
+
+CHUNK = {'index': 3, 'cipher': b'\x00\xffciphertext', 'tag': b't' * 16, 'hash': 'ab', 'codec': 'zlib', 'final': True}
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_chunk_message_round_trip(binary):
+    message = encode_chunk_message(CHUNK, binary)
+    if binary:
+        assert isinstance(message, bytes) and CHUNK['cipher'] in message
+        data, payload = decode_frame(message)
+    else:
+        data, payload = json.loads(message), None
+    assert data['type'] == 'file_chunk'
+    chunk = decode_chunk(data['chunk'], payload)
+    assert bytes(chunk['cipher']) == CHUNK['cipher']
+    assert {k: v for k, v in chunk.items() if k != 'cipher'} == {k: v for k, v in CHUNK.items() if k != 'cipher'}
+
+
+def test_malformed_frames_rejected():
+    frame = encode_frame({'type': 'x'}, b'payload')
+    with pytest.raises(FrameError):
+        decode_frame(b'XX' + frame[2:])
+    with pytest.raises(FrameError):
+        decode_frame(frame[:9])
+
+
+def test_feature_negotiation_falls_back_to_json():
+    assert negotiate_features(['binary', 'unknown']) == ['binary']
+    assert negotiate_features(None) == []
+
+
+@pytest.mark.parametrize('binary', [True, False])
+def test_largest_chunk_fits_message_limit(binary):
+    limit = 64 * 1024
+    size = max_chunk_payload(limit, binary)
+    chunk = dict(CHUNK, index=2 ** 40, cipher=b'\xff' * size, hash='f' * 128, codec='lzma')
+    assert len(encode_chunk_message(chunk, binary)) <= limit